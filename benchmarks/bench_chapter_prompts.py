@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+章节提示词组装耗时基准测试
+
+构造一部人物和章节都很多的小说，测量为全部章节组装提示词的CPU时间：
+逐章重新拼接人物列表和查找前后章节（旧实现），与复用缓存的小说上下文
+（普通 dict 数据、NovelDataManager 只读快照两种输入）对比。不调用模型。用法::
+
+    python benchmarks/bench_chapter_prompts.py --characters 300 --volumes 10 --chapters 100
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generators.chapter_generator import ChapterGenerator
+from utils.data_manager import NovelDataManager
+from utils.prompt_manager import StructuredPrompt
+
+
+def _legacy_prompt(generator, novel_data, volume_index, chapter_index):
+    """旧实现：每章都重新拼接人物列表、查找前后章节并渲染完整提示词"""
+    characters_info = ""
+    for char in novel_data.get("characters", []):
+        characters_info += f"- {char.get('name', '')}: {char.get('identity', '')}, {char.get('personality', '')}, {char.get('background', '')}\n"
+    chapters = novel_data["volumes"][volume_index]["chapters"]
+    params = {
+        "title": novel_data.get("title", "未命名小说"),
+        "theme": novel_data.get("theme", ""),
+        "worldbuilding": novel_data.get("worldbuilding", ""),
+        "characters_info": characters_info,
+        "volume_title": novel_data["volumes"][volume_index].get("title", ""),
+        "volume_description": novel_data["volumes"][volume_index].get("description", ""),
+        "chapter_title": chapters[chapter_index].get("title", ""),
+        "chapter_summary": chapters[chapter_index].get("summary", ""),
+        "previous_chapter_summary": chapters[chapter_index - 1].get("summary", "") if chapter_index > 0 else "",
+        "next_chapter_summary": chapters[chapter_index + 1].get("summary", "") if chapter_index < len(chapters) - 1 else "",
+    }
+    return generator._create_chapter_prompt_from_params(params)
+
+
+def _make_novel(characters, volumes, chapters):
+    return {
+        "title": "基准小说",
+        "theme": "成长与救赎",
+        "worldbuilding": "一个灵气复苏的近未来都市。" * 20,
+        "characters": [
+            {"name": f"角色{i}", "identity": "修行者", "personality": "沉稳内敛，外冷内热" * 3,
+             "background": "出身没落世家，少年时经历变故" * 3}
+            for i in range(characters)
+        ],
+        "volumes": [
+            {"title": f"第{v + 1}卷", "description": "本卷简介" * 10,
+             "chapters": [{"title": f"第{c + 1}章", "summary": f"第{v + 1}卷第{c + 1}章的摘要" * 5}
+                          for c in range(chapters)]}
+            for v in range(volumes)
+        ],
+    }
+
+
+def _run(label, build_prompt, novel_data):
+    count = 0
+    start = time.perf_counter()
+    for volume_index, volume in enumerate(novel_data["volumes"]):
+        for chapter_index in range(len(volume["chapters"])):
+            prompt = build_prompt(novel_data, volume_index, chapter_index)
+            assert isinstance(prompt, StructuredPrompt)
+            count += 1
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {count} prompts  {elapsed * 1000:8.1f} ms  ({elapsed / count * 1e6:7.1f} us/prompt)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="章节提示词组装基准")
+    parser.add_argument("--characters", type=int, default=300)
+    parser.add_argument("--volumes", type=int, default=10)
+    parser.add_argument("--chapters", type=int, default=100, help="每卷章节数")
+    args = parser.parse_args()
+
+    novel_data = _make_novel(args.characters, args.volumes, args.chapters)
+
+    legacy = ChapterGenerator(None, None, None)
+    _run("legacy (rebuild)", lambda *a: _legacy_prompt(legacy, *a), novel_data)
+
+    generator = ChapterGenerator(None, None, None)
+    _run("context (dict)", generator._create_chapter_prompt, novel_data)
+
+    manager = NovelDataManager()
+    manager.set_outline(novel_data)
+    snapshot = manager.get_outline()
+    generator = ChapterGenerator(None, None, None)
+    _run("context (snapshot)", generator._create_chapter_prompt, snapshot)
+    print(f"context builds/reuses: {generator.context_cache.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
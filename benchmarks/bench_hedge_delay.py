@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对冲延迟稳定性基准测试
+
+主模型的首字延迟呈双峰分布（大部分请求很快，少数请求很慢），备用模型稳定较快。
+依次发出请求，按窗口报告自适应对冲延迟和对冲触发率。主模型落败时也记录其首字延迟的下界，
+对冲延迟应稳定在快速一峰的 p95 附近，而不是随每次对冲逐步下降、最终每个请求都对冲。
+不联网，延迟按 --scale 缩放。用法::
+
+    python benchmarks/bench_hedge_delay.py --requests 2000 --slow-fraction 0.03
+
+对冲延迟明显下降或触发率远高于慢请求比例时以非零状态退出。
+"""
+
+import os
+import sys
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.ai_model import AIModel
+from models.hedged_model import HedgedModel
+from utils.config_manager import ConfigManager
+
+
+class _SimulatedModel(AIModel):
+    """按给定的首字延迟分布产出一个文本块的模型"""
+
+    def __init__(self, config_manager, first_chunk_delay):
+        super().__init__(config_manager)
+        self.first_chunk_delay = first_chunk_delay
+
+    async def _generate(self, prompt, callback=None):
+        raise NotImplementedError
+
+    async def _generate_stream(self, prompt, callback=None):
+        await asyncio.sleep(self.first_chunk_delay())
+        yield "正文"
+
+
+async def _run(args) -> bool:
+    rng = random.Random(args.seed)
+    config_manager = ConfigManager()
+
+    def primary_delay():
+        if rng.random() < args.slow_fraction:
+            return args.slow * args.scale
+        return rng.uniform(0.5, 1.5) * args.fast * args.scale
+
+    primary = _SimulatedModel(config_manager, primary_delay)
+    secondary = _SimulatedModel(config_manager, lambda: args.secondary * args.scale)
+    model = HedgedModel(primary, secondary, initial_delay=args.slow * args.scale, min_samples=20, window=200)
+
+    delays = []
+    windows = []
+    fired = 0
+    async def one_request():
+        async for _ in model.generate_stream("提示词"):
+            pass
+
+    for i in range(args.concurrency, args.requests + 1, args.concurrency):
+        await asyncio.gather(*(one_request() for _ in range(args.concurrency)))
+        if i % args.report_every == 0:
+            stats = model.get_stats()
+            rate = (stats["hedges_fired"] - fired) / args.report_every
+            fired = stats["hedges_fired"]
+            delays.append(stats["hedge_delay"] / args.scale)
+            windows.append(rate)
+            print(f"requests {i:5d}  hedge_delay {stats['hedge_delay'] / args.scale:7.1f} ms  "
+                  f"hedge rate {rate:6.1%}")
+
+    # 跳过第一个窗口（样本不足时使用 initial_delay）
+    settled = delays[1:]
+    stable = min(settled) >= 0.8 * settled[0]
+    max_rate = max(windows[1:])
+    bounded = max_rate <= args.slow_fraction + (1 - model.percentile) + 0.05
+    print(f"delay stable: {stable}  max hedge rate {max_rate:.1%} bounded: {bounded}")
+    return stable and bounded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对冲延迟稳定性基准")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--slow-fraction", type=float, default=0.03, help="主模型慢请求的比例")
+    parser.add_argument("--fast", type=float, default=100.0, help="主模型快请求的首字延迟（毫秒）")
+    parser.add_argument("--slow", type=float, default=2000.0, help="主模型慢请求的首字延迟（毫秒）")
+    parser.add_argument("--secondary", type=float, default=2.0, help="备用模型的首字延迟（毫秒）")
+    parser.add_argument("--scale", type=float, default=0.001, help="把毫秒换算为实际等待秒数的系数")
+    parser.add_argument("--concurrency", type=int, default=20, help="同时发出的请求数")
+    parser.add_argument("--report-every", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(_run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
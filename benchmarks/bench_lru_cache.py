@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+内存缓存读写吞吐量基准测试
+
+在不同容量下测量 LRUCache 满载后的 set（每次都触发淘汰）和 get 的单次耗时，
+用于确认耗时不随条目数增长。另外给出旧实现（淘汰时 min() 扫描全部条目）的对照。
+用法::
+
+    python benchmarks/bench_lru_cache.py --sizes 100 1000 10000 --ops 20000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.lru_cache import LRUCache
+
+
+class _LegacyCache:
+    """旧的 data_manager.Cache：淘汰时按最后访问时间扫描全部条目"""
+
+    def __init__(self, max_size):
+        self.cache = {}
+        self.max_size = max_size
+
+    def get(self, key):
+        item = self.cache.get(key)
+        if item is None:
+            return None
+        if time.time() > item[1]:
+            del self.cache[key]
+            return None
+        item[2] = time.time()
+        return item[0]
+
+    def set(self, key, value):
+        if len(self.cache) >= self.max_size and key not in self.cache:
+            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k][2])
+            del self.cache[oldest_key]
+        now = time.time()
+        self.cache[key] = [value, now + 3600, now]
+
+
+def _measure(cache, size, ops):
+    value = "章" * 2000
+    for i in range(size):
+        cache.set(f"k{i}", value)
+
+    start = time.perf_counter()
+    for i in range(size, size + ops):
+        cache.set(f"k{i}", value)
+    set_us = (time.perf_counter() - start) / ops * 1e6
+
+    start = time.perf_counter()
+    for i in range(ops):
+        cache.get(f"k{size + ops - 1 - (i % size)}")
+    get_us = (time.perf_counter() - start) / ops * 1e6
+    return set_us, get_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内存缓存基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--ops", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'lru set':>10} {'lru get':>10} {'legacy set':>12} {'legacy get':>12}  (us/op)")
+    for size in args.sizes:
+        lru_set, lru_get = _measure(LRUCache(max_size=size, default_ttl=3600), size, args.ops)
+        legacy_set, legacy_get = _measure(_LegacyCache(size), size, args.ops)
+        print(f"{size:>8} {lru_set:>10.2f} {lru_get:>10.2f} {legacy_set:>12.2f} {legacy_get:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ModelScope 流式读取的逐块开销基准测试
+
+对比两种读取方式在多路并发流下的逐块开销：
+
+* before: 旧实现，每个块通过 ``loop.run_in_executor(None, next, iterator)`` 在默认线程池中取出；
+* after:  新实现，``ModelScopeModel._iterate_stream`` 直接在事件循环上解析SSE字节行。
+
+不访问网络，数据为内存中预先构造的SSE行。用法::
+
+    python benchmarks/bench_modelscope_stream.py --streams 16 --chunks 2000
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.modelscope_model import ModelScopeModel
+
+
+def _make_chunks(count):
+    """构造 count 个OpenAI兼容的增量块（Python对象形式，对应旧SDK迭代器的产出）"""
+    return [{"choices": [{"delta": {"content": "字"}}]} for _ in range(count)]
+
+
+def _make_sse_lines(count):
+    """构造与 _make_chunks 等价的SSE事件（每个事件一个字节块）"""
+    line = ("data: " + json.dumps({"choices": [{"delta": {"content": "字"}}]}) + "\n\n").encode("utf-8")
+    return [line] * count + [b"data: [DONE]\n\n"]
+
+
+class _AsyncLines:
+    """以异步迭代方式逐块产出字节，模拟 aiohttp 的 response.content.iter_any()"""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._lines)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+async def _consume_thread_hop(chunk_count):
+    loop = asyncio.get_running_loop()
+    iterator = iter(_make_chunks(chunk_count))
+    received = 0
+    while True:
+        # 旧实现直接 run_in_executor(next)；StopIteration 无法穿过 Future，这里用哨兵值代替
+        chunk = await loop.run_in_executor(None, next, iterator, None)
+        if chunk is None:
+            break
+        if chunk["choices"][0]["delta"].get("content"):
+            received += 1
+    return received
+
+
+async def _consume_native(model, chunk_count):
+    received = 0
+    async for _ in model._iterate_stream(_AsyncLines(_make_sse_lines(chunk_count))):
+        received += 1
+    return received
+
+
+async def _run(label, factory, streams, chunks):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(factory() for _ in range(streams)))
+    elapsed = time.perf_counter() - start
+    total = sum(results)
+    print(f"{label:<8} streams={streams:<3} chunks={total:<8} "
+          f"total={elapsed * 1000:9.1f} ms  per-chunk={elapsed / total * 1e6:8.2f} us")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="ModelScope 流式逐块开销基准")
+    parser.add_argument("--streams", type=int, default=16, help="并发流数量")
+    parser.add_argument("--chunks", type=int, default=2000, help="每个流的块数")
+    args = parser.parse_args()
+
+    model = ModelScopeModel(config={"api_key": "benchmark"})
+    await _run("before", lambda: _consume_thread_hop(args.chunks), args.streams, args.chunks)
+    await _run("after", lambda: _consume_native(model, args.chunks), args.streams, args.chunks)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
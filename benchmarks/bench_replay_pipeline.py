@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+基于录制文件的大纲、章节和完整流程基准测试
+
+先在联网环境中录制一次::
+
+    generator.start_recording("run.jsonl")
+    outline = await generator.generate_outline(**outline_params)   # 大纲
+    ...  # 按该大纲正常流式生成各章节
+
+之后在任何机器上离线、可重复地回放（提示词构建、大纲解析与合并、流式转发等）::
+
+    # 只回放章节生成（大纲来自 --novel）
+    python benchmarks/bench_replay_pipeline.py --cassette run.jsonl --novel novel.json --time-scale 0
+    # 只回放大纲生成（--outline-params 为 generate_outline 的关键字参数）
+    python benchmarks/bench_replay_pipeline.py --mode outline --cassette run.jsonl --outline-params params.json
+    # 完整流程：先生成大纲，再按生成的大纲逐章生成
+    python benchmarks/bench_replay_pipeline.py --mode pipeline --cassette run.jsonl --outline-params params.json
+
+``--time-scale 1`` 按录制时的块间间隔回放（测量端到端耗时），``0`` 不等待（只测本地开销）。
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from novel_generator import NovelGenerator
+
+
+async def _run_outline(generator, outline_params):
+    start = time.perf_counter()
+    outline = await generator.generate_outline(**outline_params)
+    elapsed = time.perf_counter() - start
+    if not isinstance(outline, dict) or "error" in outline:
+        raise SystemExit(f"大纲回放失败（录制文件中没有匹配的请求或响应无法解析）: {outline}")
+    volumes = outline.get("volumes", []) or []
+    chapters = sum(len(v.get("chapters", []) or []) for v in volumes if isinstance(v, dict))
+    print(f"outline: volumes={len(volumes)} chapters={chapters} total={elapsed * 1000:.1f} ms")
+    return outline, elapsed
+
+
+async def _run_chapters(generator, novel_data):
+    chapters = 0
+    chunks = 0
+    chars = 0
+    start = time.perf_counter()
+    for volume_index, volume in enumerate(novel_data.get("volumes", [])):
+        for chapter_index, _ in enumerate(volume.get("chapters", [])):
+            try:
+                async for chunk in generator.generate_chapter_stream(novel_data, volume_index, chapter_index):
+                    chunks += 1
+                    chars += len(chunk)
+            except ValueError as e:
+                print(f"跳过 第{volume_index + 1}卷 第{chapter_index + 1}章: {e}")
+                continue
+            chapters += 1
+    elapsed = time.perf_counter() - start
+    print(f"chapters={chapters} chunks={chunks} chars={chars} total={elapsed * 1000:.1f} ms "
+          f"({chunks / elapsed if elapsed else 0:,.0f} chunks/s)")
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="录制文件回放基准")
+    parser.add_argument("--mode", choices=("chapters", "outline", "pipeline"), default="chapters",
+                        help="chapters：章节生成；outline：大纲生成；pipeline：大纲 + 全部章节")
+    parser.add_argument("--cassette", required=True, help="录制文件路径")
+    parser.add_argument("--novel", help="小说数据（含大纲）的JSON文件，chapters 模式使用")
+    parser.add_argument("--outline-params", help="generate_outline 关键字参数的JSON文件，outline / pipeline 模式使用")
+    parser.add_argument("--time-scale", type=float, default=0.0, help="块间间隔的缩放比例")
+    parser.add_argument("--coalesce-chars", type=int, default=0, help="大于0时启用流式合并")
+    args = parser.parse_args()
+
+    if args.mode == "chapters" and not args.novel:
+        parser.error("chapters 模式需要 --novel")
+    if args.mode != "chapters" and not args.outline_params:
+        parser.error(f"{args.mode} 模式需要 --outline-params")
+
+    novel_data = None
+    outline_params = None
+    if args.novel:
+        with open(args.novel, "r", encoding="utf-8") as f:
+            novel_data = json.load(f)
+    if args.outline_params:
+        with open(args.outline_params, "r", encoding="utf-8") as f:
+            outline_params = json.load(f)
+
+    async with NovelGenerator({}) as generator:
+        generator.select_model(f"replay:{args.cassette}", time_scale=args.time_scale)
+        if args.coalesce_chars > 0:
+            generator.enable_stream_coalescing(max_chars=args.coalesce_chars)
+
+        if args.mode == "chapters":
+            await _run_chapters(generator, novel_data)
+        elif args.mode == "outline":
+            await _run_outline(generator, outline_params)
+        else:
+            outline, outline_elapsed = await _run_outline(generator, outline_params)
+            chapters_elapsed = await _run_chapters(generator, outline)
+            print(f"pipeline total={(outline_elapsed + chapters_elapsed) * 1000:.1f} ms")
+
+    if args.coalesce_chars > 0:
+        print(f"coalescing: {generator.get_stream_coalescing_stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+各模型适配器流式解析吞吐量基准测试（块/秒）
+
+为每个基于HTTP的适配器构造与真实服务格式一致的流式响应体，按固定大小切块
+写入真实的 aiohttp.StreamReader（块边界会落在行中间、多字节UTF-8字符中间），
+通过替换 ``_http_session`` 直接交给适配器的 ``_generate_stream``，
+测量从原始字节到文本块的完整解析开销。
+另外给出旧实现（逐行 decode/strip/json.loads）在相同数据上的吞吐量作为对照。
+
+Gemini 通过 google-genai SDK 解析流，不经过本模块，因此不在测试范围内。
+不访问网络。用法::
+
+    python benchmarks/bench_stream_framing.py --chunks 20000 --read-size 4096
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from contextlib import asynccontextmanager
+
+import aiohttp
+from aiohttp.base_protocol import BaseProtocol
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.gpt_model import GPTModel
+from models.claude_model import ClaudeModel
+from models.ollama_model import OllamaModel
+from models.siliconflow_model import SiliconFlowModel
+from models.custom_openai_model import CustomOpenAIModel
+from models.modelscope_model import ModelScopeModel
+from utils import stream_framing
+
+
+def _openai_body(count):
+    event = "data: " + json.dumps({"choices": [{"delta": {"content": "天地玄黄"}}]}, ensure_ascii=False) + "\n\n"
+    return (event * count + "data: [DONE]\n\n").encode("utf-8")
+
+
+def _claude_body(count):
+    event = ("event: content_block_delta\n" +
+             "data: " + json.dumps({"type": "content_block_delta", "index": 0,
+                                    "delta": {"type": "text_delta", "text": "天地玄黄"}}, ensure_ascii=False) + "\n\n")
+    return (event * count + 'event: message_stop\ndata: {"type":"message_stop"}\n\n').encode("utf-8")
+
+
+def _ollama_body(count):
+    line = json.dumps({"model": "llama3", "message": {"role": "assistant", "content": "天地玄黄"},
+                       "done": False}, ensure_ascii=False) + "\n"
+    return (line * count + json.dumps({"done": True}) + "\n").encode("utf-8")
+
+
+class _NullTransport:
+    """StreamReader 只在缓冲区过满时暂停/恢复读取，这里什么都不做"""
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+    def is_closing(self):
+        return False
+
+
+# 写入任务的强引用，避免被垃圾回收
+_feeders = set()
+
+
+def _make_content(body, read_size):
+    """构造真实的 aiohttp.StreamReader，由后台任务按 read_size 分块写入，模拟网络读"""
+    loop = asyncio.get_running_loop()
+    protocol = BaseProtocol(loop)
+    protocol.transport = _NullTransport()
+    reader = aiohttp.StreamReader(protocol, 2 ** 16, loop=loop)
+
+    async def feed():
+        for start in range(0, len(body), read_size):
+            reader.feed_data(body[start:start + read_size])
+            await asyncio.sleep(0)
+        reader.feed_eof()
+
+    task = loop.create_task(feed())
+    _feeders.add(task)
+    task.add_done_callback(_feeders.discard)
+    return reader
+
+
+class _FakeResponse:
+    status = 200
+
+    def __init__(self, body, read_size):
+        self.content = _make_content(body, read_size)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _FakeSession:
+    def __init__(self, body, read_size):
+        self._body = body
+        self._read_size = read_size
+
+    def post(self, *args, **kwargs):
+        return _FakeResponse(self._body, self._read_size)
+
+
+def _install_fake_session(model, body, read_size):
+    @asynccontextmanager
+    async def fake_http_session():
+        yield _FakeSession(body, read_size)
+    model._http_session = fake_http_session
+
+
+async def _legacy_openai_parse(content):
+    """旧实现：按行迭代 response.content，逐行 decode/strip 后 json.loads"""
+    async for line in content:
+        line = line.decode('utf-8').strip()
+        if line == "data: [DONE]":
+            break
+        if line.startswith("data: "):
+            data = json.loads(line[6:])
+            content_piece = data.get("choices", [{}])[0].get("delta", {}).get("content", "")
+            if content_piece:
+                yield content_piece
+
+
+async def _measure(stream_factory, repeat):
+    start = time.perf_counter()
+    received = 0
+    for _ in range(repeat):
+        async for _ in stream_factory():
+            received += 1
+    return received, time.perf_counter() - start
+
+
+def _report(label, received, elapsed):
+    print(f"{label:<22} chunks={received:<8} total={elapsed * 1000:9.1f} ms  "
+          f"{received / elapsed:12,.0f} chunks/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="适配器流式解析吞吐量基准")
+    parser.add_argument("--chunks", type=int, default=20000, help="每个响应包含的文本块数")
+    parser.add_argument("--read-size", type=int, default=4096, help="模拟网络读块的大小（字节）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个适配器重复次数")
+    parser.add_argument("--stdlib-json", action="store_true", help="强制使用标准库 json 解码")
+    args = parser.parse_args()
+
+    if args.stdlib_json:
+        stream_framing.set_json_loads(stream_framing._stdlib_loads)
+    json_impl = "json (stdlib)" if args.stdlib_json or stream_framing.orjson is None else "orjson"
+    print(f"JSON decoder: {json_impl}, read size: {args.read_size} bytes")
+
+    openai_body = _openai_body(args.chunks)
+    adapters = [
+        ("GPTModel", GPTModel(config={"api_key": "benchmark"}), openai_body),
+        ("ClaudeModel", ClaudeModel(config={"api_key": "benchmark"}), _claude_body(args.chunks)),
+        ("OllamaModel", OllamaModel(config={"model_name": "llama3"}), _ollama_body(args.chunks)),
+        ("SiliconFlowModel", SiliconFlowModel(config={"api_key": "benchmark"}), openai_body),
+        ("CustomOpenAIModel", CustomOpenAIModel(config={"api_key": "benchmark", "model_name": "m",
+                                                        "api_url": "http://localhost/v1/chat/completions"}),
+         openai_body),
+        ("ModelScopeModel", ModelScopeModel(config={"api_key": "benchmark"}), openai_body),
+    ]
+
+    received, elapsed = await _measure(
+        lambda: _legacy_openai_parse(_make_content(openai_body, args.read_size)), args.repeat)
+    _report("legacy line parser", received, elapsed)
+
+    for label, model, body in adapters:
+        _install_fake_session(model, body, args.read_size)
+        received, elapsed = await _measure(lambda: model._generate_stream("benchmark"), args.repeat)
+        _report(label, received, elapsed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
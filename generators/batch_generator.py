@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+批量章节生成模块
+
+按选择范围（指定卷、起止章节、明确的章节列表、只生成缺失章节）整理出待生成章节，
+再按连贯性策略在章节之间建立依赖（需要前一章正文的章节等前一章完成后才开始），
+由依赖图调度器并发生成：同时进行的章节数不超过 concurrency，彼此独立的章节（如不同的卷）
+并行推进。每章完成后立即写入 NovelDataManager，并通过进度回调报告事件。
+"""
+
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.dag_scheduler import DagScheduler
+from utils.draft_sink import DraftResult
+
+ChapterKey = Tuple[int, int]
+
+# 连贯性策略 -> 说明
+CONTINUITY_POLICIES = {
+    "independent": "各章只依赖大纲摘要，全部章节可以并行",
+    "within_volume": "每章依赖同一卷前一章的正文，卷内按顺序生成，各卷之间并行",
+    "sequential": "每章依赖前一章（含上一卷最后一章）的正文，全书按顺序生成",
+}
+
+
+def select_chapters(novel_data: Dict, volumes: Optional[Iterable[int]] = None,
+                    start: Optional[ChapterKey] = None, end: Optional[ChapterKey] = None,
+                    chapters: Optional[Iterable[ChapterKey]] = None, only_missing: bool = False,
+                    has_content: Optional[Callable[[int, int], bool]] = None) -> List[ChapterKey]:
+    """
+    根据选择条件列出待生成的章节（索引均从0开始，与 generate_chapter 一致）
+
+    Args:
+        novel_data: 小说数据（包含大纲）
+        volumes: 只选择这些卷，None 表示全部卷
+        start: 起始章节 (卷索引, 章节索引)，包含在内
+        end: 结束章节 (卷索引, 章节索引)，包含在内
+        chapters: 明确指定的章节列表；提供时忽略 volumes / start / end
+        only_missing: 是否跳过已有正文的章节
+        has_content: 判断章节是否已有正文的函数，only_missing 为 True 时使用
+
+    Returns:
+        按卷、章顺序排列的 (卷索引, 章节索引) 列表
+    """
+    outline_volumes = novel_data.get("volumes", []) or []
+    valid = set()
+    for volume_index, volume in enumerate(outline_volumes):
+        volume_chapters = volume.get("chapters", []) if isinstance(volume, dict) else []
+        for chapter_index in range(len(volume_chapters or [])):
+            valid.add((volume_index, chapter_index))
+
+    if chapters is not None:
+        selected = set()
+        for key in chapters:
+            key = (int(key[0]), int(key[1]))
+            if key in valid:
+                selected.add(key)
+            else:
+                print(f"跳过不存在的章节: 卷 {key[0]}, 章 {key[1]}")
+    else:
+        volume_filter = set(volumes) if volumes is not None else None
+        selected = {key for key in valid
+                    if (volume_filter is None or key[0] in volume_filter)
+                    and (start is None or key >= tuple(start))
+                    and (end is None or key <= tuple(end))}
+
+    if only_missing and has_content is not None:
+        selected = {key for key in selected if not has_content(*key)}
+    return sorted(selected)
+
+
+def build_dependencies(novel_data: Dict, targets: Iterable[ChapterKey],
+                       continuity: str = "independent") -> Dict[ChapterKey, List[ChapterKey]]:
+    """
+    按连贯性策略为待生成章节建立依赖
+
+    Args:
+        novel_data: 小说数据（包含大纲）
+        targets: 待生成的 (卷索引, 章节索引) 列表
+        continuity: 连贯性策略，见 CONTINUITY_POLICIES
+
+    Returns:
+        章节 -> 它依赖的章节列表（前一章不在 targets 中时也会列出，调度时视为已完成）
+
+    Raises:
+        ValueError: 未知的策略
+    """
+    if continuity not in CONTINUITY_POLICIES:
+        raise ValueError(f"未知的连贯性策略: {continuity}，可选: {', '.join(CONTINUITY_POLICIES)}")
+
+    # 全书按顺序排列的章节，用于查找上一卷的最后一章
+    all_chapters: List[ChapterKey] = []
+    for volume_index, volume in enumerate(novel_data.get("volumes", []) or []):
+        volume_chapters = volume.get("chapters", []) if isinstance(volume, dict) else []
+        all_chapters.extend((volume_index, i) for i in range(len(volume_chapters or [])))
+    previous_of = {key: all_chapters[i - 1] for i, key in enumerate(all_chapters) if i > 0}
+
+    dependencies: Dict[ChapterKey, List[ChapterKey]] = {}
+    for key in targets:
+        previous = previous_of.get(key)
+        if continuity == "independent" or previous is None:
+            dependencies[key] = []
+        elif continuity == "within_volume" and previous[0] != key[0]:
+            dependencies[key] = []
+        else:
+            dependencies[key] = [previous]
+    return dependencies
+
+
+def tail_text(text: str, max_chars: int) -> str:
+    """
+    取正文末尾不超过 max_chars 个字符，尽量从段落开头截取
+
+    Args:
+        text: 正文
+        max_chars: 最多保留的字符数
+
+    Returns:
+        截取后的文本
+    """
+    if max_chars <= 0:
+        return ""
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    newline = tail.find("\n")
+    if 0 <= newline < max_chars // 2:
+        tail = tail[newline + 1:]
+    return tail
+
+
+class ChapterBatch:
+    """以有限并发批量生成章节"""
+
+    def __init__(self, generate_chapter: Callable[..., Awaitable[str]], data_manager=None,
+                 concurrency: int = 4, progress_callback: Optional[Callable[[Dict], Any]] = None,
+                 continuity: str = "independent", previous_text_chars: int = 2000,
+                 journal=None, prompt_builder: Optional[Callable[..., Any]] = None):
+        """
+        初始化批量生成
+
+        Args:
+            generate_chapter: 生成单章的协程函数，参数为 (novel_data, volume_index, chapter_index)，
+                              以及关键字参数 previous_text（前一章正文结尾，没有依赖时为 None）；
+                              返回正文，或正文已写入章节文件时返回 DraftResult
+            data_manager: NovelDataManager 实例，每章完成后写入 set_chapter_content；为 None 时不写入，
+                          也无法向后续章节提供前一章正文
+            concurrency: 同时生成的最大章节数
+            progress_callback: 进度回调（普通函数或协程函数），参数为事件字典
+            continuity: 连贯性策略，见 CONTINUITY_POLICIES
+            previous_text_chars: 依赖前一章时放入提示词的前一章结尾字符数
+            journal: JobJournal 实例；提供时记录每章的状态变化、提示词和正文哈希
+            prompt_builder: 返回某章提示词的函数，参数同 generate_chapter；提供 journal 时每章只构建一次提示词，
+                            记入日志后以关键字参数 prompt 传给 generate_chapter，保证记录的就是实际发送的提示词
+        """
+        if continuity not in CONTINUITY_POLICIES:
+            raise ValueError(f"未知的连贯性策略: {continuity}，可选: {', '.join(CONTINUITY_POLICIES)}")
+        self.generate_chapter = generate_chapter
+        self.data_manager = data_manager
+        self.concurrency = max(1, int(concurrency))
+        self.progress_callback = progress_callback
+        self.continuity = continuity
+        self.previous_text_chars = previous_text_chars
+        self.journal = journal
+        self.prompt_builder = prompt_builder
+        self.total = 0
+        self.completed: List[ChapterKey] = []
+        self.errors: Dict[ChapterKey, str] = {}
+        self.dependencies: Dict[ChapterKey, List[ChapterKey]] = {}
+        self._started_at = 0.0
+
+    async def _emit(self, event: str, **fields) -> None:
+        if not self.progress_callback:
+            return
+        payload = {
+            "event": event,
+            "total": self.total,
+            "completed": len(self.completed),
+            "failed": len(self.errors),
+            "elapsed": time.monotonic() - self._started_at,
+            **fields,
+        }
+        try:
+            if asyncio.iscoroutinefunction(self.progress_callback):
+                await self.progress_callback(payload)
+            else:
+                self.progress_callback(payload)
+        except Exception as e:
+            # 回调出错不应中断生成
+            print(f"进度回调出错: {e}")
+
+    def _previous_text(self, key: ChapterKey) -> Optional[str]:
+        """依赖章节的正文结尾；没有依赖或前一章尚无正文时返回 None"""
+        if self.data_manager is None:
+            return None
+        for dependency in self.dependencies.get(key, []):
+            content = self.data_manager.get_chapter_content(*dependency)
+            if content:
+                return tail_text(content, self.previous_text_chars)
+        return None
+
+    async def _generate_one(self, novel_data: Dict, key: ChapterKey) -> None:
+        volume_index, chapter_index = key
+        await self._emit("chapter_started", volume_index=volume_index, chapter_index=chapter_index)
+        started_at = time.monotonic()
+        previous_text = self._previous_text(key)
+        try:
+            prompt_kwargs = {}
+            if self.journal is not None:
+                prompt = None
+                if self.prompt_builder is not None:
+                    prompt = self.prompt_builder(novel_data, volume_index, chapter_index, previous_text=previous_text)
+                    if isinstance(prompt, str): # 参数无效时返回的错误信息
+                        raise ValueError(prompt)
+                    prompt_kwargs["prompt"] = prompt
+                await asyncio.to_thread(self.journal.chapter_started, key, prompt)
+            content = await self.generate_chapter(novel_data, volume_index, chapter_index,
+                                                  previous_text=previous_text, **prompt_kwargs)
+            is_file = isinstance(content, DraftResult)
+            if not (content.chars if is_file else content):
+                raise ValueError("模型返回了空内容")
+            if self.journal is not None:
+                # 正文先落盘并记入日志，崩溃后恢复时不会重新生成本章
+                if is_file:
+                    await asyncio.to_thread(self.journal.chapter_completed_file, key, *content)
+                else:
+                    await asyncio.to_thread(self.journal.chapter_completed, key, content)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors[key] = str(e)
+            print(f"生成章节失败 (卷 {volume_index}, 章 {chapter_index}): {e}")
+            if self.journal is not None:
+                await asyncio.to_thread(self.journal.chapter_failed, key, str(e))
+            await self._emit("chapter_failed", volume_index=volume_index, chapter_index=chapter_index,
+                             error=str(e))
+            # 交给调度器：依赖本章的章节不再生成
+            raise
+        if self.data_manager is not None:
+            if is_file:
+                self.data_manager.set_chapter_file(volume_index, chapter_index, content.path)
+            else:
+                self.data_manager.set_chapter_content(volume_index, chapter_index, content)
+        self.completed.append(key)
+        await self._emit("chapter_completed", volume_index=volume_index, chapter_index=chapter_index,
+                         chars=content.chars if is_file else len(content),
+                         seconds=time.monotonic() - started_at)
+
+    async def _blocked(self, key: ChapterKey, failed: ChapterKey) -> None:
+        error = f"前置章节 (卷 {failed[0]}, 章 {failed[1]}) 生成失败"
+        self.errors[key] = error
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.chapter_failed, key, error, "blocked")
+        await self._emit("chapter_failed", volume_index=key[0], chapter_index=key[1], error=error)
+
+    async def run(self, novel_data: Dict, targets: List[ChapterKey]) -> Dict[str, Any]:
+        """
+        生成全部目标章节
+
+        单章失败只记录错误，不影响与它无关的章节；依赖它的章节不再生成，记录为失败。
+        整个批次被取消时取消所有进行中的章节。
+
+        Args:
+            novel_data: 小说数据（包含大纲）
+            targets: 待生成的 (卷索引, 章节索引) 列表；就绪章节中依赖链更长的先开始，其余按列表顺序
+
+        Returns:
+            包含 total、completed（完成的章节列表）、errors（章节 -> 错误信息）、
+            critical_path（最长依赖链的章节数）和 elapsed 的字典
+        """
+        self.total = len(targets)
+        self.completed = []
+        self.errors = {}
+        self.dependencies = build_dependencies(novel_data, targets, self.continuity)
+        scheduler = DagScheduler(self.dependencies)
+        self._started_at = time.monotonic()
+        await self._emit("batch_started", concurrency=self.concurrency, continuity=self.continuity,
+                         critical_path=scheduler.critical_path_length)
+
+        await scheduler.run(lambda key: self._generate_one(novel_data, key), self.concurrency,
+                            on_blocked=self._blocked)
+
+        elapsed = time.monotonic() - self._started_at
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.append, {
+                "type": "finished", "completed": len(self.completed), "failed": len(self.errors),
+                "elapsed": elapsed})
+        await self._emit("batch_finished")
+        return {
+            "total": self.total,
+            "completed": list(self.completed),
+            "errors": dict(self.errors),
+            "critical_path": scheduler.critical_path_length,
+            "elapsed": elapsed,
+        }
@@ -1,12 +1,80 @@
 import json
+import asyncio
 from models.ai_model import AIModel # Changed import
-from utils.prompt_manager import PromptManager # Added import
+from utils.prompt_manager import CompiledTemplate, PromptManager, StructuredPrompt # Added import
 from utils.config_manager import ConfigManager # Added import
+from utils.stream_coalescer import StreamCoalescer
+from generators.novel_context import NovelContextCache
+from generators.rolling_context import RollingContext
+
+# 章节提示词的公共前缀，只用到与具体章节无关的参数
+CHAPTER_SYSTEM_PARAMS = ("title", "theme", "worldbuilding", "characters_info")
+CHAPTER_SYSTEM_TEMPLATE = """
+        你正在为以下小说逐章创作正文：
+
+        小说标题：{title}
+        核心主题：{theme}
+        世界观设定：{worldbuilding}
+
+        主要人物：
+        {characters_info}
+
+        请根据给出的章节信息，创作一个完整、连贯、生动的章节内容。内容应该：
+        1. 符合章节摘要的描述
+        2. 与前后章节保持连贯
+        3. 展现人物性格和发展
+        4. 符合小说的整体风格和主题
+        5. 包含丰富的对话、描写和情节发展
+
+        请直接返回章节内容，不要包含其他解释或说明。
+        """
+
+# 章节提示词中随章节变化的部分
+CHAPTER_USER_PARAMS = ("volume_title", "volume_description", "story_so_far_block", "chapter_title",
+                       "chapter_summary", "previous_chapter_line", "next_chapter_line", "previous_text_block")
+CHAPTER_USER_TEMPLATE = """
+        当前卷：{volume_title}
+        卷简介：{volume_description}
+
+        {story_so_far_block}
+        当前章节：{chapter_title}
+        章节摘要：{chapter_summary}
+
+        {previous_chapter_line}
+        {next_chapter_line}
+        {previous_text_block}
+        """
+
+
+def _compile_chapter_templates(compact: bool) -> dict:
+    return {
+        "chapter_system": CompiledTemplate(CHAPTER_SYSTEM_TEMPLATE, "chapter_system", CHAPTER_SYSTEM_PARAMS, compact),
+        "chapter_user": CompiledTemplate(CHAPTER_USER_TEMPLATE, "chapter_user", CHAPTER_USER_PARAMS, compact),
+    }
+
+
+# 模块加载时编译（压缩空白 / 保留原样两种），占位符与参数表不符时在导入时报错
+CHAPTER_TEMPLATES = {compact: _compile_chapter_templates(compact) for compact in (True, False)}
+
+
+def template_report(compact: bool = True) -> dict:
+    """
+    章节提示词模板的占位符和token统计
+
+    Args:
+        compact: 统计压缩空白后的模板还是原样模板
+
+    Returns:
+        模板名称 -> CompiledTemplate.report() 的字典
+    """
+    return {name: template.report() for name, template in CHAPTER_TEMPLATES[compact].items()}
+
 
 class ChapterGenerator:
     """小说章节生成器"""
 
-    def __init__(self, ai_model: AIModel, prompt_manager: PromptManager, config_manager: ConfigManager): # Changed signature
+    def __init__(self, ai_model: AIModel, prompt_manager: PromptManager, config_manager: ConfigManager,
+                 context_cache: NovelContextCache = None, rolling_context: RollingContext = None): # Changed signature
         """
         初始化章节生成器
 
@@ -14,12 +82,22 @@ class ChapterGenerator:
             ai_model: AI模型实例
             prompt_manager: PromptManager实例
             config_manager: 配置管理器实例
+            context_cache: (Optional) 小说上下文缓存；批量生成时传入同一个实例，
+                           人物列表、提示词前缀和各卷章节摘要只需构建一次
+            rolling_context: (Optional) 已生成章节的前情摘要；提供时按其 token 预算放入提示词
         """
         self.ai_model = ai_model
         self.prompt_manager = prompt_manager # Added
         self.config_manager = config_manager # Added
-
-    async def generate_chapter(self, novel_data: dict, volume_index: int, chapter_index: int, callback=None): # Changed 'outline' to 'novel_data' to match NovelGenerator
+        self.context_cache = context_cache if context_cache is not None else NovelContextCache()
+        self.rolling_context = rolling_context
+        # [PROMPTS] compact：去掉提示词中用于代码排版的缩进和多余空行（默认开启）
+        self.compact_prompts = config_manager.get_config_bool('PROMPTS', 'compact', fallback=True) \
+            if config_manager else True
+        self.templates = CHAPTER_TEMPLATES[self.compact_prompts]
+
+    async def generate_chapter(self, novel_data: dict, volume_index: int, chapter_index: int, callback=None,
+                               previous_text: str = None, prompt: StructuredPrompt = None): # Changed 'outline' to 'novel_data' to match NovelGenerator
         """
         生成章节内容
 
@@ -28,6 +106,8 @@ class ChapterGenerator:
             volume_index: 卷索引
             chapter_index: 章节索引
             callback: 回调函数，用于接收流式生成的内容
+            previous_text: (Optional) 前一章正文的结尾，提供时要求模型紧接其后继续创作
+            prompt: (Optional) 已由 _create_chapter_prompt 构建好的提示词（如已记入任务日志的提示词），提供时不再重新构建
 
         Returns:
             生成的章节内容
@@ -38,9 +118,11 @@ class ChapterGenerator:
         # For example, extract all necessary details from novel_data, volume_index, chapter_index
         # into a flat dictionary.
         
-        prompt_construction_params = self._prepare_prompt_params(novel_data, volume_index, chapter_index)
-        if isinstance(prompt_construction_params, str): # Error string from _prepare_prompt_params
-            raise ValueError(prompt_construction_params)
+        # 提示词由缓存的小说上下文组装，见 _create_chapter_prompt
+        if prompt is None:
+            prompt = self._create_chapter_prompt(novel_data, volume_index, chapter_index, previous_text)
+        if isinstance(prompt, str): # Error string from _prepare_prompt_params
+            raise ValueError(prompt)
 
         # Example using PromptManager, assuming a template named "ChapterGenerationTemplate"
         # prompt = self.prompt_manager.format_prompt("StandardChapterTemplate", **prompt_construction_params)
@@ -49,9 +131,6 @@ class ChapterGenerator:
         #     prompt = self._create_chapter_prompt_from_params(prompt_construction_params)
         #     if not prompt: # If _create_chapter_prompt_from_params also fails (e.g. due to missing keys)
         #         raise ValueError("Could not create chapter generation prompt.")
-        
-        # For now, let's assume _create_chapter_prompt is adapted or a new method is used
-        prompt = self._create_chapter_prompt_from_params(prompt_construction_params)
 
 
         # The callback in generate_stream is for the UI/caller to get chunks.
@@ -84,7 +163,9 @@ class ChapterGenerator:
         return await self.ai_model.generate(prompt)
 
 
-    async def generate_chapter_stream(self, novel_data: dict, volume_index: int, chapter_index: int, callback=None):
+    async def generate_chapter_stream(self, novel_data: dict, volume_index: int, chapter_index: int, callback=None,
+                                      coalescer: StreamCoalescer = None, previous_text: str = None,
+                                      prompt: StructuredPrompt = None):
         """
         流式生成章节内容. This is the new streaming method.
         Args:
@@ -93,25 +174,31 @@ class ChapterGenerator:
             chapter_index: 章节索引
             callback: (Optional) A callback function that will be called with each chunk of text.
                       This callback is for the caller of this library method.
+            coalescer: (Optional) 合并器；提供时先把模型输出的小块合并，再交给 callback 和调用方
+            previous_text: (Optional) 前一章正文的结尾，提供时要求模型紧接其后继续创作
+            prompt: (Optional) 已构建好的提示词，提供时不再重新构建
         Yields:
             str: Chunks of the generated chapter content.
         """
-        prompt_construction_params = self._prepare_prompt_params(novel_data, volume_index, chapter_index)
-        if isinstance(prompt_construction_params, str): # Error string
-            raise ValueError(prompt_construction_params)
+        if prompt is None:
+            prompt = self._create_chapter_prompt(novel_data, volume_index, chapter_index, previous_text)
+        if isinstance(prompt, str): # Error string
+            raise ValueError(prompt)
 
         # prompt = self.prompt_manager.format_prompt("StandardChapterTemplate", **prompt_construction_params)
         # if not prompt:
         #     prompt = self._create_chapter_prompt_from_params(prompt_construction_params)
         #     if not prompt:
         #          raise ValueError("Could not create chapter generation prompt for streaming.")
-        prompt = self._create_chapter_prompt_from_params(prompt_construction_params)
 
         # The AIModel's generate_stream is an async generator.
         # We iterate over it and yield its chunks.
         # The `callback` here is for the *user of this library method*, if they want immediate chunks
         # in addition to iterating the async generator.
-        async for chunk in self.ai_model.generate_stream(prompt): # Pass model's own callback if it has one for internal use
+        stream = self.ai_model.generate_stream(prompt)
+        if coalescer is not None:
+            stream = coalescer.coalesce(stream)
+        async for chunk in stream:
             if callback:
                 # If callback is async, it should be awaited or scheduled.
                 # For simplicity, assume sync callback or handle appropriately.
@@ -121,172 +208,91 @@ class ChapterGenerator:
                     callback(chunk)
             yield chunk
 
-    def _prepare_prompt_params(self, novel_data, volume_index, chapter_index):
-        """Helper to gather all necessary parameters for prompt creation."""
-        params = {}
-        params["title"] = novel_data.get("title", "未命名小说")
-        params["theme"] = novel_data.get("theme", "")
-        params["worldbuilding"] = novel_data.get("worldbuilding", "")
-        
-        characters = novel_data.get("characters", [])
-        characters_info_str = ""
-        for char in characters:
-            characters_info_str += f"- {char.get('name', '')}: {char.get('identity', '')}, {char.get('personality', '')}, {char.get('background', '')}\n"
-        params["characters_info"] = characters_info_str
-
-        volumes = novel_data.get("volumes", [])
-        if not isinstance(volumes, list) or volume_index >= len(volumes):
-            return f"错误：卷索引 {volume_index} 超出范围或卷数据无效"
-        
-        current_volume = volumes[volume_index]
-        if not isinstance(current_volume, dict):
-            return f"错误：卷数据格式不正确 (索引 {volume_index})"
-
-        params["volume_title"] = current_volume.get("title", f"第{volume_index+1}卷")
-        params["volume_description"] = current_volume.get("description", "")
-
-        chapters = current_volume.get("chapters", [])
-        if not isinstance(chapters, list) or chapter_index >= len(chapters):
-            return f"错误：章节索引 {chapter_index} 超出范围或章节数据无效"
-        
-        current_chapter = chapters[chapter_index]
-        if not isinstance(current_chapter, dict):
-             return f"错误：章节数据格式不正确 (卷 {volume_index}, 章 {chapter_index})"
-
-        params["chapter_title"] = current_chapter.get("title", f"第{chapter_index+1}章")
-        params["chapter_summary"] = current_chapter.get("summary", "")
-
-        previous_chapter_summary = ""
-        if chapter_index > 0:
-            if chapter_index -1 < len(chapters): # Check bounds for previous chapter
-                previous_chapter = chapters[chapter_index - 1]
-                if isinstance(previous_chapter, dict):
-                    previous_chapter_summary = previous_chapter.get("summary", "")
-        params["previous_chapter_summary"] = previous_chapter_summary
-
-        next_chapter_summary = ""
-        if chapter_index < len(chapters) - 1:
-            next_chapter = chapters[chapter_index + 1]
-            if isinstance(next_chapter, dict):
-                next_chapter_summary = next_chapter.get("summary", "")
-        params["next_chapter_summary"] = next_chapter_summary
-        
-        return params
-
-    def _create_chapter_prompt_from_params(self, params: dict):
-        """Creates the chapter prompt string from a dictionary of parameters."""
-        # This is the old _create_chapter_prompt, adapted to take a params dict.
-        # This could be replaced by a template in prompt_templates.json and use self.prompt_manager
-        title = params.get("title", "未命名小说")
-        theme = params.get("theme", "")
-        worldbuilding = params.get("worldbuilding", "")
-        characters_info = params.get("characters_info", "")
-        volume_title = params.get("volume_title", "")
-        volume_description = params.get("volume_description", "")
-        chapter_title = params.get("chapter_title", "")
-        chapter_summary = params.get("chapter_summary", "")
-        previous_chapter_summary = params.get("previous_chapter_summary", "")
-        next_chapter_summary = params.get("next_chapter_summary", "")
-
-        return f"""
-        请为以下小说生成一个完整的章节内容：
-
-        小说标题：{title}
-        核心主题：{theme}
-        世界观设定：{worldbuilding}
-
-        主要人物：
-        {characters_info}
-
-        当前卷：{volume_title}
-        卷简介：{volume_description}
-
-        当前章节：{chapter_title}
-        章节摘要：{chapter_summary}
+    def _prepare_prompt_params(self, novel_data, volume_index, chapter_index, context=None):
+        """
+        收集创建章节提示词所需的全部参数
 
-        {"前一章节摘要：" + previous_chapter_summary if previous_chapter_summary else ""}
-        {"后一章节摘要：" + next_chapter_summary if next_chapter_summary else ""}
+        公共部分（人物列表等）和各卷的章节摘要取自缓存的小说上下文，只在数据变化时重建。
+        提供 rolling_context 时另有 story_so_far（按 token 预算选出的已写章节前情）。
 
-        请根据以上信息，创作一个完整、连贯、生动的章节内容。内容应该：
-        1. 符合章节摘要的描述
-        2. 与前后章节保持连贯
-        3. 展现人物性格和发展
-        4. 符合小说的整体风格和主题
-        5. 包含丰富的对话、描写和情节发展
+        Args:
+            context: (Optional) 已取得的小说上下文，None 时从缓存获取
 
-        请直接返回章节内容，不要包含其他解释或说明。
+        Returns:
+            参数字典；索引无效或数据格式不正确时返回错误信息字符串
         """
+        context = context if context is not None else self.context_cache.get(novel_data)
+        params = context.chapter_params(novel_data, volume_index, chapter_index)
+        if isinstance(params, str) or self.rolling_context is None:
+            return params
+        story_so_far = self.rolling_context.context_for(novel_data, volume_index, chapter_index)
+        return {**params, "story_so_far": story_so_far} if story_so_far else params
 
-    # Original _create_chapter_prompt is kept for reference or if direct use is still needed,
-    # but _create_chapter_prompt_from_params is preferred for use with _prepare_prompt_params.
-    def _create_chapter_prompt(self, novel_data, volume_index, chapter_index):
-        """创建章节生成的提示词"""
-        # 获取小说基本信息
-        title = outline.get("title", "未命名小说")
-        theme = outline.get("theme", "")
-        worldbuilding = outline.get("worldbuilding", "")
-
-        # 获取主要人物信息
-        characters = outline.get("characters", [])
-        characters_info = ""
-        for char in characters:
-            characters_info += f"- {char.get('name', '')}: {char.get('identity', '')}, {char.get('personality', '')}, {char.get('background', '')}\n"
-
-        # 获取当前卷的信息
-        volumes = outline.get("volumes", [])
-        if volume_index >= len(volumes):
-            return f"错误：卷索引 {volume_index} 超出范围"
-
-        current_volume = volumes[volume_index]
-        volume_title = current_volume.get("title", f"第{volume_index+1}卷")
-        volume_description = current_volume.get("description", "")
-
-        # 获取当前章节的信息
-        chapters = current_volume.get("chapters", [])
-        if chapter_index >= len(chapters):
-            return f"错误：章节索引 {chapter_index} 超出范围"
-
-        current_chapter = chapters[chapter_index]
-        chapter_title = current_chapter.get("title", f"第{chapter_index+1}章")
-        chapter_summary = current_chapter.get("summary", "")
-
-        # 获取前一章节的信息（如果有）
-        previous_chapter_summary = ""
-        if chapter_index > 0:
-            previous_chapter = chapters[chapter_index - 1]
-            previous_chapter_summary = previous_chapter.get("summary", "")
-
-        # 获取后一章节的信息（如果有）
-        next_chapter_summary = ""
-        if chapter_index < len(chapters) - 1:
-            next_chapter = chapters[chapter_index + 1]
-            next_chapter_summary = next_chapter.get("summary", "")
-
-        return f"""
-        请为以下小说生成一个完整的章节内容：
+    def _create_chapter_prompt_from_params(self, params: dict):
+        """
+        根据参数字典创建章节提示词
 
-        小说标题：{title}
-        核心主题：{theme}
-        世界观设定：{worldbuilding}
+        同一部小说的所有章节共用完全相同的前缀（标题、主题、世界观、人物和写作要求），
+        放在 system 部分并标记为可缓存；随章节变化的卷、章节和前后章节摘要放在 user 部分。
+        支持提示词缓存的模型（如 Claude）只需为前缀计费一次，其余模型收到的是拼接后的文本。
 
-        主要人物：
-        {characters_info}
-
-        当前卷：{volume_title}
-        卷简介：{volume_description}
+        Args:
+            params: _prepare_prompt_params 返回的参数字典
 
-        当前章节：{chapter_title}
-        章节摘要：{chapter_summary}
+        Returns:
+            StructuredPrompt 实例
+        """
+        return StructuredPrompt(system=self._render_chapter_system(params), user=self._render_chapter_user(params))
+
+    def _render_chapter_system(self, params: dict) -> str:
+        """渲染章节提示词的公共前缀（只用到标题、主题、世界观和人物列表）"""
+        return self.templates["chapter_system"].render({
+            "title": params.get("title", "未命名小说"),
+            "theme": params.get("theme", ""),
+            "worldbuilding": params.get("worldbuilding", ""),
+            "characters_info": params.get("characters_info", ""),
+        })
+
+    def _render_chapter_user(self, params: dict) -> str:
+        """渲染章节提示词中随章节变化的部分"""
+        previous_chapter_summary = params.get("previous_chapter_summary", "")
+        next_chapter_summary = params.get("next_chapter_summary", "")
+        previous_text = params.get("previous_text", "")
+        story_so_far = params.get("story_so_far", "")
+        return self.templates["chapter_user"].render({
+            "volume_title": params.get("volume_title", ""),
+            "volume_description": params.get("volume_description", ""),
+            "story_so_far_block": "前情提要（根据已写成的正文整理，请与之保持一致）：\n" + story_so_far + "\n"
+                                  if story_so_far else "",
+            "chapter_title": params.get("chapter_title", ""),
+            "chapter_summary": params.get("chapter_summary", ""),
+            "previous_chapter_line": "前一章节摘要：" + previous_chapter_summary if previous_chapter_summary else "",
+            "next_chapter_line": "后一章节摘要：" + next_chapter_summary if next_chapter_summary else "",
+            "previous_text_block": "前一章结尾原文（请紧接其后继续创作，保持情节、人物状态和语气连贯）：\n"
+                                   + previous_text if previous_text else "",
+        })
+
+    def _create_chapter_prompt(self, novel_data, volume_index, chapter_index, previous_text=None):
+        """
+        创建章节生成的提示词
 
-        {"前一章节摘要：" + previous_chapter_summary if previous_chapter_summary else ""}
-        {"后一章节摘要：" + next_chapter_summary if next_chapter_summary else ""}
+        公共前缀在每个小说上下文中只渲染一次，之后的章节直接复用同一个字符串。
 
-        请根据以上信息，创作一个完整、连贯、生动的章节内容。内容应该：
-        1. 符合章节摘要的描述
-        2. 与前后章节保持连贯
-        3. 展现人物性格和发展
-        4. 符合小说的整体风格和主题
-        5. 包含丰富的对话、描写和情节发展
+        Args:
+            novel_data: 小说数据 (包含大纲等)
+            volume_index: 卷索引
+            chapter_index: 章节索引
+            previous_text: (Optional) 前一章正文的结尾，放在 user 部分
 
-        请直接返回章节内容，不要包含其他解释或说明。
-        """
\ No newline at end of file
+        Returns:
+            StructuredPrompt 实例；参数无效时返回错误信息字符串
+        """
+        context = self.context_cache.get(novel_data)
+        params = self._prepare_prompt_params(novel_data, volume_index, chapter_index, context)
+        if isinstance(params, str):
+            return params
+        if previous_text:
+            params = {**params, "previous_text": previous_text}
+        system = context.memoize("chapter_system_compact" if self.compact_prompts else "chapter_system",
+                                 self._render_chapter_system)
+        return StructuredPrompt(system=system, user=self._render_chapter_user(params))
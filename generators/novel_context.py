@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+小说上下文模块
+
+章节提示词中与具体章节无关的部分（标题、主题、世界观、人物列表以及由它们渲染出的
+提示词前缀）每部小说只构建一次；各卷的章节标题、摘要和前后章节摘要在第一次用到该卷时
+一次性整理好。之后生成同一部小说的章节只做查表。
+
+数据是否变化按部分判断：只读快照（NovelDataManager.get_outline 返回的数据）中未修改的
+部分是同一个对象，直接按引用判断；普通 dict / list 与保存的只读副本逐项比较（在C层完成，
+远快于重新拼接字符串）。人物或世界观变化时重建整个上下文，某一卷变化时只重建该卷。
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from utils.snapshot import freeze
+
+
+def render_characters_info(characters) -> str:
+    """
+    渲染提示词中的人物列表
+
+    Args:
+        characters: 人物字典列表
+
+    Returns:
+        每个人物一行的文本
+    """
+    return "".join(
+        f"- {char.get('name', '')}: {char.get('identity', '')}, {char.get('personality', '')}, {char.get('background', '')}\n"
+        for char in characters
+    )
+
+
+def _unchanged(current: Any, saved: Any) -> bool:
+    return current is saved or current == saved
+
+
+class NovelContext:
+    """一部小说编译好的章节提示词上下文"""
+
+    HEADER_FIELDS = ("title", "theme", "worldbuilding", "characters")
+
+    def __init__(self, novel_data: dict):
+        """
+        构建小说上下文
+
+        Args:
+            novel_data: 小说数据（包含大纲），可以是只读快照
+        """
+        self._header_source = {field: freeze(novel_data.get(field)) for field in self.HEADER_FIELDS}
+        self.header_params = {
+            "title": novel_data.get("title", "未命名小说"),
+            "theme": novel_data.get("theme", ""),
+            "worldbuilding": novel_data.get("worldbuilding", ""),
+            "characters_info": render_characters_info(novel_data.get("characters", [])),
+        }
+        # 由公共参数渲染出的文本（如提示词前缀），见 memoize
+        self._rendered: Dict[str, Any] = {}
+        # 卷索引 -> (该卷的只读副本, 卷参数或错误信息, 各章节参数或错误信息)
+        self._volumes: Dict[int, tuple] = {}
+
+    def memoize(self, name: str, render: Callable[[dict], Any]) -> Any:
+        """
+        按名称缓存由公共参数渲染出的结果，每个上下文只渲染一次
+
+        Args:
+            name: 结果名称
+            render: 以 header_params 为参数的渲染函数
+
+        Returns:
+            渲染结果
+        """
+        if name not in self._rendered:
+            self._rendered[name] = render(self.header_params)
+        return self._rendered[name]
+
+    def matches(self, novel_data: dict) -> bool:
+        """人物、世界观等公共部分是否与构建时相同"""
+        return all(_unchanged(novel_data.get(field), saved) for field, saved in self._header_source.items())
+
+    def _build_volume(self, volume_index: int, volume) -> tuple:
+        source = freeze(volume)
+        if not isinstance(volume, dict):
+            return source, f"错误：卷数据格式不正确 (索引 {volume_index})", []
+
+        volume_params = {
+            "volume_title": volume.get("title", f"第{volume_index+1}卷"),
+            "volume_description": volume.get("description", ""),
+        }
+        chapters = volume.get("chapters", [])
+        if not isinstance(chapters, list):
+            return source, volume_params, None
+
+        summaries = [chap.get("summary", "") if isinstance(chap, dict) else "" for chap in chapters]
+        chapter_params: List[Union[dict, str]] = []
+        for chapter_index, chapter in enumerate(chapters):
+            if not isinstance(chapter, dict):
+                chapter_params.append(f"错误：章节数据格式不正确 (卷 {volume_index}, 章 {chapter_index})")
+                continue
+            chapter_params.append({
+                "chapter_title": chapter.get("title", f"第{chapter_index+1}章"),
+                "chapter_summary": summaries[chapter_index],
+                "previous_chapter_summary": summaries[chapter_index - 1] if chapter_index > 0 else "",
+                "next_chapter_summary": summaries[chapter_index + 1] if chapter_index < len(chapters) - 1 else "",
+            })
+        return source, volume_params, chapter_params
+
+    def chapter_params(self, novel_data: dict, volume_index: int, chapter_index: int) -> Union[dict, str]:
+        """
+        获取某一章的提示词参数
+
+        Args:
+            novel_data: 小说数据（用于检查该卷是否变化）
+            volume_index: 卷索引
+            chapter_index: 章节索引
+
+        Returns:
+            参数字典（包含公共参数）；索引无效或数据格式不正确时返回错误信息字符串
+        """
+        volumes = novel_data.get("volumes", [])
+        if not isinstance(volumes, list) or volume_index >= len(volumes):
+            return f"错误：卷索引 {volume_index} 超出范围或卷数据无效"
+        volume = volumes[volume_index]
+
+        cached = self._volumes.get(volume_index)
+        if cached is None or not _unchanged(volume, cached[0]):
+            cached = self._build_volume(volume_index, volume)
+            self._volumes[volume_index] = cached
+        _, volume_params, chapter_params = cached
+
+        if isinstance(volume_params, str):
+            return volume_params
+        if chapter_params is None or chapter_index >= len(chapter_params):
+            return f"错误：章节索引 {chapter_index} 超出范围或章节数据无效"
+        params = chapter_params[chapter_index]
+        if isinstance(params, str):
+            return params
+        return {**self.header_params, **volume_params, **params}
+
+
+class NovelContextCache:
+    """保存最近一部小说的上下文，数据变化时自动重建"""
+
+    def __init__(self):
+        """初始化上下文缓存"""
+        self._context: Optional[NovelContext] = None
+        self.stats = {"builds": 0, "reuses": 0}
+
+    def get(self, novel_data: dict) -> NovelContext:
+        """
+        获取小说数据对应的上下文
+
+        Args:
+            novel_data: 小说数据
+
+        Returns:
+            NovelContext 实例
+        """
+        context = self._context
+        if context is not None and context.matches(novel_data):
+            self.stats["reuses"] += 1
+            return context
+        context = NovelContext(novel_data)
+        self._context = context
+        self.stats["builds"] += 1
+        return context
+
+    def invalidate(self) -> None:
+        """丢弃保存的上下文"""
+        self._context = None
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取缓存统计
+
+        Returns:
+            包含 builds（构建次数）和 reuses（复用次数）的字典
+        """
+        return dict(self.stats)
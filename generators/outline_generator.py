@@ -1,8 +1,182 @@
 import json
+from typing import Dict, Optional
 from models.ai_model import AIModel # Changed import
 # We will also need PromptManager if it's used for creating prompts
-from utils.prompt_manager import PromptManager # Added import
+from utils.prompt_manager import CompiledTemplate, PromptManager, StructuredPrompt # Added import
 from utils.config_manager import ConfigManager # Added import, assuming it's needed directly
+from utils.snapshot import thaw
+
+# 大纲生成的固定说明和JSON格式要求（与具体小说无关）
+OUTLINE_SYSTEM_TEMPLATE = """
+        你是一名小说策划，负责根据用户给出的小说信息创作详细大纲。
+
+        特别说明：
+        1. 新生成角色数量仅指需要新创建的角色数量
+        2. 请不要重复创建已有角色，已有角色会在"已选择的出场角色"中列出
+        3. 在生成的JSON中，characters字段只包含新创建的角色，不要包含已有角色
+
+        请生成以下内容：
+        1. 小说标题
+        2. 核心主题
+        3. 主要人物（包括姓名、身份、年龄、性别、性格特点、背景故事、外貌描述、能力特长和目标动机）
+        4. 故事梗概
+        5. 分卷结构（每卷包含标题、简介和具体章节）
+        6. 世界观设定
+
+        特别要求：
+        1. 卷标题必须包含卷号，如"第二卷：卷标题"，卷号必须与实际卷号一致
+        2. 章节标题必须包含章节号，如"第三章：章节标题"，章节号必须与实际章节号一致
+        3. 只生成指定数量的新角色，不要重复已有角色
+        4. 在characters字段中只包含新创建的角色，不要包含已有角色
+
+        请确保大纲结构完整、逻辑合理，并以下面的JSON格式返回：
+
+        ```json
+        {{
+            "title": "小说标题",
+            "theme": "核心主题",
+            "characters": [
+                {{
+                    "name": "角色名",
+                    "identity": "身份",
+                    "age": "年龄",
+                    "gender": "性别",
+                    "personality": "性格特点（详细描述）",
+                    "background": "背景故事（详细描述）",
+                    "appearance": "外貌描述（详细描述）",
+                    "abilities": "能力特长（详细描述）",
+                    "goals": "目标动机（详细描述）"
+                }}
+            ],
+            "synopsis": "故事梗概",
+            "volumes": [
+                {{
+                    "title": "第1卷：卷标题",
+                    "description": "卷简介",
+                    "chapters": [
+                        {{
+                            "title": "第1章：章节标题",
+                            "summary": "章节摘要"
+                        }},
+                        {{
+                            "title": "第2章：章节标题",
+                            "summary": "章节摘要"
+                        }}
+                    ]
+                }},
+                {{
+                    "title": "第2卷：卷标题",
+                    "description": "卷简介",
+                    "chapters": [
+                        {{
+                            "title": "第1章：章节标题",
+                            "summary": "章节摘要"
+                        }}
+                    ]
+                }}
+            ],
+            "worldbuilding": "世界观设定"
+        }}
+        ```
+
+        注意：如果指定了生成范围，请只在volumes字段中包含范围内的卷，不要包含其他卷。
+
+        请只返回JSON格式的内容，不要包含其他解释或说明。
+        """
+
+# 按范围续写时附加在固定说明之后的已有大纲
+OUTLINE_EXISTING_PARAMS = ("existing_title", "existing_theme", "existing_synopsis", "existing_worldbuilding",
+                           "characters_info", "volumes_info")
+OUTLINE_EXISTING_TEMPLATE = """
+
+        已有的大纲信息：
+        标题：{existing_title}
+        核心主题：{existing_theme}
+        故事梗概：{existing_synopsis}
+        世界观设定：{existing_worldbuilding}
+
+        已有的角色信息：
+{characters_info}
+
+        已有的卷和章节结构：
+{volumes_info}
+
+        注意：请只生成指定范围内的卷和章节，不要重复已有的内容。如果指定范围内的卷或章节已经存在，请替换它们。你只需要返回指定范围内的卷和章节，不需要返回其他卷和章节。
+        """
+
+# 本次请求的小说信息和结构参数
+OUTLINE_USER_PARAMS = ("scope", "novel_info", "volume_count", "chapters_per_volume", "words_per_chapter",
+                       "total_words_wan", "new_character_count", "selected_characters", "range_requirements")
+OUTLINE_USER_TEMPLATE = """
+        请为我创建一部小说的{scope}详细大纲，以JSON格式返回。小说信息如下：
+        {novel_info}
+        卷数：{volume_count} 卷
+        每卷章节数：{chapters_per_volume} 章
+        每章字数：{words_per_chapter} 字
+        总字数：约 {total_words_wan} 万字
+
+        人物设置：
+        新生成角色数量：{new_character_count} 个
+        {selected_characters}
+
+        {range_requirements}
+        """
+
+# 指定生成范围时的范围要求
+OUTLINE_RANGE_PARAMS = ("range_text", "start_volume", "first_chapter")
+OUTLINE_RANGE_TEMPLATE = """
+        生成范围：{range_text}
+
+        范围要求：
+        1. 只生成指定范围内的卷和章节，但保持与已有大纲的一致性
+        2. 不要重复已有的内容，只返回指定范围内的卷和章节
+        3. 在JSON的volumes字段中，只包含指定范围内的卷，不要包含其他卷
+        4. 卷号和章节号从第{start_volume}卷{first_chapter}开始编号
+        """
+
+OUTLINE_OPTIMIZATION_PARAMS = ("outline_json",)
+OUTLINE_OPTIMIZATION_TEMPLATE = """
+        请优化以下小说大纲，使其更加完善：
+
+        {outline_json}
+
+        请进行以下优化：
+        1. 完善角色背景和动机
+        2. 增强情节的起伏和转折
+        3. 丰富世界观设定的细节
+        4. 确保各章节和卷之间的逻辑连贯
+
+        请保持原有的JSON格式，只返回优化后的JSON内容，不要包含其他解释或说明。
+        """
+
+
+def _compile_outline_templates(compact: bool) -> dict:
+    return {
+        "outline_system": CompiledTemplate(OUTLINE_SYSTEM_TEMPLATE, "outline_system", (), compact),
+        "outline_existing": CompiledTemplate(OUTLINE_EXISTING_TEMPLATE, "outline_existing", OUTLINE_EXISTING_PARAMS, compact),
+        "outline_user": CompiledTemplate(OUTLINE_USER_TEMPLATE, "outline_user", OUTLINE_USER_PARAMS, compact),
+        "outline_range": CompiledTemplate(OUTLINE_RANGE_TEMPLATE, "outline_range", OUTLINE_RANGE_PARAMS, compact),
+        "outline_optimization": CompiledTemplate(OUTLINE_OPTIMIZATION_TEMPLATE, "outline_optimization",
+                                                 OUTLINE_OPTIMIZATION_PARAMS, compact),
+    }
+
+
+# 模块加载时编译（压缩空白 / 保留原样两种），占位符与参数表不符时在导入时报错
+OUTLINE_TEMPLATES = {compact: _compile_outline_templates(compact) for compact in (True, False)}
+
+
+def template_report(compact: bool = True) -> Dict[str, dict]:
+    """
+    大纲提示词模板的占位符和token统计
+
+    Args:
+        compact: 统计压缩空白后的模板还是原样模板
+
+    Returns:
+        模板名称 -> CompiledTemplate.report() 的字典
+    """
+    return {name: template.report() for name, template in OUTLINE_TEMPLATES[compact].items()}
+
 
 class OutlineGenerator:
     """小说大纲生成器"""
@@ -19,6 +193,10 @@ class OutlineGenerator:
         self.ai_model = ai_model
         self.prompt_manager = prompt_manager # Added
         self.config_manager = config_manager
+        # [PROMPTS] compact：去掉提示词中用于代码排版的缩进和多余空行（默认开启）
+        self.compact_prompts = config_manager.get_config_bool('PROMPTS', 'compact', fallback=True) \
+            if config_manager else True
+        self.templates = OUTLINE_TEMPLATES[self.compact_prompts]
 
     async def generate_outline(self, prompt_params: dict, existing_outline_data: Optional[dict] = None, callback=None): # Changed signature to match NovelGenerator call
         """
@@ -72,31 +250,7 @@ class OutlineGenerator:
             words_per_chapter, new_character_count, selected_characters,
             start_volume, start_chapter, end_volume, end_chapter, existing_outline_for_prompt
         )
-        """
-        生成小说大纲
-
-        Args:
-            title: 小说标题
-            genre: 小说类型
-            theme: 小说主题
-            style: 小说风格
-            synopsis: 小说简介
-            volume_count: 卷数
-            chapters_per_volume: 每卷章节数
-            words_per_chapter: 每章字数
-            new_character_count: 新生成角色数量
-            selected_characters: 选择的已有角色列表
-            start_volume: 起始卷号（从1开始）
-            start_chapter: 起始章节号（从1开始）
-            end_volume: 结束卷号（从1开始）
-            end_chapter: 结束章节号（从1开始）
-            existing_outline: 已有的大纲内容（用于指定范围生成）
-            callback: 回调函数，用于接收流式生成的内容
-
-        Returns:
-            生成的大纲（JSON格式）
-        """
-        prompt = self._create_outline_prompt(title, genre, theme, style, synopsis, volume_count, chapters_per_volume, words_per_chapter, new_character_count, selected_characters, start_volume, start_chapter, end_volume, end_chapter, existing_outline)
+        existing_outline = existing_outline_data or existing_outline_for_prompt
 
         if callback:
             # 流式生成
@@ -144,215 +298,98 @@ class OutlineGenerator:
             return self._parse_outline(response)
 
     def _create_outline_prompt(self, title, genre, theme, style, synopsis, volume_count, chapters_per_volume, words_per_chapter, new_character_count, selected_characters=None, start_volume=None, start_chapter=None, end_volume=None, end_chapter=None, existing_outline=None):
-        """创建大纲生成的提示词"""
-        # 构建提示词基础部分
-        if start_volume and end_volume:
-            prompt = f"""
-            请为我创建一部小说的指定范围的详细大纲，以JSON格式返回。小说信息如下：
-            """
-        else:
-            prompt = f"""
-            请为我创建一部小说的详细大纲，以JSON格式返回。小说信息如下：
-            """
+        """
+        创建大纲生成的提示词
+
+        固定的任务说明、JSON格式要求和已有大纲（按范围续写时）放在 system 部分，
+        它们在同一部小说的多次请求之间保持不变，便于服务端前缀缓存命中；
+        本次请求的小说信息、结构参数和生成范围放在 user 部分。
+
+        Returns:
+            StructuredPrompt 实例
+        """
+        system = self._outline_instructions()
+        if start_volume and end_volume and existing_outline:
+            system += "\n\n" + self._existing_outline_context(existing_outline)
 
         # 根据用户输入添加相应信息
+        novel_info = []
         if title:
-            prompt += f"""
-        小说标题：{title}"""
-
+            novel_info.append(f"小说标题：{title}")
         if genre:
-            prompt += f"""
-        小说类型：{genre}"""
-
+            novel_info.append(f"小说类型：{genre}")
         if theme:
-            prompt += f"""
-        主题：{theme}"""
-
+            novel_info.append(f"主题：{theme}")
         if style:
-            prompt += f"""
-        风格：{style}"""
-
+            novel_info.append(f"风格：{style}")
         if synopsis:
-            prompt += f"""
-        简介：{synopsis}"""
-
-        # 添加结构信息
-        prompt += f"""
-        卷数：{volume_count} 卷
-        每卷章节数：{chapters_per_volume} 章
-        每章字数：{words_per_chapter} 字
-        总字数：约 {volume_count * chapters_per_volume * words_per_chapter // 10000} 万字
-
-        人物设置：
-        新生成角色数量：{new_character_count} 个
-        """
+            novel_info.append(f"简介：{synopsis}")
 
         # 添加选择的角色信息
+        selected_characters_block = ""
         if selected_characters and len(selected_characters) > 0:
-            prompt += f"""
-        已选择的出场角色：
-        """
             character_names = [char.get("name", "未命名角色") for char in selected_characters]
-            prompt += ", ".join(character_names)
-            prompt += "\n"
-
-        # 特别提醒AI关于角色生成的说明
-        prompt += f"""
-        特别说明：
-        1. 新生成角色数量 {new_character_count} 个仅指需要新创建的角色数量
-        2. 请不要重复创建已有角色，已有角色会在"已选择的出场角色"中列出
-        3. 在生成的JSON中，characters字段只包含新创建的角色，不要包含已有角色
-        """
+            selected_characters_block = "已选择的出场角色：" + ", ".join(character_names)
 
         # 如果指定了生成范围
+        range_requirements = ""
         if start_volume and end_volume:
-            prompt += f"""
-
-        生成范围：从第{start_volume}卷{f'第{start_chapter}章' if start_chapter else '开始'} 到 第{end_volume}卷{f'第{end_chapter}章' if end_chapter else '结束'}
-        """
-
-            # 如果有已存在的大纲，添加到提示中
-            if existing_outline:
-                # 提取已有大纲的基本信息
-                existing_title = existing_outline.get('title', '')
-                existing_theme = existing_outline.get('theme', '')
-                existing_synopsis = existing_outline.get('synopsis', '')
-                existing_worldbuilding = existing_outline.get('worldbuilding', '')
-
-                # 提取已有的角色信息
-                existing_characters = existing_outline.get('characters', [])
-                characters_info = ""
-                for char in existing_characters:
-                    characters_info += f"- {char.get('name', '')}: {char.get('identity', '')}, {char.get('personality', '')}, {char.get('background', '')}\\n"
-
-                # 提取已有的卷和章节信息
-                existing_volumes = existing_outline.get('volumes', [])
-                volumes_info = ""
-                for i, vol in enumerate(existing_volumes):
-                    volumes_info += f"第{i+1}卷：{vol.get('title', '')}\\n"
-                    volumes_info += f"简介：{vol.get('description', '')}\\n"
-                    chapters = vol.get('chapters', [])
-                    for j, chap in enumerate(chapters):
-                        volumes_info += f"  第{j+1}章：{chap.get('title', '')}\\n"
-                        volumes_info += f"  摘要：{chap.get('summary', '')}\\n"
-
-                prompt += f"""
-
-        已有的大纲信息：
-        标题：{existing_title}
-        核心主题：{existing_theme}
-        故事梗概：{existing_synopsis}
-        世界观设定：{existing_worldbuilding}
-
-        已有的角色信息：
-{characters_info}
-
-        已有的卷和章节结构：
-{volumes_info}
-
-        注意：请只生成指定范围内的卷和章节，不要重复已有的内容。如果指定范围内的卷或章节已经存在，请替换它们。你只需要返回指定范围内的卷和章节，不需要返回其他卷和章节。
-        """
-
-        prompt += f"""
-
-        请生成以下内容：
-        1. 小说标题
-        2. 核心主题
-        3. 主要人物（包括姓名、身份、年龄、性别、性格特点、背景故事、外貌描述、能力特长和目标动机）
-        4. 故事梗概
-        5. 分卷结构（每卷包含标题、简介和具体章节）
-        6. 世界观设定
-
-        特别要求：
-        1. 卷标题必须包含卷号，如"第二卷：卷标题"，卷号必须与实际卷号一致
-        2. 章节标题必须包含章节号，如"第三章：章节标题"，章节号必须与实际章节号一致
-        3. 只生成指定数量的新角色，不要重复已有角色
-        4. 在characters字段中只包含新创建的角色，不要包含已有角色
-        """
-
-        if start_volume and end_volume:
-            prompt += f"""
-        3. 只生成指定范围内的卷和章节，但保持与已有大纲的一致性
-        4. 不要重复已有的内容，只返回指定范围内的卷和章节
-        5. 在JSON的volumes字段中，只包含指定范围内的卷，不要包含其他卷
-        """
-
-        prompt += f"""
-
-        请确保大纲结构完整、逻辑合理，并以下面的JSON格式返回：
-
-        ```json
-        {{
-            "title": "小说标题",
-            "theme": "核心主题",
-            "characters": [
-                {{
-                    "name": "角色名",
-                    "identity": "身份",
-                    "age": "年龄",
-                    "gender": "性别",
-                    "personality": "性格特点（详细描述）",
-                    "background": "背景故事（详细描述）",
-                    "appearance": "外貌描述（详细描述）",
-                    "abilities": "能力特长（详细描述）",
-                    "goals": "目标动机（详细描述）"
-                }}
-            ],
-            "synopsis": "故事梗概",
-            "volumes": [
-                {{
-                    "title": "第{start_volume}卷：卷标题",
-                    "description": "卷简介",
-                    "chapters": [
-                        {{
-                            "title": "第{start_chapter}章：章节标题",
-                            "summary": "章节摘要"
-                        }},
-                        {{
-                            "title": "第2章：章节标题",
-                            "summary": "章节摘要"
-                        }}
-                    ]
-                }},
-                {{
-                    "title": "第2卷：卷标题",
-                    "description": "卷简介",
-                    "chapters": [
-                        {{
-                            "title": "第1章：章节标题",
-                            "summary": "章节摘要"
-                        }}
-                    ]
-                }}
-            ],
-            "worldbuilding": "世界观设定"
-        }}
-        ```
-
-        注意：如果指定了生成范围，请只在volumes字段中包含范围内的卷，不要包含其他卷。
-
-        请只返回JSON格式的内容，不要包含其他解释或说明。
-        """
-
-        return prompt
+            range_requirements = self.templates["outline_range"].render({
+                "range_text": f"从第{start_volume}卷{f'第{start_chapter}章' if start_chapter else '开始'} 到 第{end_volume}卷{f'第{end_chapter}章' if end_chapter else '结束'}",
+                "start_volume": start_volume,
+                "first_chapter": f"第{start_chapter}章" if start_chapter else "第1章",
+            })
+
+        prompt = self.templates["outline_user"].render({
+            "scope": "指定范围的" if start_volume and end_volume else "",
+            "novel_info": "\n".join(novel_info),
+            "volume_count": volume_count,
+            "chapters_per_volume": chapters_per_volume,
+            "words_per_chapter": words_per_chapter,
+            "total_words_wan": volume_count * chapters_per_volume * words_per_chapter // 10000,
+            "new_character_count": new_character_count,
+            "selected_characters": selected_characters_block,
+            "range_requirements": range_requirements,
+        })
+
+        return StructuredPrompt(system=system, user=prompt)
+
+    def _outline_instructions(self):
+        """大纲生成的固定说明和JSON格式要求（与具体小说无关）"""
+        return self.templates["outline_system"].render({})
+
+    def _existing_outline_context(self, existing_outline):
+        """已有大纲的设定和结构（同一部小说按范围续写时保持不变）"""
+        # 提取已有的角色信息
+        existing_characters = existing_outline.get('characters', [])
+        characters_info = ""
+        for char in existing_characters:
+            characters_info += f"- {char.get('name', '')}: {char.get('identity', '')}, {char.get('personality', '')}, {char.get('background', '')}\n"
+
+        # 提取已有的卷和章节信息
+        existing_volumes = existing_outline.get('volumes', [])
+        volumes_info = ""
+        for i, vol in enumerate(existing_volumes):
+            volumes_info += f"第{i+1}卷：{vol.get('title', '')}\n"
+            volumes_info += f"简介：{vol.get('description', '')}\n"
+            chapters = vol.get('chapters', [])
+            for j, chap in enumerate(chapters):
+                volumes_info += f"  第{j+1}章：{chap.get('title', '')}\n"
+                volumes_info += f"  摘要：{chap.get('summary', '')}\n"
+
+        return self.templates["outline_existing"].render({
+            "existing_title": existing_outline.get('title', ''),
+            "existing_theme": existing_outline.get('theme', ''),
+            "existing_synopsis": existing_outline.get('synopsis', ''),
+            "existing_worldbuilding": existing_outline.get('worldbuilding', ''),
+            "characters_info": characters_info,
+            "volumes_info": volumes_info,
+        })
 
     def _create_optimization_prompt(self, outline):
         """创建大纲优化的提示词"""
         outline_json = json.dumps(outline, ensure_ascii=False, indent=2)
-
-        return f"""
-        请优化以下小说大纲，使其更加完善：
-
-        {outline_json}
-
-        请进行以下优化：
-        1. 完善角色背景和动机
-        2. 增强情节的起伏和转折
-        3. 丰富世界观设定的细节
-        4. 确保各章节和卷之间的逻辑连贯
-
-        请保持原有的JSON格式，只返回优化后的JSON内容，不要包含其他解释或说明。
-        """
+        return self.templates["outline_optimization"].render({"outline_json": outline_json})
 
     def _merge_outlines(self, existing_outline, generated_outline, start_volume, start_chapter, end_volume, end_chapter):
         """合并已有大纲和新生成的大纲
@@ -368,8 +405,8 @@ class OutlineGenerator:
         Returns:
             合并后的大纲
         """
-        # 创建结果大纲，基于已有大纲
-        result_outline = existing_outline.copy()
+        # 创建结果大纲，基于已有大纲的可修改副本（不修改调用方的数据，已有大纲也可以是只读快照）
+        result_outline = thaw(existing_outline)
 
         # 如果新生成的大纲中有volumes字段
         if 'volumes' in generated_outline and generated_outline['volumes']:
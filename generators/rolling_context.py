@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+滚动前情上下文模块
+
+章节提示词原本只有前后章节的大纲摘要，模型看不到已经写成的正文。本模块为已生成的章节
+维护分层的前情摘要，并在章节完成时增量更新：
+
+* 章节摘要：每章正文完成后生成一次（正文不变时不重复生成）
+* 卷摘要：按卷内顺序把连续的章节摘要每 fold_every 章折叠进卷摘要（上一版卷摘要 + 新章节摘要），
+  一卷写完时折叠剩余章节
+* 全书梗概：每写完一卷，把该卷摘要折叠进全书梗概
+
+生成某一章时，按 token 预算依次选入：最近几章的摘要、本卷摘要、全书梗概、梗概尚未覆盖的
+前几卷摘要、本卷其余章节摘要，再按时间顺序排列。每一层的长度都有上限，提示词中的前情篇幅
+不随全书长度线性增长；每次更新只处理新完成的章节，摘要调用次数与章节数成正比。
+
+已改写的章节会使覆盖它的卷摘要和全书梗概从头重新折叠。摘要函数出错时改用抽取式摘要
+（截取正文开头和结尾的句子），不影响章节生成。
+"""
+
+import os
+import re
+import json
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.job_journal import atomic_write_text, content_hash
+from utils.prompt_manager import CompiledTemplate
+from utils.token_estimator import estimate_tokens
+
+ChapterKey = Tuple[int, int]
+
+CHAPTER_SUMMARY_PARAMS = ("chapter_title", "content", "max_chars")
+CHAPTER_SUMMARY_TEMPLATE = """
+        请用不超过{max_chars}字概括下面这一章小说正文，供后续章节保持连贯使用。
+        写清发生了什么、人物的状态和关系有何变化、结尾停在什么情境，以及埋下的伏笔。
+        只返回概括本身。
+
+        章节：{chapter_title}
+        正文：
+        {content}
+        """
+
+VOLUME_SUMMARY_PARAMS = ("volume_title", "previous_summary", "chapter_summaries", "max_chars")
+VOLUME_SUMMARY_TEMPLATE = """
+        请把下面的内容合并为一卷小说到目前为止的概括，不超过{max_chars}字。
+        保留主线进展、人物的关键变化和尚未解决的伏笔，按时间顺序叙述。只返回概括本身。
+
+        卷：{volume_title}
+        已有概括：{previous_summary}
+        新增章节概括：
+        {chapter_summaries}
+        """
+
+DIGEST_PARAMS = ("previous_digest", "volume_title", "volume_summary", "max_chars")
+DIGEST_TEMPLATE = """
+        请把下面的内容合并为整部小说到目前为止的梗概，不超过{max_chars}字。
+        保留主线、主要人物的命运和仍在进行的冲突。只返回梗概本身。
+
+        已有梗概：{previous_digest}
+        新写完的一卷：{volume_title}
+        {volume_summary}
+        """
+
+# 摘要提示词只在内部使用，总是压缩空白
+SUMMARY_TEMPLATES = {
+    "chapter": CompiledTemplate(CHAPTER_SUMMARY_TEMPLATE, "rolling_chapter_summary", CHAPTER_SUMMARY_PARAMS,
+                                compact=True),
+    "volume": CompiledTemplate(VOLUME_SUMMARY_TEMPLATE, "rolling_volume_summary", VOLUME_SUMMARY_PARAMS,
+                               compact=True),
+    "digest": CompiledTemplate(DIGEST_TEMPLATE, "rolling_digest", DIGEST_PARAMS, compact=True),
+}
+
+_SENTENCE_END = re.compile(r"(?<=[。！？!?…\n])")
+
+
+def extractive_summary(text: str, max_chars: int) -> str:
+    """
+    抽取式摘要：保留开头和结尾的整句（结尾占大部分篇幅），不调用模型
+
+    Args:
+        text: 原文
+        max_chars: 最多保留的字符数
+
+    Returns:
+        摘要文本
+    """
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return text
+    sentences = [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+    head_budget = max_chars // 3
+    head: List[str] = []
+    used = 0
+    for sentence in sentences:
+        if used + len(sentence) > head_budget:
+            break
+        head.append(sentence)
+        used += len(sentence)
+    tail: List[str] = []
+    for sentence in reversed(sentences[len(head):]):
+        if used + len(sentence) + 2 > max_chars:
+            break
+        tail.append(sentence)
+        used += len(sentence)
+    if not head and not tail:
+        return text[-max_chars:]
+    return "".join(head) + "……" + "".join(reversed(tail))
+
+
+def _chapter_list(novel_data: Dict) -> List[List[Dict]]:
+    """各卷的章节大纲列表（格式不正确的卷视为没有章节）"""
+    volumes = []
+    for volume in novel_data.get("volumes", []) or []:
+        chapters = volume.get("chapters", []) if isinstance(volume, dict) else []
+        volumes.append(list(chapters) if isinstance(chapters, (list, tuple)) else [])
+    return volumes
+
+
+def _title(item: Any, fallback: str) -> str:
+    return item.get("title") or fallback if isinstance(item, dict) else fallback
+
+
+class RollingContext:
+    """分层维护的前情摘要，按 token 预算为章节提示词提供前情"""
+
+    def __init__(self, summarize: Optional[Callable[[str], Awaitable[str]]] = None,
+                 budget_tokens: int = 1500, recent_chapters: int = 3, fold_every: int = 4,
+                 chapter_summary_chars: int = 200, volume_summary_chars: int = 500,
+                 digest_chars: int = 800, path: Optional[str] = None):
+        """
+        初始化前情上下文
+
+        Args:
+            summarize: 生成摘要的协程函数，参数为提示词，返回摘要；None 时使用抽取式摘要
+            budget_tokens: 放入每章提示词的前情 token 上限
+            recent_chapters: 优先放入的最近章节摘要数
+            fold_every: 卷内每积累多少章连续的新摘要折叠一次卷摘要
+            chapter_summary_chars: 章节摘要的字数上限
+            volume_summary_chars: 卷摘要的字数上限
+            digest_chars: 全书梗概的字数上限
+            path: 保存摘要的 JSON 文件；提供时启动时读取、每次更新后原子写入
+        """
+        self.summarize = summarize
+        self.budget_tokens = budget_tokens
+        self.recent_chapters = recent_chapters
+        self.fold_every = max(1, int(fold_every))
+        self.chapter_summary_chars = chapter_summary_chars
+        self.volume_summary_chars = volume_summary_chars
+        self.digest_chars = digest_chars
+        self.path = path
+        # (卷索引, 章节索引) -> {"sha256": 正文哈希, "summary": 章节摘要}
+        self.chapters: Dict[ChapterKey, Dict[str, str]] = {}
+        # 卷索引 -> {"summary": 卷摘要, "covered": 已折叠的卷首连续章节数}
+        self.volumes: Dict[int, Dict[str, Any]] = {}
+        # 全书梗概，volumes 为已折叠的开头连续卷数
+        self.digest: Dict[str, Any] = {"summary": "", "volumes": 0}
+        self.stats = {"chapter_summaries": 0, "unchanged": 0, "volume_folds": 0, "digest_folds": 0,
+                      "fallbacks": 0, "contexts": 0, "context_tokens": 0}
+        self._lock = asyncio.Lock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path: str) -> None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"读取前情摘要文件 '{path}' 出错: {e}")
+            return
+        for key, entry in data.get("chapters", {}).items():
+            volume_index, chapter_index = key.split("_")
+            self.chapters[(int(volume_index), int(chapter_index))] = entry
+        self.volumes = {int(key): entry for key, entry in data.get("volumes", {}).items()}
+        self.digest = data.get("digest", self.digest)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        导出全部摘要
+
+        Returns:
+            可 JSON 序列化的字典
+        """
+        return {
+            "chapters": {f"{v}_{c}": entry for (v, c), entry in sorted(self.chapters.items())},
+            "volumes": {str(v): entry for v, entry in sorted(self.volumes.items())},
+            "digest": self.digest,
+        }
+
+    async def _save(self) -> None:
+        if self.path:
+            text = json.dumps(self.to_dict(), ensure_ascii=False)
+            await asyncio.to_thread(atomic_write_text, self.path, text)
+
+    async def _summarize(self, template: str, params: Dict[str, Any], fallback_text: str, max_chars: int) -> str:
+        if self.summarize is not None:
+            try:
+                summary = await self.summarize(SUMMARY_TEMPLATES[template].render({**params, "max_chars": max_chars}))
+                if summary and summary.strip():
+                    return summary.strip()
+            except Exception as e:
+                print(f"生成前情摘要出错，改用抽取式摘要: {e}")
+            self.stats["fallbacks"] += 1
+        return extractive_summary(fallback_text, max_chars)
+
+    async def add_chapter(self, novel_data: Dict, volume_index: int, chapter_index: int, content: str) -> bool:
+        """
+        章节正文完成后更新摘要：生成章节摘要，再按需折叠卷摘要和全书梗概
+
+        Args:
+            novel_data: 小说数据（包含大纲），用于章节标题和各卷章节数
+            volume_index: 卷索引
+            chapter_index: 章节索引
+            content: 章节正文
+
+        Returns:
+            是否更新了摘要（正文与上次相同时为 False）
+        """
+        key = (volume_index, chapter_index)
+        digest = content_hash(content)
+        existing = self.chapters.get(key)
+        if existing and existing.get("sha256") == digest:
+            self.stats["unchanged"] += 1
+            return False
+
+        volumes = _chapter_list(novel_data)
+        chapters = volumes[volume_index] if volume_index < len(volumes) else []
+        title = _title(chapters[chapter_index] if chapter_index < len(chapters) else None, f"第{chapter_index + 1}章")
+        summary = await self._summarize("chapter", {"chapter_title": title, "content": content},
+                                        content, self.chapter_summary_chars)
+        self.stats["chapter_summaries"] += 1
+
+        async with self._lock:
+            self.chapters[key] = {"sha256": digest, "summary": summary}
+            if existing:
+                # 改写了已折叠的章节：该卷摘要和覆盖该卷的全书梗概从头重新折叠
+                volume = self.volumes.get(volume_index)
+                if volume and chapter_index < volume.get("covered", 0):
+                    self.volumes[volume_index] = {"summary": "", "covered": 0}
+                    if self.digest.get("volumes", 0) > volume_index:
+                        self.digest = {"summary": "", "volumes": 0}
+            await self._fold(novel_data, volumes)
+            await self._save()
+        return True
+
+    async def _fold(self, novel_data: Dict, volumes: List[List[Dict]]) -> None:
+        """把卷首连续的新章节摘要折叠进卷摘要，把写完的卷折叠进全书梗概"""
+        outline_volumes = novel_data.get("volumes", []) or []
+        for volume_index, chapters in enumerate(volumes):
+            volume = self.volumes.setdefault(volume_index, {"summary": "", "covered": 0})
+            covered = volume["covered"]
+            pending = []
+            while covered + len(pending) < len(chapters) and (volume_index, covered + len(pending)) in self.chapters:
+                pending.append(covered + len(pending))
+            title = _title(outline_volumes[volume_index], f"第{volume_index + 1}卷")
+            # 每 fold_every 章折叠一次；卷内章节全部完成时折叠剩余部分
+            while pending and (len(pending) >= self.fold_every or pending[-1] == len(chapters) - 1):
+                batch, pending = pending[:self.fold_every], pending[self.fold_every:]
+                lines = "\n".join(f"{_title(chapters[i], f'第{i + 1}章')}：{self.chapters[(volume_index, i)]['summary']}"
+                                  for i in batch)
+                volume["summary"] = await self._summarize(
+                    "volume", {"volume_title": title, "previous_summary": volume["summary"] or "（无）",
+                               "chapter_summaries": lines},
+                    f"{volume['summary']}\n{lines}", self.volume_summary_chars)
+                volume["covered"] = batch[-1] + 1
+                self.stats["volume_folds"] += 1
+
+        while self.digest["volumes"] < len(volumes):
+            volume_index = self.digest["volumes"]
+            chapters = volumes[volume_index]
+            volume = self.volumes.get(volume_index, {})
+            if volume.get("covered", 0) < len(chapters):
+                break
+            if chapters:
+                title = _title(outline_volumes[volume_index], f"第{volume_index + 1}卷")
+                self.digest["summary"] = await self._summarize(
+                    "digest", {"previous_digest": self.digest["summary"] or "（无）", "volume_title": title,
+                               "volume_summary": volume["summary"]},
+                    f"{self.digest['summary']}\n{volume['summary']}", self.digest_chars)
+                self.stats["digest_folds"] += 1
+            self.digest["volumes"] = volume_index + 1
+
+    async def sync(self, novel_data: Dict, get_content: Callable[[int, int], Optional[str]],
+                   before: Optional[ChapterKey] = None) -> int:
+        """
+        为已有正文但还没有摘要（或正文已改变）的章节补上摘要
+
+        Args:
+            novel_data: 小说数据（包含大纲）
+            get_content: 读取章节正文的函数，参数为 (卷索引, 章节索引)
+            before: 只处理在该章节之前的章节，None 表示全部
+
+        Returns:
+            更新的章节数
+        """
+        updated = 0
+        for volume_index, chapters in enumerate(_chapter_list(novel_data)):
+            for chapter_index in range(len(chapters)):
+                if before is not None and (volume_index, chapter_index) >= tuple(before):
+                    return updated
+                content = await asyncio.to_thread(get_content, volume_index, chapter_index)
+                if content and await self.add_chapter(novel_data, volume_index, chapter_index, content):
+                    updated += 1
+        return updated
+
+    def context_for(self, novel_data: Dict, volume_index: int, chapter_index: int) -> str:
+        """
+        组装某一章的前情（不调用模型）
+
+        Args:
+            novel_data: 小说数据（包含大纲）
+            volume_index: 卷索引
+            chapter_index: 章节索引
+
+        Returns:
+            按时间顺序排列的前情文本，每项一行；没有可用摘要时为空字符串
+        """
+        volumes = _chapter_list(novel_data)
+        outline_volumes = novel_data.get("volumes", []) or []
+        order = [(v, c) for v, chapters in enumerate(volumes) for c in range(len(chapters))]
+        key = (volume_index, chapter_index)
+        earlier = [k for k in order if k < key and k in self.chapters]
+
+        def chapter_item(k):
+            title = _title(volumes[k[0]][k[1]], f"第{k[1] + 1}章")
+            return (k[0], k[1]), f"第{k[0] + 1}卷第{k[1] + 1}章《{title}》：{self.chapters[k]['summary']}"
+
+        def volume_title(v):
+            return _title(outline_volumes[v], f"第{v + 1}卷")
+
+        # (排序键, 文本)，按优先级排列
+        candidates: List[Tuple[Tuple[int, int], str]] = []
+        recent = earlier[-self.recent_chapters:] if self.recent_chapters > 0 else []
+        candidates.extend(chapter_item(k) for k in reversed(recent))
+
+        volume = self.volumes.get(volume_index, {})
+        # 卷摘要只在不包含本章及之后章节时使用
+        volume_start = 0
+        if volume.get("summary") and 0 < volume.get("covered", 0) <= chapter_index:
+            volume_start = volume["covered"]
+            candidates.append(((volume_index, -1),
+                               f"本卷《{volume_title(volume_index)}》前{volume['covered']}章：{volume['summary']}"))
+
+        digest_volumes = self.digest.get("volumes", 0) if self.digest.get("summary") else 0
+        if not 0 < digest_volumes <= volume_index:
+            digest_volumes = 0
+        if digest_volumes:
+            candidates.append(((-1, 0), f"全书前情（第1-{digest_volumes}卷）：{self.digest['summary']}"))
+        for v in range(volume_index - 1, digest_volumes - 1, -1):
+            summary = self.volumes.get(v, {}).get("summary")
+            if summary:
+                candidates.append(((v, -1), f"第{v + 1}卷《{volume_title(v)}》：{summary}"))
+
+        candidates.extend(chapter_item(k) for k in reversed(earlier[:len(earlier) - len(recent)])
+                          if k[0] == volume_index and k[1] >= volume_start)
+
+        selected = []
+        used = 0
+        for sort_key, text in candidates:
+            tokens = estimate_tokens(text)
+            if used + tokens > self.budget_tokens:
+                continue
+            selected.append((sort_key, text))
+            used += tokens
+        selected.sort()
+        self.stats["contexts"] += 1
+        self.stats["context_tokens"] += used
+        return "\n".join(text for _, text in selected)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取前情摘要统计
+
+        Returns:
+            包含 chapters（有摘要的章节数）、digest_volumes（全书梗概覆盖的卷数）、chapter_summaries、
+            unchanged（正文未变而跳过的次数）、volume_folds、digest_folds、fallbacks（改用抽取式摘要的次数）、
+            contexts、context_tokens（累计放入提示词的前情 token 数）的字典
+        """
+        return {"chapters": len(self.chapters), "digest_volumes": self.digest.get("volumes", 0), **self.stats}
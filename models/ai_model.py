@@ -1,7 +1,27 @@
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from utils.retry import RetryPolicy
+from utils.rate_limiter import get_concurrency_limiter, get_rate_limiter
+from utils.circuit_breaker import CircuitOpenError, get_circuit_breaker
+from utils.token_estimator import estimate_tokens
+from utils.prompt_manager import StructuredPrompt
+
+# 当前请求在TPM限流器中预扣的额度：{"model": 模型实例, "estimate": 预扣token数, "settled": 是否已按实际用量修正}
+_tpm_reservation: ContextVar = ContextVar("tpm_reservation", default=None)
 
 class AIModel(ABC):
-    """AI模型的抽象基类，定义了所有AI模型需要实现的接口"""
+    """AI模型的抽象基类，定义了所有AI模型需要实现的接口
+
+    子类实现单次请求的 ``_generate`` / ``_generate_stream``，
+    公共的 ``generate`` / ``generate_stream`` 在其外层统一施加重试和限流策略。
+    """
+
+    # 模型对应的 config.ini 配置节名称（如 'GPT'），用于读取重试、限流等按服务商区分的设置
+    config_section = None
+    # 是否能直接处理 StructuredPrompt（分开发送稳定前缀）；为 False 时先转换为完整文本
+    supports_structured_prompt = False
 
     def __init__(self, config_manager):
         """
@@ -11,12 +31,303 @@ class AIModel(ABC):
             config_manager: 配置管理器实例
         """
         self.config_manager = config_manager
-        self.proxy = config_manager.get_proxy_settings()
+        self.proxy = config_manager.get_proxy_settings() if config_manager else None
+        # 共享的HTTP会话管理器，由 NovelGenerator 注入；为 None 时每次请求使用临时会话
+        self.session_manager = None
+        self.retry_policy = RetryPolicy.from_config(config_manager, self.config_section)
+        self._rate_limiter = None
+        self._rate_limiter_resolved = False
+        self._circuit_breaker = None
+        self._circuit_breaker_resolved = False
+        # 端点熔断时接手请求的备用模型
+        self.fallback_model = None
+        # 服务端返回的用量统计（累计值），由子类通过 _record_usage 更新
+        self.usage_stats = {"requests": 0}
+
+    @property
+    def rate_limiter(self):
+        """与同一服务商、同一密钥的其他实例共享的限流器（未配置 rpm/tpm 时为 None）"""
+        # api_key 由子类在 super().__init__ 之后设置，因此延迟到首次使用时再解析
+        if not self._rate_limiter_resolved:
+            self._rate_limiter = get_rate_limiter(self.config_manager, self.config_section,
+                                                  getattr(self, 'api_key', None))
+            self._rate_limiter_resolved = True
+        return self._rate_limiter
+
+    @property
+    def concurrency_limiter(self):
+        """同一服务商共享的并发限制（未配置 max_concurrency 时为 None）"""
+        # 每次查询：当前上下文中 scoped_concurrency_limits 设置的上限优先，其次是共享表
+        return get_concurrency_limiter(self.config_manager, self.config_section)
+
+    @property
+    def endpoint(self):
+        """请求发往的端点地址，用于按地址共享熔断器"""
+        return getattr(self, 'api_url', None) or getattr(self, 'base_url', None)
+
+    @property
+    def circuit_breaker(self):
+        """与同一端点的其他实例共享的熔断器（配置 circuit_breaker = false 时为 None）"""
+        if not self._circuit_breaker_resolved:
+            self._circuit_breaker = get_circuit_breaker(self.config_manager, self.config_section, self.endpoint)
+            self._circuit_breaker_resolved = True
+        return self._circuit_breaker
+
+    def set_fallback_model(self, model):
+        """
+        设置端点熔断时接手请求的备用模型
+
+        Args:
+            model: AIModel 实例，为 None 时熔断期间直接失败
+        """
+        self.fallback_model = model
+
+    def get_generation_params(self):
+        """
+        影响输出内容的生成参数（如温度、最大token数），用于响应缓存的键
+
+        Returns:
+            参数字典，默认为空；支持此类参数的子类应覆盖
+        """
+        return {}
+
+    def _estimate_request_tokens(self, prompt):
+        """估算一次请求消耗的token数（提示词 + 预计输出），用于TPM限流"""
+        output_tokens = 0
+        if self.config_manager and self.config_section:
+            output_tokens = self.config_manager.get_config_int(
+                self.config_section, 'estimated_output_tokens', fallback=1000)
+        return estimate_tokens(str(prompt)) + output_tokens
+
+    @staticmethod
+    def _usage_tokens(usage):
+        """从 usage 字典中取出本次请求消耗的总token数，没有可识别的字段时返回 None"""
+        total = usage.get("total_tokens")
+        if isinstance(total, (int, float)):
+            return total
+        for input_name, output_name in (("prompt_tokens", "completion_tokens"),
+                                        ("input_tokens", "output_tokens"),
+                                        ("prompt_eval_count", "eval_count")):
+            if input_name in usage or output_name in usage:
+                return (usage.get(input_name) or 0) + (usage.get(output_name) or 0)
+        return None
+
+    def _record_usage(self, usage):
+        """
+        累计服务端返回的用量字段（只累计数值字段），并用实际token数修正本次请求预扣的TPM额度
+
+        Args:
+            usage: 响应中的 usage 字典，可为 None
+        """
+        if not usage:
+            return
+        reservation = _tpm_reservation.get()
+        if reservation is not None and reservation["model"] is self and not reservation["settled"]:
+            actual = self._usage_tokens(usage)
+            if actual is not None and self.rate_limiter:
+                self.rate_limiter.record_usage(reservation["estimate"], actual)
+                reservation["settled"] = True
+        self.usage_stats["requests"] += 1
+        for name, value in usage.items():
+            if isinstance(value, dict):
+                # OpenAI 兼容接口的明细字段，如 prompt_tokens_details.cached_tokens，按内层名称累计
+                for detail_name, detail_value in value.items():
+                    if isinstance(detail_value, (int, float)) and not isinstance(detail_value, bool):
+                        self.usage_stats[detail_name] = self.usage_stats.get(detail_name, 0) + detail_value
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.usage_stats[name] = self.usage_stats.get(name, 0) + value
+
+    def _chat_messages(self, prompt):
+        """
+        构建 OpenAI 兼容接口的 messages 列表
+
+        StructuredPrompt 的稳定前缀作为 system 消息放在最前，每次请求不同的内容作为
+        随后的 user 消息，使服务端的自动前缀缓存能够在同一部小说的请求之间命中。
+
+        Args:
+            prompt: 字符串或 StructuredPrompt
+
+        Returns:
+            messages 列表
+        """
+        if isinstance(prompt, StructuredPrompt):
+            messages = []
+            if prompt.system:
+                messages.append({"role": "system", "content": prompt.system})
+            messages.append({"role": "user", "content": prompt.user})
+            return messages
+        return [{"role": "user", "content": prompt}]
+
+    def _stream_options(self):
+        """
+        OpenAI 兼容接口流式请求的 stream_options（要求在最后一个事件中返回用量）
+
+        Returns:
+            字典；配置 stream_usage = false 时返回 None（用于不支持该字段的服务）
+        """
+        if self.config_manager and self.config_section and not self.config_manager.get_config_bool(
+                self.config_section, 'stream_usage', fallback=True):
+            return None
+        return {"include_usage": True}
+
+    def get_usage_stats(self):
+        """
+        获取累计的用量统计
+
+        Returns:
+            字典，requests 为带用量信息的响应数，其余字段为各用量字段的累计值
+            （如 Claude 的 cache_read_input_tokens、OpenAI 兼容接口的 cached_tokens）
+        """
+        return dict(self.usage_stats)
+
+    def set_session_manager(self, session_manager):
+        """
+        设置共享的HTTP会话管理器
+
+        Args:
+            session_manager: HTTPSessionManager 实例
+        """
+        self.session_manager = session_manager
+
+    @asynccontextmanager
+    async def _http_session(self):
+        """获取用于发送请求的aiohttp会话（优先使用共享会话）"""
+        if self.session_manager is not None:
+            yield await self.session_manager.get_session()
+            return
+
+        import aiohttp
+        async with aiohttp.ClientSession() as session:
+            yield session
+
+    async def aclose(self):
+        """释放模型持有的资源（后台任务、连接等）"""
+        pass
 
-    @abstractmethod
     async def generate(self, prompt, callback=None):
         """
-        生成文本（非流式）
+        生成文本（非流式），对可重试的错误按 retry_policy 自动重试
+
+        Args:
+            prompt: 提示词
+            callback: 回调函数，用于处理生成的文本块
+
+        Returns:
+            生成的文本
+        """
+        try:
+            return await self.retry_policy.call(self._attempt, prompt, callback)
+        except CircuitOpenError as e:
+            if self.fallback_model is None:
+                raise
+            print(f"{e}，改用备用模型")
+            return await self.fallback_model.generate(prompt, callback)
+
+    async def generate_stream(self, prompt, callback=None):
+        """
+        流式生成文本，在尚未产出任何内容前出错时按 retry_policy 自动重试
+
+        Args:
+            prompt: 提示词
+            callback: 回调函数，用于处理生成的文本块
+
+        Returns:
+            生成的文本流（异步生成器）
+        """
+        try:
+            async for chunk in self.retry_policy.stream(self._attempt_stream, prompt, callback):
+                yield chunk
+            return
+        except CircuitOpenError as e:
+            # 熔断在请求发出前触发，此时尚未产出任何内容，可以安全地整体交给备用模型
+            if self.fallback_model is None:
+                raise
+            print(f"{e}，改用备用模型")
+        async for chunk in self.fallback_model.generate_stream(prompt, callback):
+            yield chunk
+
+    async def _attempt(self, prompt, callback=None):
+        """单次非流式尝试：检查熔断状态、等待并发名额和限流额度，再发送请求"""
+        if not self.supports_structured_prompt:
+            prompt = str(prompt)
+        breaker = self.circuit_breaker
+        if breaker:
+            breaker.before_request()
+        limiter = self.concurrency_limiter
+        try:
+            if limiter:
+                await limiter.acquire()
+            try:
+                # 名额取得之后才进入 try，等待名额时被取消不会多归还
+                reservation_token = None
+                if self.rate_limiter:
+                    estimate = self._estimate_request_tokens(prompt)
+                    await self.rate_limiter.acquire(estimate)
+                    # _generate 中的 _record_usage 按实际用量修正预扣额度
+                    reservation_token = _tpm_reservation.set({"model": self, "estimate": estimate, "settled": False})
+                try:
+                    result = await self._generate(prompt, callback)
+                finally:
+                    if reservation_token is not None:
+                        _tpm_reservation.reset(reservation_token)
+            finally:
+                if limiter:
+                    limiter.release()
+        except BaseException as e:
+            if breaker:
+                breaker.record(e)
+            raise
+        if breaker:
+            breaker.record(None)
+        return result
+
+    async def _attempt_stream(self, prompt, callback=None):
+        """单次流式尝试：检查熔断状态、等待并发名额和限流额度，再发送请求（整个流结束前占用并发名额）
+
+        收到第一个文本块即视为端点可用。
+        """
+        if not self.supports_structured_prompt:
+            prompt = str(prompt)
+        breaker = self.circuit_breaker
+        if breaker:
+            breaker.before_request()
+        recorded = breaker is None
+        limiter = self.concurrency_limiter
+        acquired = False
+        reservation = None
+        try:
+            if limiter:
+                await limiter.acquire()
+                acquired = True
+            if self.rate_limiter:
+                estimate = self._estimate_request_tokens(prompt)
+                await self.rate_limiter.acquire(estimate)
+                # 流的各部分在调用方的上下文中执行，不能可靠地 reset；结束时标记为已修正即可
+                reservation = {"model": self, "estimate": estimate, "settled": False}
+                _tpm_reservation.set(reservation)
+            async for chunk in self._generate_stream(prompt, callback):
+                if not recorded:
+                    breaker.record(None)
+                    recorded = True
+                yield chunk
+        except BaseException as e:
+            if not recorded:
+                breaker.record(e)
+                recorded = True
+            raise
+        finally:
+            if reservation is not None:
+                reservation["settled"] = True
+            if acquired:
+                limiter.release()
+            if not recorded:
+                # 流正常结束但没有任何内容，或被调用方提前关闭
+                breaker.record(None)
+
+    @abstractmethod
+    async def _generate(self, prompt, callback=None):
+        """
+        发送一次非流式请求
 
         Args:
             prompt: 提示词
@@ -28,9 +339,9 @@ class AIModel(ABC):
         pass
 
     @abstractmethod
-    async def generate_stream(self, prompt, callback=None):
+    async def _generate_stream(self, prompt, callback=None):
         """
-        流式生成文本
+        发送一次流式请求
 
         Args:
             prompt: 提示词
@@ -39,4 +350,56 @@ class AIModel(ABC):
         Returns:
             生成的文本流（异步生成器）
         """
-        pass
\ No newline at end of file
+        pass
+
+
+class ModelWrapper(AIModel):
+    """包装另一个模型的基类
+
+    请求直接转发给内层模型（重试、限流由内层负责，不会重复施加）。
+    未定义的属性（如 model_name、api_key）从内层模型读取。
+    """
+
+    def __init__(self, inner: AIModel):
+        """
+        初始化包装模型
+
+        Args:
+            inner: 被包装的模型实例
+        """
+        super().__init__(inner.config_manager)
+        self.inner = inner
+        self.config_section = inner.config_section
+
+    def __getattr__(self, name):
+        # 仅在常规属性查找失败时调用；inner 尚未设置时避免无限递归
+        if name == 'inner':
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def set_session_manager(self, session_manager):
+        super().set_session_manager(session_manager)
+        self.inner.set_session_manager(session_manager)
+
+    def get_generation_params(self):
+        return self.inner.get_generation_params()
+
+    def get_usage_stats(self):
+        return self.inner.get_usage_stats()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+    async def generate(self, prompt, callback=None):
+        return await self._generate(prompt, callback)
+
+    async def generate_stream(self, prompt, callback=None):
+        async for chunk in self._generate_stream(prompt, callback):
+            yield chunk
+
+    async def _generate(self, prompt, callback=None):
+        return await self.inner.generate(prompt, callback)
+
+    async def _generate_stream(self, prompt, callback=None):
+        async for chunk in self.inner.generate_stream(prompt, callback):
+            yield chunk
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+带响应缓存的模型
+
+命中缓存时直接返回保存的文本；流式调用把缓存的文本重新作为流产出
+（整段产出，或按指定字数切块）。只有完整结束的响应才会被写入缓存。
+"""
+
+import asyncio
+from typing import Optional
+
+from .ai_model import AIModel, ModelWrapper
+from utils.response_cache import ResponseCache, make_cache_key
+
+
+class CachedModel(ModelWrapper):
+    """在任意模型外层加上持久化响应缓存"""
+
+    def __init__(self, inner: AIModel, cache: ResponseCache, replay_chunk_size: Optional[int] = None):
+        """
+        初始化缓存模型
+
+        Args:
+            inner: 被包装的模型
+            cache: 响应缓存，可以在多个模型间共享
+            replay_chunk_size: 流式回放时每块的字数，为 None 时整段作为一块产出
+        """
+        super().__init__(inner)
+        self.cache = cache
+        self.replay_chunk_size = replay_chunk_size
+
+    def _provider(self) -> str:
+        return self.inner.config_section or type(self.inner).__name__
+
+    def cache_key(self, prompt) -> str:
+        """计算提示词在当前模型和生成参数下的缓存键"""
+        return make_cache_key(self._provider(), getattr(self.inner, 'model_name', None),
+                              str(prompt), self.inner.get_generation_params())
+
+    async def _generate(self, prompt, callback=None):
+        key = self.cache_key(prompt)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        # 空内容视为未命中（旧版本可能缓存过空响应）
+        if cached:
+            return cached
+        result = await self.inner.generate(prompt, callback)
+        # 空响应多为偶发错误，不缓存，下次仍会请求模型
+        if isinstance(result, str) and result:
+            await asyncio.to_thread(self.cache.put, key, result, self._provider(),
+                                    getattr(self.inner, 'model_name', None))
+        return result
+
+    async def _generate_stream(self, prompt, callback=None):
+        key = self.cache_key(prompt)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        # 空内容视为未命中（旧版本可能缓存过空响应）
+        if cached:
+            size = self.replay_chunk_size or len(cached)
+            for start in range(0, len(cached), size):
+                chunk = cached[start:start + size]
+                if callback:
+                    callback(chunk)
+                yield chunk
+            return
+
+        parts = []
+        async for chunk in self.inner.generate_stream(prompt, callback):
+            # 部分适配器对 content 为 null 的增量会产出 None，不计入缓存内容
+            if chunk and isinstance(chunk, str):
+                parts.append(chunk)
+            yield chunk
+        # 只有流完整结束（没有异常、没有被调用方提前关闭）时才会执行到这里
+        text = "".join(parts)
+        if text:
+            await asyncio.to_thread(self.cache.put, key, text, self._provider(),
+                                    getattr(self.inner, 'model_name', None))
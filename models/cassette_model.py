@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+录制/回放模型
+
+RecordingModel 把经过它的每次请求和响应（包括流式响应的分块边界和块间间隔）
+写入录制文件；ReplayModel 不访问网络，按录制文件回放响应，时间间隔可以保持原样、
+按比例缩放或完全去掉，用于在没有网络的CI机器上可重复地测试整条生成流程的性能。
+"""
+
+import time
+import asyncio
+
+from .ai_model import AIModel, ModelWrapper
+from utils.cassette import Cassette
+
+
+class RecordingModel(ModelWrapper):
+    """把请求和响应录制到 Cassette 的包装模型"""
+
+    def __init__(self, inner: AIModel, cassette: Cassette):
+        """
+        初始化录制模型
+
+        Args:
+            inner: 被包装的模型
+            cassette: 录制文件
+        """
+        super().__init__(inner)
+        self.cassette = cassette
+
+    def _record_base(self, record_type, prompt):
+        return {
+            "type": record_type,
+            "provider": self.inner.config_section or type(self.inner).__name__,
+            "model_name": getattr(self.inner, 'model_name', None),
+            "prompt": str(prompt),
+        }
+
+    async def _generate(self, prompt, callback=None):
+        started_at = time.monotonic()
+        result = await self.inner.generate(prompt, callback)
+        record = self._record_base("generate", prompt)
+        record["response"] = result
+        record["latency"] = round(time.monotonic() - started_at, 6)
+        await asyncio.to_thread(self.cassette.append, record)
+        return result
+
+    async def _generate_stream(self, prompt, callback=None):
+        chunks = []
+        last = time.monotonic()
+        async for chunk in self.inner.generate_stream(prompt, callback):
+            now = time.monotonic()
+            chunks.append([round(now - last, 6), chunk])
+            last = now
+            yield chunk
+        # 只录制完整结束的流
+        record = self._record_base("stream", prompt)
+        record["chunks"] = chunks
+        await asyncio.to_thread(self.cassette.append, record)
+
+
+class ReplayModel(AIModel):
+    """按录制文件回放响应的模型，不发出任何网络请求"""
+
+    def __init__(self, cassette_path: str, time_scale: float = 1.0, config_manager=None):
+        """
+        初始化回放模型
+
+        Args:
+            cassette_path: 录制文件路径
+            time_scale: 时间缩放比例；1.0 保持录制时的间隔，0.5 快一倍，0 不等待
+            config_manager: 配置管理器实例，可为 None
+        """
+        super().__init__(config_manager)
+        self.cassette = Cassette(cassette_path)
+        self.cassette.load()
+        self.time_scale = time_scale
+        self.model_name = f"replay:{cassette_path}"
+
+    def _find(self, prompt, record_type):
+        record = self.cassette.find(str(prompt), record_type)
+        if record is None:
+            raise ValueError(f"录制文件 {self.cassette.path} 中没有该提示词的记录")
+        return record
+
+    async def _sleep(self, seconds):
+        if self.time_scale > 0 and seconds > 0:
+            await asyncio.sleep(seconds * self.time_scale)
+
+    async def _generate(self, prompt, callback=None):
+        record = self._find(prompt, "generate")
+        if record.get("type") == "stream":
+            await self._sleep(sum(delay for delay, _ in record["chunks"]))
+            return "".join(text for _, text in record["chunks"])
+        await self._sleep(record.get("latency", 0))
+        return record["response"]
+
+    async def _generate_stream(self, prompt, callback=None):
+        record = self._find(prompt, "stream")
+        if record.get("type") == "generate":
+            chunks = [[record.get("latency", 0), record["response"]]]
+        else:
+            chunks = record["chunks"]
+        for delay, text in chunks:
+            await self._sleep(delay)
+            if callback:
+                callback(text)
+            yield text
@@ -1,11 +1,15 @@
-import aiohttp
-import json
 import asyncio
 from .ai_model import AIModel
+from utils.retry import APIError
+from utils.stream_framing import iter_sse_json
+from utils.prompt_manager import StructuredPrompt
 
 class ClaudeModel(AIModel):
     """Anthropic Claude模型实现"""
 
+    config_section = 'CLAUDE'
+    supports_structured_prompt = True
+
     def __init__(self, config=None, config_manager=None): # Added config parameter
         """
         初始化Claude模型
@@ -56,18 +60,24 @@ class ClaudeModel(AIModel):
                     default_model = config_manager.get_config('CLAUDE', 'default_model_name', fallback=default_model)
                 self.model_name = default_model
 
-    async def generate(self, prompt, callback=None):
-        """
-        生成文本（非流式）
+        # Messages API 要求 max_tokens
+        self.max_tokens = int((config and config.get('max_tokens')) or
+                              (config_manager and config_manager.get_config_int('CLAUDE', 'max_tokens', fallback=None)) or
+                              4096)
 
-        Args:
-            prompt: 提示词
-            callback: 回调函数，用于处理生成的文本块
+    def get_generation_params(self):
+        return {"max_tokens": self.max_tokens}
 
-        Returns:
-            生成的文本
+    def _build_request(self, prompt, stream):
         """
+        构建请求头和请求体
 
+        prompt 可以是：
+        * 字符串：作为一条用户消息发送；
+        * StructuredPrompt：稳定前缀作为 system 内容块发送并加上 cache_control 断点，
+          同一部小说的后续请求可以直接读取服务端缓存；
+        * 内容块列表：原样作为用户消息的 content 发送（调用方可自行设置 cache_control）。
+        """
         headers = {
             "Content-Type": "application/json",
             "x-api-key": self.api_key,
@@ -76,11 +86,35 @@ class ClaudeModel(AIModel):
 
         data = {
             "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
-            "stream": False
+            "max_tokens": self.max_tokens,
+            "stream": stream
         }
+        if isinstance(prompt, StructuredPrompt):
+            if prompt.system:
+                system_block = {"type": "text", "text": prompt.system}
+                if prompt.cacheable:
+                    system_block["cache_control"] = {"type": "ephemeral"}
+                data["system"] = [system_block]
+            data["messages"] = [{"role": "user", "content": prompt.user}]
+        else:
+            data["messages"] = [{"role": "user", "content": prompt if isinstance(prompt, list) else str(prompt)}]
+        return headers, data
+
+    async def _generate(self, prompt, callback=None):
+        """
+        生成文本（非流式）
 
-        async with aiohttp.ClientSession() as session:
+        Args:
+            prompt: 提示词
+            callback: 回调函数，用于处理生成的文本块
+
+        Returns:
+            生成的文本
+        """
+
+        headers, data = self._build_request(prompt, stream=False)
+
+        async with self._http_session() as session:
             async with session.post(
                 self.api_url,
                 headers=headers,
@@ -88,13 +122,14 @@ class ClaudeModel(AIModel):
                 proxy=self.proxy["https"] if self.proxy else None
             ) as response:
                 if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Anthropic API错误: {response.status} - {error_text}")
+                    raise await APIError.from_response(response, "Anthropic")
 
                 result = await response.json()
+                # 包含 cache_creation_input_tokens / cache_read_input_tokens
+                self._record_usage(result.get("usage"))
                 return result["content"][0]["text"]
 
-    async def generate_stream(self, prompt, callback=None):
+    async def _generate_stream(self, prompt, callback=None):
         """
         流式生成文本
 
@@ -106,19 +141,9 @@ class ClaudeModel(AIModel):
             生成的文本流（异步生成器）
         """
 
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01"
-        }
-
-        data = {
-            "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
-            "stream": True
-        }
+        headers, data = self._build_request(prompt, stream=True)
 
-        async with aiohttp.ClientSession() as session:
+        async with self._http_session() as session:
             async with session.post(
                 self.api_url,
                 headers=headers,
@@ -126,19 +151,19 @@ class ClaudeModel(AIModel):
                 proxy=self.proxy["https"] if self.proxy else None
             ) as response:
                 if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Anthropic API错误: {response.status} - {error_text}")
-
-                async for line in response.content:
-                    line = line.decode('utf-8').strip()
-                    if not line or line == "data: [DONE]":
-                        continue
-                    if line.startswith("data: "):
-                        json_str = line[6:]
-                        try:
-                            data = json.loads(json_str)
-                            delta = data.get("delta", {})
-                            if delta.get("type") == "text_delta":
-                                yield delta.get("text", "")
-                        except json.JSONDecodeError:
-                            continue
\ No newline at end of file
+                    raise await APIError.from_response(response, "Anthropic")
+
+                usage = {}
+                async for event, data in iter_sse_json(response.content.iter_any()):
+                    event_type = data.get("type", event)
+                    if event_type == "content_block_delta":
+                        delta = data.get("delta", {})
+                        if delta.get("type") == "text_delta":
+                            yield delta.get("text", "")
+                    elif event_type == "message_start":
+                        # 输入token数和缓存读写token数在 message_start 中给出
+                        usage.update(data.get("message", {}).get("usage") or {})
+                    elif event_type == "message_delta":
+                        # 最终的输出token数在 message_delta 中给出
+                        usage.update(data.get("usage") or {})
+                self._record_usage(usage)
\ No newline at end of file
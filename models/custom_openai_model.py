@@ -2,13 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import aiohttp
-import json
 import asyncio
 from .ai_model import AIModel # Changed import
+from utils.retry import APIError, is_retryable_error
+from utils.stream_framing import iter_sse_json
 
 class CustomOpenAIModel(AIModel):
     """自定义OpenAI兼容API模型实现"""
 
+    config_section = 'CUSTOM_OPENAI'
+    supports_structured_prompt = True
+
     def __init__(self, config=None, config_manager=None): # Renamed model_config to config for consistency
         """
         初始化自定义OpenAI兼容模型
@@ -85,7 +89,39 @@ class CustomOpenAIModel(AIModel):
             if not self.api_url:
                 raise ValueError(f"模型 '{self.name}' 的API地址未配置")
 
-    async def generate(self, prompt, callback=None):
+    @property
+    def models_url(self):
+        """OpenAI兼容服务的模型列表地址，用于健康检查"""
+        base = self.api_url.rstrip('/')
+        if base.endswith('/chat/completions'):
+            base = base[:-len('/chat/completions')]
+        return base + '/models'
+
+    async def health_check(self, timeout=5.0):
+        """
+        检查服务是否可用（请求模型列表接口）
+
+        Args:
+            timeout: 超时时间（秒）
+
+        Returns:
+            服务返回200时为 True，否则为 False
+        """
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        proxy = self.proxy.get("https") if self.proxy else None
+        try:
+            async with self._http_session() as session:
+                async with session.get(
+                    self.models_url,
+                    headers=headers,
+                    proxy=proxy,
+                    timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as response:
+                    return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def _generate(self, prompt, callback=None):
         """
         生成文本（非流式）
 
@@ -99,7 +135,7 @@ class CustomOpenAIModel(AIModel):
         # 构建请求数据
         data = {
             "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": self._chat_messages(prompt),
             "stream": False
         }
 
@@ -115,7 +151,7 @@ class CustomOpenAIModel(AIModel):
             proxy = self.proxy.get("https")
 
         try:
-            async with aiohttp.ClientSession() as session:
+            async with self._http_session() as session:
                 async with session.post(
                     self.api_url,
                     json=data,
@@ -124,10 +160,10 @@ class CustomOpenAIModel(AIModel):
                     timeout=aiohttp.ClientTimeout(total=120)
                 ) as response:
                     if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"API请求失败: {response.status}, {error_text}")
+                        raise await APIError.from_response(response, self.name)
 
                     result = await response.json()
+                    self._record_usage(result.get("usage"))
 
                     # 解析响应
                     if "choices" in result and len(result["choices"]) > 0:
@@ -138,10 +174,14 @@ class CustomOpenAIModel(AIModel):
 
                     # 如果无法解析，返回原始响应
                     return str(result)
+        except APIError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise APIError(f"网络或请求错误: {str(e)}", retryable=is_retryable_error(e)) from e
         except Exception as e:
             raise Exception(f"生成文本时出错: {str(e)}")
 
-    async def generate_stream(self, prompt, callback=None):
+    async def _generate_stream(self, prompt, callback=None):
         """
         流式生成文本
 
@@ -155,9 +195,12 @@ class CustomOpenAIModel(AIModel):
         # 构建请求数据
         data = {
             "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": self._chat_messages(prompt),
             "stream": True
         }
+        stream_options = self._stream_options()
+        if stream_options:
+            data["stream_options"] = stream_options
 
         # 构建请求头
         headers = {
@@ -171,7 +214,7 @@ class CustomOpenAIModel(AIModel):
             proxy = self.proxy.get("https")
 
         try:
-            async with aiohttp.ClientSession() as session:
+            async with self._http_session() as session:
                 async with session.post(
                     self.api_url,
                     json=data,
@@ -180,37 +223,29 @@ class CustomOpenAIModel(AIModel):
                     timeout=aiohttp.ClientTimeout(total=300)
                 ) as response:
                     if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"API请求失败: {response.status}, {error_text}")
+                        raise await APIError.from_response(response, self.name)
 
                     # 处理流式响应
-                    async for line in response.content:
-                        line = line.decode('utf-8').strip()
-                        if line:
-                            # 跳过空行和"data: [DONE]"
-                            if line == "data: [DONE]":
+                    usage = None
+                    async for _, data in iter_sse_json(response.content.iter_any()):
+                        # 用量在最后的事件中给出（部分服务每个事件都带累计值，取最后一个）
+                        usage = data.get("usage") or usage
+                        if "choices" in data and len(data["choices"]) > 0:
+                            choice = data["choices"][0]
+                            if "delta" in choice and "content" in choice["delta"]:
+                                chunk = choice["delta"]["content"]
+                            elif "text" in choice:
+                                chunk = choice["text"]
+                            else:
                                 continue
 
-                            # 处理"data: "前缀
-                            if line.startswith("data: "):
-                                line = line[6:]
-
-                            try:
-                                data = json.loads(line)
-                                if "choices" in data and len(data["choices"]) > 0:
-                                    choice = data["choices"][0]
-                                    if "delta" in choice and "content" in choice["delta"]:
-                                        chunk = choice["delta"]["content"]
-                                    elif "text" in choice:
-                                        chunk = choice["text"]
-                                    else:
-                                        continue
-
-                                    if callback:
-                                        callback(chunk)
-                                    yield chunk
-                            except json.JSONDecodeError:
-                                # 忽略无法解析的行
-                                continue
+                            if callback:
+                                callback(chunk)
+                            yield chunk
+                    self._record_usage(usage)
+        except APIError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise APIError(f"流式网络或请求错误: {str(e)}", retryable=is_retryable_error(e)) from e
         except Exception as e:
             raise Exception(f"流式生成文本时出错: {str(e)}")
\ No newline at end of file
@@ -1,10 +1,13 @@
 from google import genai
-import asyncio
+from google.genai import errors, types
 from .ai_model import AIModel # Changed import
+from utils.retry import APIError
 
 class GeminiModel(AIModel):
     """Google Gemini模型实现"""
 
+    config_section = 'GEMINI'
+
     def __init__(self, config=None, config_manager=None): # Added config parameter
         """
         初始化Gemini模型
@@ -46,65 +49,55 @@ class GeminiModel(AIModel):
                     default_model = config_manager.get_config('GEMINI', 'default_model_name', fallback=default_model)
                 self.model_name = default_model
         
-        # Base URL for Gemini is not typically changed like OpenAI, but could be added if needed
-        # self.base_url = (config and config.get('base_url')) or \
-        #                (config_manager and config_manager.get_config('GEMINI', 'base_url', fallback=None))
-        # If base_url is used, genai.configure might need client_options.
-
-        # 配置代理 - This part is tricky as genai SDK might not use env vars directly
-        # or might require specific http client configuration.
-        # For library use, relying on system-wide proxy or user configuring their env is safer
-        # than the library trying to manipulate os.environ directly during __init__.
-        # If proxy settings are passed in `config` or `config_manager`, they should be
-        # used to configure the `genai.GenerativeModel` if its API allows.
-        # For now, removing direct os.environ manipulation from __init__.
-        # The user of the library would be responsible for ensuring proxy is set up
-        # if they provide proxy details through config_manager.
-        # if self.proxy:
-        #     import os
-        #     proxy_url = self.proxy.get("https") # Assuming self.proxy is populated by super().__init__
-        #     if proxy_url:
-        #          # This is generally not recommended for libraries to set global env vars.
-        #          # os.environ["HTTP_PROXY"] = proxy_url
-        #          # os.environ["HTTPS_PROXY"] = proxy_url
-        #          pass # Log a warning or note that proxy needs to be set externally for genai
-
-        # 初始化Gemini API客户端
-        # It's better to configure genai per instance if possible, or ensure api_key is set before model init.
-        # genai.configure(api_key=self.api_key) # Global configuration, might affect other instances.
-        # Consider if genai.GenerativeModel can take api_key directly or via client_options.
-        # As of recent versions, genai.configure is the primary way.
-        # This should be called once, or be idempotent.
+        # 可选的自定义API地址（如经由网关转发）
+        self.base_url = (config and config.get('base_url')) or \
+                        (config_manager and config_manager.get_config('GEMINI', 'base_url', fallback=None))
+
+        # 每个实例持有独立的客户端和凭据，不再调用全局的 genai.configure，
+        # 因此多个使用不同密钥的 Gemini 实例可以并存。
+        # 代理设置通过 http_options 传给SDK底层的异步HTTP客户端。
+        http_options = {}
+        if self.base_url:
+            http_options['base_url'] = self.base_url
+        proxy_url = self.proxy.get("https") if self.proxy and isinstance(self.proxy, dict) else None
+        if proxy_url:
+            http_options['async_client_args'] = {'proxy': proxy_url}
+
         try:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel(self.model_name)
+            self.client = genai.Client(
+                api_key=self.api_key,
+                http_options=types.HttpOptions(**http_options) if http_options else None
+            )
         except Exception as e:
             raise ConnectionError(f"Failed to initialize Gemini model '{self.model_name}': {e}")
 
+    @property
+    def endpoint(self):
+        """请求发往的端点地址，用于按地址共享熔断器"""
+        return self.base_url or 'https://generativelanguage.googleapis.com'
 
-    async def generate(self, prompt, callback=None):
+    async def _generate(self, prompt, callback=None):
         """
         生成文本（非流式）
 
         Args:
             prompt: 提示词
-            callback: 回调函数，用于处理生成的文本块 (not used in this sync wrapper)
+            callback: 回调函数，用于处理生成的文本块 (not used in non-streaming)
 
         Returns:
             生成的文本
         """
-
-        # 在事件循环中运行同步API调用
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None, # Uses the default ThreadPoolExecutor
-            self.model.generate_content, # Method to call
-            prompt # Arguments to the method
-        )
-
-        return response.text
-
-    async def generate_stream(self, prompt, callback=None):
+        # 使用SDK的原生异步客户端，不占用线程池，也不阻塞事件循环
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=prompt
+            )
+        except errors.APIError as e:
+            raise APIError(f"Gemini API错误: {e.code} - {e.message}", status=e.code) from e
+        return response.text or ""
+
+    async def _generate_stream(self, prompt, callback=None):
         """
         流式生成文本
 
@@ -115,61 +108,21 @@ class GeminiModel(AIModel):
         Returns:
             生成的文本流（异步生成器）
         """
+        try:
+            response_stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=prompt
+            )
 
-        # 在事件循环中运行同步API调用 that returns an iterator
-        loop = asyncio.get_event_loop()
-        response_stream = await loop.run_in_executor(
-            None,
-            self.model.generate_content,
-            prompt,
-            {"stream": True} # Pass stream=True as part of generation_config or directly if API supports
-        )
-        # The above might need adjustment based on how google-generativeai handles stream=True
-        # If generate_content itself returns an iterable when stream=True, this is fine.
-        # Otherwise, a specific stream method might be needed.
-        # Assuming `model.generate_content(prompt, stream=True)` is the correct way.
-
-        # 处理流式响应
-        for chunk in response_stream: # Iterate over the synchronous iterator
-            chunk_text = ""
-            if hasattr(chunk, 'text'):
-                chunk_text = chunk.text
-            # Gemini API might have a different structure for streaming chunks
-            # This part needs to be aligned with the actual structure of `chunk` objects
-            # from `generate_content(..., stream=True)`
-            # For example, it might be chunk.parts[0].text
-
-            if chunk_text:
-                if callback:
-                    # If callback is async, it needs to be awaited or scheduled
-                    # For simplicity, assuming callback is a sync function here
-                    callback(chunk_text)
-                yield chunk_text
-            await asyncio.sleep(0) # Yield control to the event loop
-
-
-    # _process_stream might not be needed if the main generate_stream directly iterates
-    # and yields. The original _process_stream was designed for a different stream object.
-    # Keeping it for reference but it might be replaced by direct iteration in generate_stream.
-    async def _process_stream(self, response_stream): # This might be redundant
-        """
-        处理Gemini流式响应 (Potentially redundant if generate_content(stream=True) is directly iterable)
-
-        Args:
-            response_stream: Gemini流式响应
-
-        Yields:
-            文本块
-        """
-        for chunk in response_stream:
-            chunk_text = ""
-            if hasattr(chunk, 'text'):
+            async for chunk in response_stream:
                 chunk_text = chunk.text
-            elif hasattr(chunk, 'parts') and chunk.parts: # Common structure for Gemini
-                chunk_text = chunk.parts[0].text
-            # Add more specific error handling or structure checking if needed
-
-            if chunk_text:
-                yield chunk_text
-
-            await asyncio.sleep(0) # Give async event loop a chance to run other tasks
\ No newline at end of file
+                if chunk_text:
+                    if callback:
+                        callback(chunk_text)
+                    yield chunk_text
+        except errors.APIError as e:
+            raise APIError(f"Gemini API错误: {e.code} - {e.message}", status=e.code) from e
+
+    async def aclose(self):
+        """关闭此实例的异步HTTP客户端"""
+        await self.client.aio.aclose()
@@ -1,11 +1,14 @@
-import aiohttp
-import json
 import asyncio
 from .ai_model import AIModel # Changed import
+from utils.retry import APIError
+from utils.stream_framing import iter_sse_json
 
 class GPTModel(AIModel):
     """OpenAI GPT模型实现"""
 
+    config_section = 'GPT'
+    supports_structured_prompt = True
+
     def __init__(self, config=None, config_manager=None): # Added config parameter
         """
         初始化GPT模型
@@ -57,7 +60,7 @@ class GPTModel(AIModel):
                     default_model = config_manager.get_config('GPT', 'default_model_name', fallback=default_model)
                 self.model_name = default_model
 
-    async def generate(self, prompt, callback=None):
+    async def _generate(self, prompt, callback=None):
         """
         生成文本（非流式）
 
@@ -76,11 +79,11 @@ class GPTModel(AIModel):
 
         data = {
             "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": self._chat_messages(prompt),
             "stream": False
         }
 
-        async with aiohttp.ClientSession() as session:
+        async with self._http_session() as session:
             async with session.post(
                 self.api_url,
                 headers=headers,
@@ -88,13 +91,13 @@ class GPTModel(AIModel):
                 proxy=self.proxy["https"] if self.proxy else None
             ) as response:
                 if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"OpenAI API错误: {response.status} - {error_text}")
+                    raise await APIError.from_response(response, "OpenAI")
 
                 result = await response.json()
+                self._record_usage(result.get("usage"))
                 return result["choices"][0]["message"]["content"]
 
-    async def generate_stream(self, prompt, callback=None):
+    async def _generate_stream(self, prompt, callback=None):
         """
         流式生成文本
 
@@ -113,11 +116,14 @@ class GPTModel(AIModel):
 
         data = {
             "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": self._chat_messages(prompt),
             "stream": True
         }
+        stream_options = self._stream_options()
+        if stream_options:
+            data["stream_options"] = stream_options
 
-        async with aiohttp.ClientSession() as session:
+        async with self._http_session() as session:
             async with session.post(
                 self.api_url,
                 headers=headers,
@@ -125,19 +131,13 @@ class GPTModel(AIModel):
                 proxy=self.proxy["https"] if self.proxy else None
             ) as response:
                 if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"OpenAI API错误: {response.status} - {error_text}")
-
-                async for line in response.content:
-                    line = line.decode('utf-8').strip()
-                    if line == "data: [DONE]":
-                        break
-                    if line.startswith("data: "):
-                        json_str = line[6:]
-                        try:
-                            data = json.loads(json_str)
-                            content = data.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                            if content:
-                                yield content
-                        except json.JSONDecodeError:
-                            continue
\ No newline at end of file
+                    raise await APIError.from_response(response, "OpenAI")
+
+                usage = None
+                async for _, data in iter_sse_json(response.content.iter_any()):
+                    # include_usage 时最后一个事件的 choices 为空，只带 usage
+                    usage = data.get("usage") or usage
+                    content = (data.get("choices") or [{}])[0].get("delta", {}).get("content", "")
+                    if content:
+                        yield content
+                self._record_usage(usage)
\ No newline at end of file
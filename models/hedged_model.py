@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对冲请求模型
+
+流式生成时，如果主模型在给定延迟内还没有产出第一个文本块，
+就把同一提示词再发给备用模型；两路中先产出第一个块的一路胜出，
+另一路被取消并关闭连接。用于压低偶发的上游排队造成的首字延迟长尾。
+"""
+
+import time
+import asyncio
+from collections import deque
+from typing import Optional
+
+from .ai_model import AIModel, ModelWrapper
+
+
+class HedgedModel(ModelWrapper):
+    """带对冲请求的流式模型（非流式调用直接交给主模型）"""
+
+    def __init__(self, primary: AIModel, secondary: AIModel, hedge_delay: Optional[float] = None,
+                 percentile: float = 0.95, initial_delay: float = 3.0, min_samples: int = 20,
+                 window: int = 200):
+        """
+        初始化对冲模型
+
+        Args:
+            primary: 主模型
+            secondary: 备用模型
+            hedge_delay: 固定的对冲延迟（秒）；为 None 时使用主模型首字延迟的观测分位数
+            percentile: 自适应延迟使用的分位数，默认 p95
+            initial_delay: 样本不足时使用的延迟（秒）
+            min_samples: 启用自适应延迟所需的最少样本数
+            window: 保留的最近首字延迟样本数
+        """
+        super().__init__(primary)
+        self.secondary = secondary
+        self.hedge_delay = hedge_delay
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self._ttft_samples = deque(maxlen=window)
+        self.stats = {"requests": 0, "hedges_fired": 0, "hedges_won": 0}
+
+    def set_session_manager(self, session_manager):
+        super().set_session_manager(session_manager)
+        self.secondary.set_session_manager(session_manager)
+
+    async def aclose(self):
+        await super().aclose()
+        await self.secondary.aclose()
+
+    def current_hedge_delay(self) -> float:
+        """当前使用的对冲延迟（秒）"""
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        if len(self._ttft_samples) < self.min_samples:
+            return self.initial_delay
+        samples = sorted(self._ttft_samples)
+        index = min(len(samples) - 1, int(len(samples) * self.percentile))
+        return samples[index]
+
+    def get_stats(self) -> dict:
+        """
+        获取对冲统计
+
+        Returns:
+            包含 requests、hedges_fired、hedges_won（备用模型胜出次数）和当前对冲延迟的字典
+        """
+        return {**self.stats, "hedge_delay": self.current_hedge_delay()}
+
+    @staticmethod
+    async def _discard(stream, task: Optional[asyncio.Task]) -> None:
+        """取消落败的一路并关闭其流（从而关闭底层连接）"""
+        if task is not None and not task.done():
+            task.cancel()
+        if task is not None:
+            try:
+                await task
+            except BaseException:
+                pass
+        await stream.aclose()
+
+    async def _generate_stream(self, prompt, callback=None):
+        self.stats["requests"] += 1
+        started_at = time.monotonic()
+        delay = self.current_hedge_delay()
+
+        primary_stream = self.inner.generate_stream(prompt)
+        primary_task = asyncio.ensure_future(primary_stream.__anext__())
+        secondary_stream = None
+        secondary_task = None
+
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=delay)
+            if not done:
+                # 主模型在对冲延迟内没有产出首块，发出对冲请求
+                self.stats["hedges_fired"] += 1
+                secondary_stream = self.secondary.generate_stream(prompt)
+                secondary_task = asyncio.ensure_future(secondary_stream.__anext__())
+
+            pending = {t for t in (primary_task, secondary_task) if t is not None}
+            winner_task = None
+            while pending and winner_task is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # 某一路失败时继续等待另一路；两路都失败则抛出主模型的异常
+                    if task.exception() is None or isinstance(task.exception(), StopAsyncIteration):
+                        winner_task = task
+                        break
+            if winner_task is None:
+                primary_task.result()
+                secondary_task.result()
+        except BaseException:
+            await self._discard(primary_stream, primary_task)
+            if secondary_stream is not None:
+                await self._discard(secondary_stream, secondary_task)
+            raise
+
+        if winner_task is primary_task:
+            winner_stream = primary_stream
+            self._ttft_samples.append(time.monotonic() - started_at)
+            if secondary_stream is not None:
+                await self._discard(secondary_stream, secondary_task)
+        else:
+            winner_stream = secondary_stream
+            self.stats["hedges_won"] += 1
+            if not primary_task.done():
+                # 主模型的首字延迟至少是这么长：作为下界样本记录，否则样本被截断在当前对冲延迟以下，
+                # 分位数会逐次下降，最终几乎每个请求都发出对冲
+                self._ttft_samples.append(time.monotonic() - started_at)
+            await self._discard(primary_stream, primary_task)
+
+        try:
+            try:
+                first_chunk = winner_task.result()
+            except StopAsyncIteration:
+                return
+            if callback:
+                callback(first_chunk)
+            yield first_chunk
+            async for chunk in winner_stream:
+                if callback:
+                    callback(chunk)
+                yield chunk
+        finally:
+            await winner_stream.aclose()
@@ -2,14 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
-from openai import OpenAI # Assuming modelscope uses an OpenAI-compatible client
-# If modelscope has its own SDK, that should be used instead.
-# For this refactoring, we'll assume the existing OpenAI client usage is intended.
+import aiohttp
+# ModelScope 提供 OpenAI 兼容接口，直接通过共享的 aiohttp 会话访问，
+# 流式响应在事件循环上原生异步读取，不经过线程池。
 from .ai_model import AIModel # Changed import
+from utils.retry import APIError, is_retryable_error
+from utils.stream_framing import iter_sse_json
 
 class ModelScopeModel(AIModel):
     """ModelScope模型实现，支持DeepSeek-R1等模型"""
 
+    config_section = 'MODELSCOPE'
+
     def __init__(self, config=None, config_manager=None): # Added config parameter
         """
         初始化ModelScope模型
@@ -36,7 +40,7 @@ class ModelScopeModel(AIModel):
         else:
             self.model_name = None
         
-        # Base URL (api_url from select_model maps to base_url here for OpenAI client)
+        # Base URL (api_url from select_model maps to base_url here)
         if config and ('base_url' in config or 'api_url' in config):
             self.base_url = config.get('base_url') or config.get('api_url')
         elif config_manager:
@@ -60,17 +64,23 @@ class ModelScopeModel(AIModel):
                     default_model = config_manager.get_config('MODELSCOPE', 'default_model_name', fallback=default_model)
                 self.model_name = default_model
 
-
-        # 初始化OpenAI客户端
-        # This assumes ModelScope's API is OpenAI compatible.
-        # If it requires specific http client headers or auth, this needs adjustment.
-        self.client = OpenAI(
-            base_url=self.base_url,
-            api_key=self.api_key
-            # http_client can be passed here if proxy support is needed via httpx
-        )
-
-    async def generate(self, prompt, callback=None):
+        # OpenAI兼容的对话补全端点
+        self.api_url = self.base_url.rstrip('/') + '/chat/completions'
+
+    def _build_request(self, prompt, stream):
+        """构建请求头和请求体"""
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        data = {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream
+        }
+        return headers, data
+
+    async def _generate(self, prompt, callback=None):
         """
         生成文本（非流式）
 
@@ -81,44 +91,43 @@ class ModelScopeModel(AIModel):
         Returns:
             生成的文本
         """
-        try:
-            # Using asyncio.to_thread for blocking I/O
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                stream=False
-            )
-
-            # 获取思考过程和最终答案
-            # This part is specific to how ModelScope might structure its response.
-            # Standard OpenAI response doesn't have 'reasoning_content'.
-            # We will adapt to a more standard OpenAI response structure first,
-            # and if ModelScope has extensions, they might need special handling.
-            result_content = ""
-            if response.choices and response.choices[0].message:
-                result_content = response.choices[0].message.content or ""
-            
-            # The original code had logic for 'reasoning_content'.
-            # If this is a specific ModelScope feature, it needs to be handled.
-            # For now, focusing on the standard 'content'.
-            # If 'reasoning_content' is part of the 'message' object:
-            message_obj = response.choices[0].message
-            if hasattr(message_obj, 'reasoning_content') and message_obj.reasoning_content:
-                # Prepend reasoning if available
-                result_content = f"{message_obj.reasoning_content}\n\n === 最终答案 ===\n\n{result_content}"
-
-            if not result_content:
-                 # Fallback if content is empty, though typically an error or empty string is fine.
-                return str(response) # Or raise an error, or return empty string
-
-            return result_content
+        headers, data = self._build_request(prompt, stream=False)
+        proxy_url = self.proxy.get("https") if self.proxy and isinstance(self.proxy, dict) else None
 
+        try:
+            async with self._http_session() as session:
+                async with session.post(
+                    self.api_url,
+                    json=data,
+                    headers=headers,
+                    proxy=proxy_url,
+                    timeout=aiohttp.ClientTimeout(total=300)
+                ) as response:
+                    if response.status != 200:
+                        raise await APIError.from_response(response, "ModelScope")
+
+                    result = await response.json()
+        except APIError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise APIError(f"ModelScope - 网络或请求错误: {str(e)}", retryable=is_retryable_error(e)) from e
         except Exception as e:
-            # Log the error or handle it more gracefully
             raise Exception(f"ModelScope - 生成文本时出错: {str(e)}")
 
-    async def generate_stream(self, prompt, callback=None):
+        choices = result.get("choices") or []
+        if not choices or not choices[0].get("message"):
+            return str(result)
+
+        # DeepSeek-R1 等推理模型会额外返回 reasoning_content（思考过程）
+        message = choices[0]["message"]
+        result_content = message.get("content") or ""
+        reasoning_content = message.get("reasoning_content")
+        if reasoning_content:
+            result_content = f"{reasoning_content}\n\n === 最终答案 ===\n\n{result_content}"
+
+        return result_content
+
+    async def _generate_stream(self, prompt, callback=None):
         """
         流式生成文本
 
@@ -129,79 +138,57 @@ class ModelScopeModel(AIModel):
         Returns:
             生成的文本流（异步生成器）
         """
-        try:
-            stream = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                stream=True
-            )
-
-            # The original code had logic for 'reasoning_content' and 'done_reasoning'.
-            # This suggests ModelScope might have a multi-part streaming response.
-            # We'll try to adapt this.
-            done_reasoning_separator = False
-            async for chunk in self._iterate_stream(stream): # Use a helper to iterate over sync stream
-                text_chunk = ""
-                reasoning_chunk = ""
-
-                if chunk.choices and chunk.choices[0].delta:
-                    delta = chunk.choices[0].delta
-                    if hasattr(delta, 'reasoning_content') and delta.reasoning_content:
-                        reasoning_chunk = delta.reasoning_content
-                    if hasattr(delta, 'content') and delta.content:
-                        text_chunk = delta.content
-                
-                if reasoning_chunk:
-                    if callback:
-                        await self._async_callback(callback, reasoning_chunk)
-                    yield reasoning_chunk
-                
-                if text_chunk:
-                    if not done_reasoning_separator and (hasattr(chunk.choices[0].delta, 'reasoning_content') or reasoning_chunk): # Heuristic: if reasoning was ever present or just finished
-                        # This logic for separator might need refinement based on actual stream structure
-                        # Assuming reasoning comes first, then content.
-                        # If reasoning_content was in the *previous* chunk and now we get content,
-                        # then we add the separator.
-                        # This is tricky with chunk-based processing.
-                        # A simpler approach might be if the API signals end of reasoning.
-                        # For now, if we get content and haven't put separator, and reasoning might have occurred.
-                        # This part is highly dependent on ModelScope's specific stream format.
-                        # Let's assume for now that if reasoning_content is ever non-empty in the stream,
-                        # the separator is needed before the first actual content.
-                        # This might be better handled by checking a flag from the API if available.
-                        pass # Separator logic from original code was complex and might be ModelScope specific.
-                             # Replicating it perfectly without API docs is hard.
-                             # Sticking to yielding content for now.
-                             # The "=== 最终答案 ===" part might be a post-processing step or specific stream event.
-
-                    if callback:
-                        await self._async_callback(callback, text_chunk)
-                    yield text_chunk
-                
-                await asyncio.sleep(0) # Yield control
+        headers, data = self._build_request(prompt, stream=True)
+        proxy_url = self.proxy.get("https") if self.proxy and isinstance(self.proxy, dict) else None
 
+        try:
+            async with self._http_session() as session:
+                async with session.post(
+                    self.api_url,
+                    json=data,
+                    headers=headers,
+                    proxy=proxy_url,
+                    timeout=aiohttp.ClientTimeout(total=600)
+                ) as response:
+                    if response.status != 200:
+                        raise await APIError.from_response(response, "ModelScope")
+
+                    async for piece in self._iterate_stream(response.content.iter_any()):
+                        if callback:
+                            await self._async_callback(callback, piece)
+                        yield piece
+        except APIError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise APIError(f"ModelScope - 流式网络或请求错误: {str(e)}", retryable=is_retryable_error(e)) from e
         except Exception as e:
             raise Exception(f"ModelScope - 流式生成文本时出错: {str(e)}")
 
-    async def _iterate_stream(self, sync_iterator):
-        # Helper to iterate over a synchronous iterator in an async context
-        # This is necessary because client.chat.completions.create(stream=True) when run in to_thread
-        # returns a synchronous iterator.
-        loop = asyncio.get_event_loop()
-        while True:
-            try:
-                item = await loop.run_in_executor(None, next, sync_iterator)
-                yield item
-            except StopIteration:
-                break
-            except Exception as e: # Catch other potential errors during iteration
-                print(f"Error during stream iteration: {e}") # Or log
-                break
-    
+    async def _iterate_stream(self, chunks):
+        """
+        解析OpenAI兼容的SSE流
+
+        Args:
+            chunks: 产生原始字节块的异步可迭代对象（如 response.content.iter_any()）
+
+        Yields:
+            文本块；推理模型的 reasoning_content 在正文之前产出
+        """
+        async for _, chunk_data in iter_sse_json(chunks):
+            choices = chunk_data.get("choices") or []
+            if not choices:
+                continue
+            delta = choices[0].get("delta") or {}
+            reasoning_chunk = delta.get("reasoning_content")
+            if reasoning_chunk:
+                yield reasoning_chunk
+            text_chunk = delta.get("content")
+            if text_chunk:
+                yield text_chunk
+
     async def _async_callback(self, callback, chunk):
         if callback:
             if asyncio.iscoroutinefunction(callback):
                 await callback(chunk)
             else:
-                callback(chunk)
\ No newline at end of file
+                callback(chunk)
@@ -8,13 +8,23 @@ Ollama模型实现
 """
 
 import json
-import aiohttp
+import time
+import asyncio
 from .ai_model import AIModel # Changed import
+from utils.retry import APIError
+from utils.stream_framing import iter_ndjson
 
 
 class OllamaModel(AIModel):
     """Ollama模型实现类"""
 
+    config_section = 'OLLAMA'
+    supports_structured_prompt = True
+
+    # 可以直接在 [OLLAMA] 配置节中设置的整数/浮点数生成选项，其余选项写在 options（JSON）中
+    INT_OPTIONS = ('num_ctx', 'num_predict', 'seed', 'top_k')
+    FLOAT_OPTIONS = ('temperature', 'top_p', 'repeat_penalty')
+
     def __init__(self, config=None, config_manager=None): # Renamed model_config to config
         """
         初始化Ollama模型
@@ -61,6 +71,24 @@ class OllamaModel(AIModel):
         
         if not self.api_url: # Should always have a fallback
              raise ValueError(f"Ollama模型 '{self.name}' 的API URL未配置")
+
+        self.options = self._load_options(config, config_manager)
+        # 模型在显存中的保留时间，如 "30m"、3600（秒）、-1（一直保留）；为 None 时使用服务端默认值（5分钟）
+        keep_alive = (config or {}).get('keep_alive')
+        if keep_alive is None and config_manager:
+            keep_alive = config_manager.get_config('OLLAMA', 'keep_alive', fallback=None)
+        self.keep_alive = self._parse_keep_alive(keep_alive)
+        # 后台保温：空闲超过 keep_warm_interval 秒时发送一次预热请求，空闲超过 keep_warm_max_idle 秒后停止
+        self.keep_warm_interval = float((config or {}).get('keep_warm_interval') or
+                                        (config_manager and config_manager.get_config_float('OLLAMA', 'keep_warm_interval', fallback=0)) or 0)
+        self.keep_warm_max_idle = float((config or {}).get('keep_warm_max_idle') or
+                                        (config_manager and config_manager.get_config_float('OLLAMA', 'keep_warm_max_idle', fallback=600)) or 600)
+        self._keep_warm_task = None
+        self._last_activity = time.monotonic()
+        # 正在进行的请求数；不为 0 时模型必然在显存中，保温任务不发送预热请求
+        self._in_flight = 0
+        # 最近一次请求的耗时分解（秒）：load 为模型加载，prompt_eval 为读入提示词，eval 为生成
+        self.last_timing = None
         
         # API Key is not typically used for local Ollama, but if a specific Ollama instance requires it:
         # if config and 'api_key' in config:
@@ -72,7 +100,138 @@ class OllamaModel(AIModel):
         # And then use it in headers if self.api_key is present.
 
 
-    async def generate(self, prompt, callback=None):
+    def _load_options(self, config, config_manager):
+        """
+        读取生成选项（num_ctx、num_predict 等），实例配置优先于 [OLLAMA] 配置节
+
+        Returns:
+            options 字典
+        """
+        options = {}
+        if config_manager:
+            raw = config_manager.get_config('OLLAMA', 'options', fallback=None)
+            if raw:
+                try:
+                    options.update(json.loads(raw))
+                except json.JSONDecodeError as e:
+                    print(f"Warning: [OLLAMA] options 不是有效的JSON，已忽略: {e}")
+            for key in self.INT_OPTIONS:
+                value = config_manager.get_config_int('OLLAMA', key, fallback=None)
+                if value is not None:
+                    options[key] = value
+            for key in self.FLOAT_OPTIONS:
+                value = config_manager.get_config_float('OLLAMA', key, fallback=None)
+                if value is not None:
+                    options[key] = value
+        if config:
+            options.update(config.get('options') or {})
+            for key in self.INT_OPTIONS + self.FLOAT_OPTIONS:
+                if config.get(key) is not None:
+                    options[key] = config[key]
+        return options
+
+    @staticmethod
+    def _parse_keep_alive(value):
+        """keep_alive 可以是时长字符串（"30m"）或秒数；纯数字按秒数发送"""
+        if value is None or value == '':
+            return None
+        if isinstance(value, (int, float)):
+            return value
+        try:
+            return int(value)
+        except ValueError:
+            return value
+
+    def get_generation_params(self):
+        return {"options": self.options} if self.options else {}
+
+    @property
+    def generate_url(self):
+        """同一服务的 /api/generate 地址，用于预热"""
+        base = self.api_url.split('/api/', 1)[0] if '/api/' in self.api_url else self.api_url.rstrip('/')
+        return f"{base}/api/generate"
+
+    def _build_request(self, prompt, stream):
+        data = {
+            "model": self.model_name,
+            "messages": self._chat_messages(prompt),
+            "stream": stream
+        }
+        if self.options:
+            data["options"] = self.options
+        if self.keep_alive is not None:
+            data["keep_alive"] = self.keep_alive
+        return data
+
+    def _record_timing(self, response_data):
+        """
+        从最终响应的计时字段（纳秒）中拆分出加载耗时和生成耗时，并计入用量统计
+
+        Args:
+            response_data: 非流式响应或流式响应中 done 为 true 的最后一个对象
+        """
+        timing = {
+            "load_seconds": response_data.get("load_duration", 0) / 1e9,
+            "prompt_eval_seconds": response_data.get("prompt_eval_duration", 0) / 1e9,
+            "eval_seconds": response_data.get("eval_duration", 0) / 1e9,
+            "total_seconds": response_data.get("total_duration", 0) / 1e9,
+        }
+        self.last_timing = timing
+        self._record_usage({
+            "prompt_eval_count": response_data.get("prompt_eval_count", 0),
+            "eval_count": response_data.get("eval_count", 0),
+            **timing
+        })
+
+    def _touch(self):
+        """记录一次请求活动，并按需启动后台保温任务"""
+        self._last_activity = time.monotonic()
+        if self.keep_warm_interval > 0 and (self._keep_warm_task is None or self._keep_warm_task.done()):
+            self._keep_warm_task = asyncio.get_running_loop().create_task(self._keep_warm_loop())
+
+    async def _keep_warm_loop(self):
+        while True:
+            await asyncio.sleep(self.keep_warm_interval)
+            if self._in_flight:
+                # 长时间的流式生成仍在进行，不算空闲；预热请求只会排在它后面
+                continue
+            idle = time.monotonic() - self._last_activity
+            if idle > self.keep_warm_max_idle:
+                # 批量任务已经结束，不再占用显存；下次请求时重新启动
+                return
+            if idle >= self.keep_warm_interval:
+                try:
+                    await self.warm_up()
+                except Exception as e:
+                    print(f"Warning: Ollama模型 '{self.model_name}' 保温请求失败: {e}")
+
+    async def warm_up(self):
+        """
+        预加载模型：发送不含提示词的请求，让 Ollama 把模型（按相同的 options，如 num_ctx）
+        载入内存并按 keep_alive 保留，之后的第一次生成不再等待加载
+
+        Returns:
+            字典，load_seconds 为服务端报告的加载耗时（模型已在内存中时接近 0），
+            total_seconds 为本次请求的总耗时
+        """
+        data = {"model": self.model_name}
+        if self.options:
+            data["options"] = self.options
+        if self.keep_alive is not None:
+            data["keep_alive"] = self.keep_alive
+        started_at = time.monotonic()
+        async with self._http_session() as session:
+            proxy_url = self.proxy.get("https") if self.proxy and isinstance(self.proxy, dict) else None
+            async with session.post(self.generate_url, json=data, proxy=proxy_url) as response:
+                if response.status != 200:
+                    raise await APIError.from_response(response, "Ollama")
+                response_data = await response.json()
+        return {
+            "load_seconds": response_data.get("load_duration", 0) / 1e9,
+            "total_seconds": time.monotonic() - started_at,
+        }
+
+    async def _generate(self, prompt, callback=None):
         """
         生成文本（非流式）
 
@@ -83,39 +242,35 @@ class OllamaModel(AIModel):
         Returns:
             生成的文本
         """
-        # 构建请求数据
-        data = {
-            "model": self.model_name,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "stream": False # Explicitly set stream to False for non-streaming
-        }
+        data = self._build_request(prompt, stream=False)
+        self._in_flight += 1
+        self._touch()
 
-        # 创建HTTP会话
-        async with aiohttp.ClientSession() as session:
-            # 发送请求
-            # The original code used self.proxy directly. aiohttp expects proxy URL string.
-            proxy_url = self.proxy.get("https") if self.proxy and isinstance(self.proxy, dict) else None
-            async with session.post(self.api_url, json=data, proxy=proxy_url) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Ollama API错误: {response.status} - {error_text}")
+        try:
+            # 创建HTTP会话
+            async with self._http_session() as session:
+                # 发送请求
+                # The original code used self.proxy directly. aiohttp expects proxy URL string.
+                proxy_url = self.proxy.get("https") if self.proxy and isinstance(self.proxy, dict) else None
+                async with session.post(self.api_url, json=data, proxy=proxy_url) as response:
+                    if response.status != 200:
+                        raise await APIError.from_response(response, "Ollama")
 
-                # 读取完整响应 (Ollama non-streaming returns a single JSON object)
-                response_data = await response.json()
-                full_response_content = response_data.get("message", {}).get("content", "")
+                    # 读取完整响应 (Ollama non-streaming returns a single JSON object)
+                    response_data = await response.json()
+                    full_response_content = response_data.get("message", {}).get("content", "")
+                    self._record_timing(response_data)
 
-                if callback: # Callback might not be typical for non-streaming full response
-                    await self._async_callback(callback, full_response_content)
+                    if callback: # Callback might not be typical for non-streaming full response
+                        await self._async_callback(callback, full_response_content)
                 
-                return full_response_content
+                    return full_response_content
+        finally:
+            self._in_flight -= 1
+            self._touch()
 
 
-    async def generate_stream(self, prompt, callback=None):
+    async def _generate_stream(self, prompt, callback=None):
         """
         流式生成文本
 
@@ -126,58 +281,44 @@ class OllamaModel(AIModel):
         Returns:
             生成的文本流（异步生成器）
         """
-        # 构建请求数据
-        data = {
-            "model": self.model_name,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "stream": True # Explicitly set stream to True
-        }
+        data = self._build_request(prompt, stream=True)
+        self._in_flight += 1
+        self._touch()
 
-        # 创建HTTP会话
-        async with aiohttp.ClientSession() as session:
-            proxy_url = self.proxy.get("https") if self.proxy and isinstance(self.proxy, dict) else None
-            async with session.post(self.api_url, json=data, proxy=proxy_url) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Ollama API错误: {response.status} - {error_text}")
-
-                # 读取流式响应
-                # Ollama stream sends multiple JSON objects, one per line
-                async for line_bytes in response.content:
-                    if not line_bytes:
-                        continue
-                    
-                    line_str = line_bytes.decode('utf-8').strip()
-                    if not line_str:
-                        continue
-
-                    try:
-                        chunk_data = json.loads(line_str)
-                        # Check if the stream is done (Ollama specific field)
-                        if chunk_data.get("done", False) and not chunk_data.get("message", {}).get("content"):
-                            # If 'done' is true and there's no more content in this chunk, it's the end.
-                            # Some Ollama versions might send a final chunk with "done": true and summary stats.
-                            break 
+        try:
+            # 创建HTTP会话
+            async with self._http_session() as session:
+                proxy_url = self.proxy.get("https") if self.proxy and isinstance(self.proxy, dict) else None
+                async with session.post(self.api_url, json=data, proxy=proxy_url) as response:
+                    if response.status != 200:
+                        raise await APIError.from_response(response, "Ollama")
 
+                    # Ollama 的流式响应是换行分隔的JSON（NDJSON）
+                    async for chunk_data in iter_ndjson(response.content.iter_any()):
                         content_piece = chunk_data.get("message", {}).get("content", "")
                         if content_piece: # Only yield if there's actual content
                             if callback:
                                 await self._async_callback(callback, content_piece)
                             yield content_piece
-                        
-                        if chunk_data.get("done", False): # If done is true, even with content, stop after yielding.
+
+                        # 最后一个对象带有 "done": true 和统计信息
+                        if chunk_data.get("done", False):
+                            self._record_timing(chunk_data)
                             break
+        finally:
+            self._in_flight -= 1
+            self._touch()
 
-                    except json.JSONDecodeError:
-                        # Log or handle malformed JSON lines if necessary
-                        print(f"Ollama - 无法解析JSON: {line_str}") # Consider logging instead of printing
-                        continue
-                    await asyncio.sleep(0) # Yield control to event loop
+    async def aclose(self):
+        """停止后台保温任务"""
+        if self._keep_warm_task is not None:
+            self._keep_warm_task.cancel()
+            try:
+                await self._keep_warm_task
+            except asyncio.CancelledError:
+                pass
+            self._keep_warm_task = None
+        await super().aclose()
 
     async def _async_callback(self, callback, chunk):
         if callback:
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+多端点负载均衡模型
+
+把 [CUSTOM_OPENAI_MODELS] 中服务同一 model_name 的多个OpenAI兼容端点
+组合成一个“虚拟模型”：请求路由到在途请求最少的端点，
+连续失败的端点会被摘除，并由后台健康检查在恢复后重新加入；摘除超过 readmit_after 秒后
+还会放行一个试探请求（与熔断器的半开状态相同），成功即重新加入，不依赖后台检查。
+"""
+
+import time
+import random
+import asyncio
+from typing import List, Optional
+
+from .ai_model import AIModel
+from .custom_openai_model import CustomOpenAIModel
+from utils.retry import is_retryable_error
+
+
+class _Backend:
+    """负载均衡池中的一个端点及其状态"""
+
+    def __init__(self, model: CustomOpenAIModel):
+        self.model = model
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.ejected_at: Optional[float] = None
+        # 摘除后的试探请求是否正在进行（同一时刻只放行一个）
+        self.trial_in_flight = False
+
+    def __repr__(self):
+        return (f"<Backend {self.model.name} in_flight={self.in_flight} "
+                f"healthy={self.healthy} failures={self.consecutive_failures}>")
+
+
+class PooledOpenAIModel(AIModel):
+    """在多个OpenAI兼容端点之间做最少在途请求（least-outstanding-requests）负载均衡的模型"""
+
+    config_section = 'CUSTOM_OPENAI_MODELS'
+    # 提示词原样交给端点模型，由端点决定如何处理
+    supports_structured_prompt = True
+
+    def __init__(self, backends: List[CustomOpenAIModel], config_manager=None,
+                 probe_interval: float = 30.0, eject_after_failures: int = 3, readmit_after: float = 30.0):
+        """
+        初始化负载均衡模型
+
+        Args:
+            backends: 服务同一模型的端点实例列表
+            config_manager: 配置管理器实例
+            probe_interval: 健康检查间隔（秒），0 表示不做后台检查
+            eject_after_failures: 连续失败多少次后摘除端点
+            readmit_after: 端点被摘除多少秒后放行一个试探请求，成功则重新加入；0 表示不做试探
+        """
+        super().__init__(config_manager)
+        if not backends:
+            raise ValueError("负载均衡池至少需要一个端点")
+
+        if config_manager:
+            probe_interval = config_manager.get_config_float(
+                self.config_section, 'probe_interval', fallback=probe_interval)
+            eject_after_failures = config_manager.get_config_int(
+                self.config_section, 'eject_after_failures', fallback=eject_after_failures)
+            readmit_after = config_manager.get_config_float(
+                self.config_section, 'readmit_after', fallback=readmit_after)
+
+        self.backends = [_Backend(model) for model in backends]
+        self.model_name = backends[0].model_name
+        self.name = f"pool:{self.model_name}"
+        self.probe_interval = probe_interval
+        self.eject_after_failures = eject_after_failures
+        self.readmit_after = readmit_after
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def set_session_manager(self, session_manager):
+        super().set_session_manager(session_manager)
+        for backend in self.backends:
+            backend.model.set_session_manager(session_manager)
+
+    def _pick_backend(self) -> _Backend:
+        """选择在途请求最少的健康端点；全部被摘除时退回到全部端点中选择
+
+        熔断中的端点不参与选择，除非所有端点都处于熔断状态。
+        """
+        available = [b for b in self.backends
+                     if not b.model.circuit_breaker or b.model.circuit_breaker.allows_request()]
+        candidates = [b for b in available if b.healthy] or available or self.backends
+        least = min(b.in_flight for b in candidates)
+        return random.choice([b for b in candidates if b.in_flight == least])
+
+    def _pick_trial_backend(self) -> Optional[_Backend]:
+        """摘除时间超过 readmit_after 且没有试探请求在进行的端点，选中后标记为正在试探"""
+        if not self.readmit_after:
+            return None
+        now = time.monotonic()
+        for backend in self.backends:
+            if (not backend.healthy and not backend.trial_in_flight and backend.ejected_at is not None
+                    and now - backend.ejected_at >= self.readmit_after
+                    and (not backend.model.circuit_breaker or backend.model.circuit_breaker.allows_request())):
+                backend.trial_in_flight = True
+                return backend
+        return None
+
+    def _record_success(self, backend: _Backend) -> None:
+        backend.consecutive_failures = 0
+        if not backend.healthy:
+            # 试探请求（或全部端点被摘除时的请求）成功：重新加入
+            backend.healthy = True
+            backend.ejected_at = None
+
+    def _record_failure(self, backend: _Backend, exc: BaseException) -> None:
+        # 只有服务端/网络类错误计入健康状态，4xx 之类的请求错误与端点无关
+        if not is_retryable_error(exc):
+            return
+        backend.consecutive_failures += 1
+        if not backend.healthy:
+            # 仍然失败：重新开始冷却
+            backend.ejected_at = time.monotonic()
+        elif backend.consecutive_failures >= self.eject_after_failures:
+            backend.healthy = False
+            backend.ejected_at = time.monotonic()
+
+    def _ensure_probe_task(self) -> None:
+        """在首次请求时启动后台健康检查任务"""
+        if self.probe_interval and (self._probe_task is None or self._probe_task.done()):
+            self._probe_task = asyncio.get_running_loop().create_task(self._probe_loop())
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            await self.probe_backends()
+
+    async def probe_backends(self) -> None:
+        """对所有端点做一次健康检查：失败则摘除，恢复则重新加入"""
+        results = await asyncio.gather(*(b.model.health_check() for b in self.backends))
+        for backend, ok in zip(self.backends, results):
+            if ok:
+                if not backend.healthy:
+                    backend.healthy = True
+                    backend.consecutive_failures = 0
+                    backend.ejected_at = None
+            elif backend.healthy:
+                backend.healthy = False
+                backend.ejected_at = time.monotonic()
+
+    def get_stats(self) -> List[dict]:
+        """
+        获取各端点的当前状态
+
+        Returns:
+            每个端点一个字典，包含 name、api_url、in_flight、healthy、consecutive_failures
+        """
+        return [
+            {
+                "name": b.model.name,
+                "api_url": b.model.api_url,
+                "in_flight": b.in_flight,
+                "healthy": b.healthy,
+                "consecutive_failures": b.consecutive_failures,
+            }
+            for b in self.backends
+        ]
+
+    def get_usage_stats(self):
+        """
+        获取所有端点累计的用量统计之和
+
+        Returns:
+            字典，字段含义同 AIModel.get_usage_stats
+        """
+        totals = {"requests": 0}
+        for backend in self.backends:
+            for name, value in backend.model.get_usage_stats().items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    async def _generate(self, prompt, callback=None):
+        """
+        在选中的端点上发送一次非流式请求
+
+        重试由外层的 retry_policy 负责，每次重试都会重新选择端点。
+        """
+        self._ensure_probe_task()
+        trial = self._pick_trial_backend()
+        backend = trial or self._pick_backend()
+        backend.in_flight += 1
+        try:
+            result = await backend.model._attempt(prompt, callback)
+        except Exception as e:
+            self._record_failure(backend, e)
+            raise
+        finally:
+            backend.in_flight -= 1
+            if trial is not None:
+                trial.trial_in_flight = False
+        self._record_success(backend)
+        return result
+
+    async def _generate_stream(self, prompt, callback=None):
+        """在选中的端点上发送一次流式请求，流结束前端点一直计为在途"""
+        self._ensure_probe_task()
+        trial = self._pick_trial_backend()
+        backend = trial or self._pick_backend()
+        backend.in_flight += 1
+        try:
+            async for chunk in backend.model._attempt_stream(prompt, callback):
+                yield chunk
+        except Exception as e:
+            self._record_failure(backend, e)
+            raise
+        finally:
+            backend.in_flight -= 1
+            if trial is not None:
+                trial.trial_in_flight = False
+        self._record_success(backend)
+
+    async def aclose(self):
+        """停止后台健康检查并释放各端点资源"""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+        for backend in self.backends:
+            await backend.model.aclose()
@@ -2,13 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import aiohttp
-import json
 import asyncio
 from .ai_model import AIModel # Changed import
+from utils.retry import APIError, is_retryable_error
+from utils.stream_framing import iter_sse_json
 
 class SiliconFlowModel(AIModel):
     """SiliconFlow模型实现 (OpenAI兼容)"""
 
+    config_section = 'SILICONFLOW'
+    supports_structured_prompt = True
+
     def __init__(self, config=None, config_manager=None): # Added config parameter
         """
         初始化SiliconFlow模型
@@ -65,7 +69,7 @@ class SiliconFlowModel(AIModel):
              raise ValueError(f"模型 '{self.name}' 的API地址未配置")
 
 
-    async def generate(self, prompt, callback=None):
+    async def _generate(self, prompt, callback=None):
         """
         生成文本（非流式）
 
@@ -79,7 +83,7 @@ class SiliconFlowModel(AIModel):
         # 构建请求数据
         data = {
             "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": self._chat_messages(prompt),
             "stream": False
         }
 
@@ -93,7 +97,7 @@ class SiliconFlowModel(AIModel):
         proxy_url = self.proxy.get("https") if self.proxy and isinstance(self.proxy, dict) else None
 
         try:
-            async with aiohttp.ClientSession() as session:
+            async with self._http_session() as session:
                 async with session.post(
                     self.api_url,
                     json=data,
@@ -102,10 +106,10 @@ class SiliconFlowModel(AIModel):
                     timeout=aiohttp.ClientTimeout(total=120) # 增加超时时间
                 ) as response:
                     if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"SiliconFlow API请求失败: {response.status}, {error_text}")
+                        raise await APIError.from_response(response, "SiliconFlow")
 
                     result = await response.json()
+                    self._record_usage(result.get("usage"))
 
                     # 解析响应 (与标准OpenAI格式一致)
                     if result.get("choices") and result["choices"][0].get("message"):
@@ -118,12 +122,14 @@ class SiliconFlowModel(AIModel):
                     # 如果无法解析，返回原始响应或错误
                     # Consider logging the result for debugging
                     raise Exception(f"SiliconFlow API响应格式不符合预期: {result}")
-        except aiohttp.ClientError as e: # Catch specific aiohttp errors
-            raise Exception(f"SiliconFlow - 网络或请求错误: {str(e)}")
+        except APIError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e: # Catch specific aiohttp errors
+            raise APIError(f"SiliconFlow - 网络或请求错误: {str(e)}", retryable=is_retryable_error(e)) from e
         except Exception as e: # Catch other errors
             raise Exception(f"SiliconFlow - 生成文本时出错: {str(e)}")
 
-    async def generate_stream(self, prompt, callback=None):
+    async def _generate_stream(self, prompt, callback=None):
         """
         流式生成文本
 
@@ -137,9 +143,12 @@ class SiliconFlowModel(AIModel):
         # 构建请求数据
         data = {
             "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": self._chat_messages(prompt),
             "stream": True
         }
+        stream_options = self._stream_options()
+        if stream_options:
+            data["stream_options"] = stream_options
 
         # 构建请求头
         headers = {
@@ -151,7 +160,7 @@ class SiliconFlowModel(AIModel):
         proxy_url = self.proxy.get("https") if self.proxy and isinstance(self.proxy, dict) else None
 
         try:
-            async with aiohttp.ClientSession() as session:
+            async with self._http_session() as session:
                 async with session.post(
                     self.api_url,
                     json=data,
@@ -160,45 +169,26 @@ class SiliconFlowModel(AIModel):
                     timeout=aiohttp.ClientTimeout(total=300) # 增加流式超时
                 ) as response:
                     if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"SiliconFlow API流式请求失败: {response.status}, {error_text}")
+                        raise await APIError.from_response(response, "SiliconFlow")
 
                     # 处理流式响应 (与标准OpenAI格式一致)
-                    async for line_bytes in response.content:
-                        line = line_bytes.decode('utf-8').strip()
-                        if not line:
-                            continue
-                        
-                        if line == "data: [DONE]":
-                            break 
-                        
-                        if line.startswith("data: "):
-                            json_str = line[len("data: "):]
-                            try:
-                                chunk_data = json.loads(json_str)
-                                if chunk_data.get("choices") and \
-                                   chunk_data["choices"][0].get("delta") and \
-                                   "content" in chunk_data["choices"][0]["delta"]:
-                                    
-                                    content_piece = chunk_data["choices"][0]["delta"]["content"]
-                                    if content_piece: # Ensure content is not empty
-                                        if callback:
-                                            await self._async_callback(callback, content_piece)
-                                        yield content_piece
-                                else:
-                                    # Handle cases where delta or content might be missing, or other stream events
-                                    # For example, finish_reason might be in a chunk.
-                                    pass
-
-
-                            except json.JSONDecodeError:
-                                # Log or handle malformed JSON lines
-                                print(f"SiliconFlow - 无法解析的流式JSON行: {json_str}") # Consider logging
-                                continue
-                        await asyncio.sleep(0) # Yield control
-
-        except aiohttp.ClientError as e:
-            raise Exception(f"SiliconFlow - 流式网络或请求错误: {str(e)}")
+                    usage = None
+                    async for _, chunk_data in iter_sse_json(response.content.iter_any()):
+                        # 用量在最后的事件中给出（部分服务每个事件都带累计值，取最后一个）
+                        usage = chunk_data.get("usage") or usage
+                        choices = chunk_data.get("choices")
+                        # finish_reason 等不含内容的事件直接跳过
+                        content_piece = choices[0].get("delta", {}).get("content") if choices else None
+                        if content_piece:
+                            if callback:
+                                await self._async_callback(callback, content_piece)
+                            yield content_piece
+                    self._record_usage(usage)
+
+        except APIError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise APIError(f"SiliconFlow - 流式网络或请求错误: {str(e)}", retryable=is_retryable_error(e)) from e
         except Exception as e:
             raise Exception(f"SiliconFlow - 流式生成文本时出错: {str(e)}")
 
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求合并（single-flight）模型
+
+多个任务同时请求同一提示词时（重试的任务、多个界面同时流式查看同一章节、
+旧任务尚未结束时重新启动批量任务），只有第一个调用者真正发出请求，
+其余并发调用者订阅同一个结果或同一个流。流式订阅者即使晚到，也会从头收到全部内容。
+
+请求在独立的后台任务中执行，不属于任何一个调用者：某个调用者（包括第一个）
+被取消时，其他订阅者不受影响；所有订阅者都离开后才取消底层请求。
+"""
+
+import asyncio
+from typing import Dict, List, Optional
+
+from .ai_model import AIModel, ModelWrapper
+from utils.response_cache import make_cache_key
+
+
+class _Flight:
+    """一次进行中的请求及其订阅者"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        # 以下仅用于流式请求
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def notify(self) -> None:
+        """唤醒所有等待新内容的订阅者"""
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_changed(self) -> None:
+        await self._changed.wait()
+
+
+class SingleFlightModel(ModelWrapper):
+    """合并并发的相同请求"""
+
+    def __init__(self, inner: AIModel):
+        """
+        初始化请求合并模型
+
+        Args:
+            inner: 被包装的模型
+        """
+        super().__init__(inner)
+        self._flights: Dict[str, _Flight] = {}
+        self._stream_flights: Dict[str, _Flight] = {}
+        self.stats = {"requests": 0, "deduplicated": 0}
+
+    def get_stats(self) -> dict:
+        """
+        获取请求合并统计
+
+        Returns:
+            包含 requests（调用次数）、deduplicated（复用进行中请求的次数）、in_flight 的字典
+        """
+        return {**self.stats, "in_flight": len(self._flights) + len(self._stream_flights)}
+
+    def _key(self, prompt) -> str:
+        return make_cache_key(self.inner.config_section or type(self.inner).__name__,
+                              getattr(self.inner, 'model_name', None),
+                              str(prompt), self.inner.get_generation_params())
+
+    def _join(self, flights: Dict[str, _Flight], key: str):
+        """返回 (flight, 是否为新发起的请求)"""
+        self.stats["requests"] += 1
+        flight = flights.get(key)
+        if flight is not None:
+            self.stats["deduplicated"] += 1
+            return flight, False
+        flight = _Flight()
+        flights[key] = flight
+        return flight, True
+
+    @staticmethod
+    def _leave(flights: Dict[str, _Flight], key: str, flight: _Flight) -> None:
+        """订阅者离开；最后一个订阅者离开且请求未完成时取消请求"""
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.task.done():
+            if flights.get(key) is flight:
+                del flights[key]
+            flight.task.cancel()
+
+    async def _generate(self, prompt, callback=None):
+        key = self._key(prompt)
+        flight, is_new = self._join(self._flights, key)
+        if is_new:
+            flight.task = asyncio.ensure_future(self.inner.generate(prompt))
+
+            def _finished(_task, flight=flight):
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.task.add_done_callback(_finished)
+
+        flight.subscribers += 1
+        try:
+            # shield：调用者被取消时不会连带取消共享的请求
+            result = await asyncio.shield(flight.task)
+        finally:
+            self._leave(self._flights, key, flight)
+        if callback:
+            callback(result)
+        return result
+
+    async def _pump(self, key: str, flight: _Flight, prompt) -> None:
+        """在后台读取底层流，把内容分发给所有订阅者"""
+        try:
+            async for chunk in self.inner.generate_stream(prompt):
+                flight.chunks.append(chunk)
+                flight.notify()
+        except BaseException as e:
+            flight.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            flight.done = True
+            if self._stream_flights.get(key) is flight:
+                del self._stream_flights[key]
+            flight.notify()
+
+    async def _generate_stream(self, prompt, callback=None):
+        key = self._key(prompt)
+        flight, is_new = self._join(self._stream_flights, key)
+        if is_new:
+            flight.task = asyncio.ensure_future(self._pump(key, flight, prompt))
+
+        flight.subscribers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(flight.chunks):
+                    chunk = flight.chunks[position]
+                    position += 1
+                    if callback:
+                        callback(chunk)
+                    yield chunk
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait_changed()
+        finally:
+            self._leave(self._stream_flights, key, flight)
@@ -1,18 +1,40 @@
 # llmai_lib/novel_generator.py
+import os
 import asyncio 
-from typing import AsyncIterator, Dict, List, Optional, Union
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 from utils.config_manager import ConfigManager
-from utils.prompt_manager import PromptManager
+from utils.prompt_manager import PromptManager, StructuredPrompt
 from utils.data_manager import NovelDataManager
-from models.ai_model import AIModel
+from utils.http_session import HTTPSessionManager
+from models.ai_model import AIModel, ModelWrapper
 # Import specific model classes. These will be used in select_model.
 # It's good practice to have an __init__.py in llmai_lib/models/ that could expose these,
 # or a factory function. For now, direct imports as shown in the plan.
 from models import gpt_model, claude_model, gemini_model, custom_openai_model, modelscope_model, ollama_model, siliconflow_model
+from models.pooled_model import PooledOpenAIModel
+from models.hedged_model import HedgedModel
+from models.cached_model import CachedModel
+from models.cassette_model import RecordingModel, ReplayModel
+from models.singleflight_model import SingleFlightModel
+from utils.cassette import Cassette
+from utils.response_cache import ResponseCache
+from utils.stream_coalescer import StreamCoalescer
+from utils.rate_limiter import scoped_concurrency_limits
+from utils.job_journal import JobJournal, content_hash
+from utils.draft_sink import ChapterDraftSink, DraftResult
 
+from generators import outline_generator, chapter_generator
 from generators.outline_generator import OutlineGenerator
 from generators.chapter_generator import ChapterGenerator
+from generators.novel_context import NovelContextCache
+from generators.batch_generator import ChapterBatch, select_chapters
+from generators.rolling_context import RollingContext
+
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return f.read()
 
 
 class NovelGenerator:
@@ -29,11 +51,53 @@ class NovelGenerator:
             # Optionally, try to get a default prompts_path from config
             effective_prompts_path = self.config_manager.get_config('General', 'prompts_path', fallback="prompt_templates.json")
 
-        self.prompt_manager = PromptManager(prompts_path=effective_prompts_path)
+        # [PROMPTS] compact：编译提示词模板时去掉缩进和多余空行（内置模板和模板文件共用）
+        self.compact_prompts = self.config_manager.get_config_bool('PROMPTS', 'compact', fallback=True)
+        self.prompt_manager = PromptManager(prompts_path=effective_prompts_path, compact=self.compact_prompts)
         self.data_manager = NovelDataManager() 
+        # 所有模型实例共享的HTTP会话/连接池，生命周期由 NovelGenerator 管理
+        self.http_session_manager = HTTPSessionManager(self.config_manager)
         self.current_model: Optional[AIModel] = None
+        # select_model 选出的原始模型；current_model 是在其外层套上已启用功能（如对冲请求）后的模型
+        self.base_model: Optional[AIModel] = None
+        self._hedging_options: Optional[Dict] = None
+        self.response_cache: Optional[ResponseCache] = None
+        self._cache_replay_chunk_size: Optional[int] = None
+        self.recording_cassette: Optional[Cassette] = None
+        self._single_flight_stats: Optional[Dict] = None
+        # 流式输出的合并器，为 None 时逐块转发模型输出
+        self.stream_coalescer: Optional[StreamCoalescer] = None
+        # 章节正文的草稿目录，为 None 时流式生成的正文在内存中拼接
+        self.draft_sink: Optional[ChapterDraftSink] = None
+        # select_model 在事件循环中调用时于后台发起的模型预热任务
+        self._warm_up_task: Optional[asyncio.Task] = None
+        # 章节提示词的小说上下文（人物列表、前缀、各卷章节摘要），在多次章节生成之间复用
+        self.novel_context_cache = NovelContextCache()
+        # 已生成章节的分层前情摘要，为 None 时章节提示词只包含大纲摘要
+        self.rolling_context: Optional[RollingContext] = None
         self._initialize_default_model()
 
+    async def __aenter__(self) -> "NovelGenerator":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """释放当前模型持有的资源，关闭响应缓存和共享的HTTP连接池"""
+        if self._warm_up_task is not None and not self._warm_up_task.done():
+            self._warm_up_task.cancel()
+        if self.base_model and self.base_model.fallback_model:
+            await self.base_model.fallback_model.aclose()
+        if self.current_model:
+            await self.current_model.aclose()
+        elif self._hedging_options:
+            await self._hedging_options["secondary"].aclose()
+        if self.response_cache is not None:
+            self.response_cache.close()
+            self.response_cache = None
+        await self.http_session_manager.aclose()
+
     def _initialize_default_model(self):
         default_model_name = self.config_manager.get_config('General', 'default_model_name', fallback=None)
         if default_model_name:
@@ -56,6 +120,167 @@ class NovelGenerator:
 
 
     def select_model(self, model_name: str, api_key: Optional[str] = None, base_url: Optional[str] = None, **kwargs):
+        self.base_model = self._create_model(model_name, api_key=api_key, base_url=base_url, **kwargs)
+        if not self.base_model: # Should be caught by ValueError in _create_model, but as a safeguard.
+            raise ConnectionError(f"Failed to initialize model: {model_name}")
+        # 端点熔断时接手请求的备用模型：先看模型自己的配置节，再看 [General]
+        fallback_name = None
+        if self.base_model.config_section:
+            fallback_name = self.config_manager.get_config(self.base_model.config_section, 'fallback_model', fallback=None)
+        fallback_name = fallback_name or self.config_manager.get_config('General', 'fallback_model', fallback=None)
+        if fallback_name and fallback_name.lower() != model_name.lower():
+            try:
+                self.set_fallback_model(fallback_name)
+            except Exception as e:
+                print(f"Warning: Failed to initialize fallback model '{fallback_name}': {e}")
+        self._apply_model_wrappers()
+        self._schedule_warm_up()
+
+    def _schedule_warm_up(self):
+        """
+        支持预热的模型（如 Ollama）在选中后立即在后台预加载
+
+        只在事件循环中调用 select_model 时生效；在事件循环外选择模型时，
+        可以之后调用 await warm_up()。配置 warm_up_on_select = false 关闭。
+        """
+        if not hasattr(self.base_model, 'warm_up') or not self.base_model.config_section:
+            return
+        if not self.config_manager.get_config_bool(self.base_model.config_section, 'warm_up_on_select', fallback=True):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._warm_up_task is not None and not self._warm_up_task.done():
+            self._warm_up_task.cancel()
+        self._warm_up_task = loop.create_task(self.warm_up())
+
+    async def warm_up(self) -> Optional[Dict]:
+        """
+        预加载当前模型，使第一次生成不必等待模型加载
+
+        Returns:
+            模型返回的预热结果（Ollama 为 load_seconds 和 total_seconds）；
+            模型不支持预热或预热失败时返回 None
+        """
+        if not hasattr(self.base_model, 'warm_up'):
+            return None
+        try:
+            return await self.base_model.warm_up()
+        except Exception as e:
+            print(f"Warning: Failed to warm up model: {e}")
+            return None
+
+    def set_fallback_model(self, model_name: Optional[str], api_key: Optional[str] = None,
+                           base_url: Optional[str] = None, **kwargs):
+        """
+        设置当前模型的端点熔断时接手请求的备用模型
+
+        Args:
+            model_name: 备用模型名称（与 select_model 的取值相同），为 None 时取消备用模型
+            api_key: 备用模型的API密钥
+            base_url: 备用模型的API地址
+            **kwargs: 传给备用模型的其他配置
+        """
+        if not self.base_model:
+            raise RuntimeError("AI model not selected. Call select_model() first.")
+        fallback = None
+        if model_name:
+            fallback = self._create_model(model_name, api_key=api_key, base_url=base_url, **kwargs)
+        self.base_model.set_fallback_model(fallback)
+
+    def _apply_model_wrappers(self):
+        """在 base_model 外层套上已启用的功能，得到 current_model"""
+        model = self.base_model
+        if model is not None and self._hedging_options:
+            options = self._hedging_options
+            model = HedgedModel(model, options["secondary"], hedge_delay=options["hedge_delay"])
+            # 切换主模型后继续累计统计（首字延迟样本随主模型重新采集）
+            model.stats = options["stats"]
+        if model is not None and self.response_cache is not None:
+            # 缓存在对冲之外：命中时两路请求都不必发出
+            model = CachedModel(model, self.response_cache, replay_chunk_size=self._cache_replay_chunk_size)
+        if model is not None and self._single_flight_stats is not None:
+            model = SingleFlightModel(model)
+            model.stats = self._single_flight_stats
+        if model is not None and self.recording_cassette is not None:
+            # 录制放在最外层，记录的就是生成流程实际收到的内容
+            model = RecordingModel(model, self.recording_cassette)
+        self.current_model = model
+
+    def enable_hedging(self, secondary_model_name: str, hedge_delay: Optional[float] = None,
+                       api_key: Optional[str] = None, base_url: Optional[str] = None, **kwargs):
+        """
+        启用流式生成的对冲请求
+
+        主模型在 hedge_delay 秒内没有产出第一个文本块时，向备用模型发送同一提示词，
+        先产出的一路胜出，另一路被取消。之后调用 select_model 切换主模型时保持启用。
+
+        Args:
+            secondary_model_name: 备用模型名称（与 select_model 的取值相同）
+            hedge_delay: 对冲延迟（秒）；为 None 时使用主模型首字延迟的观测 p95
+            api_key: 备用模型的API密钥
+            base_url: 备用模型的API地址
+            **kwargs: 传给备用模型的其他配置
+        """
+        if self._hedging_options:
+            self.disable_hedging()
+        secondary = self._create_model(secondary_model_name, api_key=api_key, base_url=base_url, **kwargs)
+        self._hedging_options = {
+            "secondary": secondary,
+            "hedge_delay": hedge_delay,
+            "stats": {"requests": 0, "hedges_fired": 0, "hedges_won": 0},
+        }
+        self._apply_model_wrappers()
+
+    def disable_hedging(self):
+        """关闭对冲请求（备用模型的连接随共享连接池一起释放）"""
+        self._hedging_options = None
+        self._apply_model_wrappers()
+
+    def get_hedging_stats(self) -> Optional[Dict]:
+        """
+        获取对冲请求统计
+
+        Returns:
+            包含 requests、hedges_fired、hedges_won、hedge_delay 的字典；未启用对冲时返回 None
+        """
+        model = self.current_model
+        while isinstance(model, ModelWrapper):
+            if isinstance(model, HedgedModel):
+                return model.get_stats()
+            model = model.inner
+        return None
+
+    def get_usage_stats(self) -> Optional[Dict]:
+        """
+        获取当前模型累计的用量统计
+
+        Returns:
+            服务端返回的用量字段累计值（如 input_tokens、output_tokens，Claude 的
+            cache_creation_input_tokens、cache_read_input_tokens）；未选择模型时返回 None
+        """
+        if not self.current_model:
+            return None
+        return self.current_model.get_usage_stats()
+
+    def get_prompt_template_report(self) -> Dict[str, Dict]:
+        """
+        获取提示词模板的占位符和token统计
+
+        Returns:
+            模板名称 -> {placeholders, original_tokens, tokens, saved_tokens} 的字典，
+            包含内置的大纲、章节模板和模板文件中的模板；saved_tokens 为压缩空白后
+            每次渲染节省的token数（[PROMPTS] compact = false 时为0）
+        """
+        report = {}
+        report.update(outline_generator.template_report(self.compact_prompts))
+        report.update(chapter_generator.template_report(self.compact_prompts))
+        report.update(self.prompt_manager.get_template_report())
+        return report
+
+    def _create_model(self, model_name: str, api_key: Optional[str] = None, base_url: Optional[str] = None, **kwargs) -> AIModel:
+        """根据模型名称创建模型实例，并注入共享的HTTP会话管理器"""
         # model_config will be passed to the model's constructor.
         model_instance_config = {}
         if api_key:
@@ -88,6 +313,22 @@ class NovelGenerator:
             selected_model_instance = ollama_model.OllamaModel(config=model_instance_config, config_manager=self.config_manager)
         elif model_name_lower == "siliconflow":
             selected_model_instance = siliconflow_model.SiliconFlowModel(config=model_instance_config, config_manager=self.config_manager)
+        elif model_name_lower.startswith("replay:"):
+            # "replay:<录制文件路径>"：不访问网络，按录制文件回放响应
+            selected_model_instance = ReplayModel(model_name[len("replay:"):],
+                                                  time_scale=float(kwargs.get("time_scale", 1.0)),
+                                                  config_manager=self.config_manager)
+        elif model_name_lower.startswith("pool:"):
+            # "pool:<model_name>"：在 [CUSTOM_OPENAI_MODELS] 中所有服务该模型的端点之间负载均衡
+            pooled_model_name = model_name[len("pool:"):]
+            endpoint_confs = self.config_manager.get_custom_openai_models_by_model_name(pooled_model_name)
+            if not endpoint_confs:
+                raise ValueError(f"No custom OpenAI endpoints configured for model: {pooled_model_name}")
+            backends = [
+                custom_openai_model.CustomOpenAIModel(config={**conf, **model_instance_config}, config_manager=self.config_manager)
+                for conf in endpoint_confs
+            ]
+            selected_model_instance = PooledOpenAIModel(backends, config_manager=self.config_manager)
         else:
             # Attempt to load as a custom OpenAI model if name matches one in config
             if self.config_manager:
@@ -101,9 +342,208 @@ class NovelGenerator:
             if not selected_model_instance:
                 raise ValueError(f"Unsupported or unknown model: {model_name}")
         
-        self.current_model = selected_model_instance
-        if not self.current_model: # Should be caught by ValueError above, but as a safeguard.
-            raise ConnectionError(f"Failed to initialize model: {model_name}")
+        selected_model_instance.set_session_manager(self.http_session_manager)
+        return selected_model_instance
+
+
+    def enable_response_cache(self, path: str = "llm_cache.sqlite", max_bytes: int = 512 * 1024 * 1024,
+                              replay_chunk_size: Optional[int] = None):
+        """
+        启用持久化响应缓存
+
+        以服务商、模型名称、规范化后的提示词和生成参数为键，把完整响应保存到本地 SQLite 文件。
+        命中时 generate 直接返回缓存文本，generate_stream 把缓存文本作为流回放。
+
+        Args:
+            path: SQLite 文件路径
+            max_bytes: 缓存总字节数上限，超过后按最近访问时间淘汰
+            replay_chunk_size: 流式回放时每块的字数，为 None 时整段作为一块产出
+        """
+        self.disable_response_cache()
+        self.response_cache = ResponseCache(path, max_bytes=max_bytes)
+        self._cache_replay_chunk_size = replay_chunk_size
+        self._apply_model_wrappers()
+
+    def disable_response_cache(self):
+        """关闭响应缓存（已保存的缓存文件保留）"""
+        if self.response_cache is not None:
+            self.response_cache.close()
+            self.response_cache = None
+            self._apply_model_wrappers()
+
+    def get_response_cache_stats(self) -> Optional[Dict]:
+        """
+        获取响应缓存统计
+
+        Returns:
+            包含 hits、misses、stores、evictions、entries、total_bytes、max_bytes 的字典；未启用时返回 None
+        """
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get_stats()
+
+    def enable_single_flight(self):
+        """
+        启用请求合并：并发的相同请求（相同模型、提示词和生成参数）只发出一次，
+        其余调用者共享同一个结果或同一个流
+        """
+        if self._single_flight_stats is None:
+            self._single_flight_stats = {"requests": 0, "deduplicated": 0}
+            self._apply_model_wrappers()
+
+    def disable_single_flight(self):
+        """关闭请求合并"""
+        self._single_flight_stats = None
+        self._apply_model_wrappers()
+
+    def get_single_flight_stats(self) -> Optional[Dict]:
+        """
+        获取请求合并统计
+
+        Returns:
+            包含 requests、deduplicated、in_flight 的字典；未启用时返回 None
+        """
+        model = self.current_model
+        while isinstance(model, ModelWrapper):
+            if isinstance(model, SingleFlightModel):
+                return model.get_stats()
+            model = model.inner
+        return None
+
+    def start_recording(self, cassette_path: str):
+        """
+        开始录制：之后的每次请求和响应（包括流式响应的分块和块间间隔）都追加写入录制文件
+
+        录制文件可以通过 select_model("replay:<cassette_path>") 离线回放。
+
+        Args:
+            cassette_path: 录制文件路径（JSON Lines，追加写入）
+        """
+        self.recording_cassette = Cassette(cassette_path)
+        self._apply_model_wrappers()
+
+    def stop_recording(self):
+        """停止录制"""
+        self.recording_cassette = None
+        self._apply_model_wrappers()
+
+    def enable_stream_coalescing(self, max_chars: int = 200, max_delay_ms: float = 100.0):
+        """
+        启用流式输出合并：generate_chapter_stream 把模型输出的小块攒到 max_chars 字
+        或等待超过 max_delay_ms 毫秒（以先到者为准）后再一次性产出
+
+        Args:
+            max_chars: 缓冲达到该字数时立即输出
+            max_delay_ms: 缓冲中最早的内容等待超过该毫秒数时输出
+        """
+        self.stream_coalescer = StreamCoalescer(max_chars=max_chars, max_delay_ms=max_delay_ms)
+
+    def disable_stream_coalescing(self):
+        """关闭流式输出合并"""
+        self.stream_coalescer = None
+
+    def get_stream_coalescing_stats(self) -> Optional[Dict]:
+        """
+        获取流式输出合并统计
+
+        Returns:
+            包含 input_chunks、output_chunks、merged 的字典；未启用时返回 None
+        """
+        if self.stream_coalescer is None:
+            return None
+        return self.stream_coalescer.get_stats()
+
+    def enable_rolling_context(self, budget_tokens: int = 1500, recent_chapters: int = 3, fold_every: int = 4,
+                               chapter_summary_chars: int = 200, volume_summary_chars: int = 500,
+                               digest_chars: int = 800, path: Optional[str] = None, use_model: bool = True):
+        """
+        启用滚动前情：每章完成后生成章节摘要，逐步折叠为卷摘要和全书梗概，
+        之后生成的章节按 token 预算在提示词中放入这些前情
+
+        Args:
+            budget_tokens: 放入每章提示词的前情 token 上限
+            recent_chapters: 优先放入的最近章节摘要数
+            fold_every: 卷内每积累多少章新摘要折叠一次卷摘要
+            chapter_summary_chars: 章节摘要的字数上限
+            volume_summary_chars: 卷摘要的字数上限
+            digest_chars: 全书梗概的字数上限
+            path: 保存摘要的 JSON 文件，None 时为项目文件旁的 <项目文件>.context.json（未打开项目时只保存在内存中）
+            use_model: 是否用当前模型生成摘要；为 False 时使用抽取式摘要，不产生额外请求
+        """
+        if path is None and self.data_manager.current_file:
+            path = f"{self.data_manager.current_file}.context.json"
+        self.rolling_context = RollingContext(
+            summarize=self._summarize_for_context if use_model else None,
+            budget_tokens=budget_tokens, recent_chapters=recent_chapters, fold_every=fold_every,
+            chapter_summary_chars=chapter_summary_chars, volume_summary_chars=volume_summary_chars,
+            digest_chars=digest_chars, path=path)
+
+    def disable_rolling_context(self):
+        """关闭滚动前情（已保存的摘要文件保留）"""
+        self.rolling_context = None
+
+    def get_rolling_context_stats(self) -> Optional[Dict]:
+        """
+        获取滚动前情统计
+
+        Returns:
+            RollingContext.get_stats() 的字典；未启用时返回 None
+        """
+        if self.rolling_context is None:
+            return None
+        return self.rolling_context.get_stats()
+
+    async def _summarize_for_context(self, prompt: str) -> str:
+        """用当前模型生成前情摘要"""
+        if not self.current_model:
+            raise RuntimeError("AI model not selected. Call select_model() first.")
+        return await self.current_model.generate(prompt)
+
+    async def _update_rolling_context(self, novel_data: Dict, volume_index: int, chapter_index: int,
+                                      content: Optional[str] = None, path: Optional[str] = None) -> None:
+        """章节完成后更新滚动前情（正文在章节文件中时从 path 读取）；出错不影响章节生成"""
+        if self.rolling_context is None:
+            return
+        try:
+            if content is None and path is not None:
+                content = await asyncio.to_thread(_read_text, path)
+            if content:
+                await self.rolling_context.add_chapter(novel_data, volume_index, chapter_index, content)
+        except Exception as e:
+            print(f"更新前情摘要出错 (卷 {volume_index}, 章 {chapter_index}): {e}")
+
+    def enable_draft_streaming(self, directory: Optional[str] = None, fsync_bytes: int = 64 * 1024,
+                               fsync_interval: float = 1.0):
+        """
+        启用章节正文边生成边写盘：generate_chapter_stream 和 generate_all_chapters 把模型输出
+        逐块追加到每章的草稿文件（定期 fsync），整章完成后原子重命名为章节文件，
+        data_manager 中只记录文件路径，正文在读取时才载入。内存占用与章节长度和并发章节数无关
+
+        Args:
+            directory: 章节文件目录，None 时为项目文件旁的 <项目文件>.chapters（未打开项目时为 chapters）
+            fsync_bytes: 草稿每积累多少字节 fsync 一次
+            fsync_interval: 距上次 fsync 超过该秒数时在下一次写入后 fsync
+        """
+        if directory is None:
+            current_file = self.data_manager.current_file
+            directory = f"{current_file}.chapters" if current_file else "chapters"
+        self.draft_sink = ChapterDraftSink(directory, fsync_bytes=fsync_bytes, fsync_interval=fsync_interval)
+
+    def disable_draft_streaming(self):
+        """关闭章节正文边生成边写盘（已写入章节文件的正文仍可读取）"""
+        self.draft_sink = None
+
+    def get_draft_streaming_stats(self) -> Optional[Dict]:
+        """
+        获取草稿写入统计
+
+        Returns:
+            包含 opened、committed、aborted、bytes_written、fsyncs、peak_open、open 和
+            drafts（目录中留下的未完成草稿）的字典；未启用时返回 None
+        """
+        if self.draft_sink is None:
+            return None
+        return {**self.draft_sink.get_stats(), "drafts": self.draft_sink.list_drafts()}
 
 
     async def generate_outline(self, title: str, genre: str, theme: str, style: str,
@@ -142,32 +582,264 @@ class NovelGenerator:
         optimized_outline = await outline_generator.optimize_outline(outline_data)
         return optimized_outline
 
-    async def generate_chapter(self, novel_data: Dict, volume_index: int, chapter_index: int) -> str:
+    async def generate_chapter(self, novel_data: Dict, volume_index: int, chapter_index: int,
+                               previous_text: Optional[str] = None,
+                               prompt: Optional[StructuredPrompt] = None) -> str:
         if not self.current_model:
             raise RuntimeError("AI model not selected. Call select_model() first.")
-        chapter_generator = ChapterGenerator(self.current_model, self.prompt_manager, self.config_manager)
+        chapter_generator = ChapterGenerator(self.current_model, self.prompt_manager, self.config_manager,
+                                             context_cache=self.novel_context_cache,
+                                             rolling_context=self.rolling_context)
         
         # ChapterGenerator.generate_chapter expects novel_data (which is the full outline_data)
         chapter_content = await chapter_generator.generate_chapter(
             novel_data=novel_data, 
             volume_index=volume_index, 
-            chapter_index=chapter_index
+            chapter_index=chapter_index,
+            previous_text=previous_text,
+            prompt=prompt
         )
+        await self._update_rolling_context(novel_data, volume_index, chapter_index, chapter_content)
         return chapter_content
 
 
-    async def generate_chapter_stream(self, novel_data: Dict, volume_index: int, chapter_index: int) -> AsyncIterator[str]:
+    async def generate_chapter_stream(self, novel_data: Dict, volume_index: int, chapter_index: int,
+                                      previous_text: Optional[str] = None) -> AsyncIterator[str]:
         if not self.current_model:
             raise RuntimeError("AI model not selected. Call select_model() first.")
-        chapter_generator = ChapterGenerator(self.current_model, self.prompt_manager, self.config_manager)
-        
-        async for chunk in chapter_generator.generate_chapter_stream(
+        chapter_generator = ChapterGenerator(self.current_model, self.prompt_manager, self.config_manager,
+                                             context_cache=self.novel_context_cache,
+                                             rolling_context=self.rolling_context)
+        stream = chapter_generator.generate_chapter_stream(
             novel_data=novel_data,
             volume_index=volume_index,
-            chapter_index=chapter_index
-        ):
-            yield chunk
+            chapter_index=chapter_index,
+            coalescer=self.stream_coalescer,
+            previous_text=previous_text
+        )
+        if self.draft_sink is None:
+            # 启用滚动前情时需要整章正文来生成摘要
+            parts = [] if self.rolling_context is not None else None
+            async for chunk in stream:
+                if parts is not None:
+                    parts.append(chunk)
+                yield chunk
+            if parts is not None:
+                await self._update_rolling_context(novel_data, volume_index, chapter_index, "".join(parts))
+            return
+
+        # 启用草稿写盘：每块先写入草稿再交给调用方，完整结束后提升为章节文件；
+        # 出错或调用方提前停止时保留草稿，不生成章节文件
+        writer = self.draft_sink.open(volume_index, chapter_index)
+        try:
+            async for chunk in stream:
+                await writer.write(chunk)
+                yield chunk
+        except BaseException:
+            await writer.abort()
+            raise
+        if not writer.chars:
+            # 模型返回空内容：不提升草稿，避免覆盖已有的章节文件
+            await writer.abort()
+            return
+        result = await writer.commit()
+        self.data_manager.set_chapter_file(volume_index, chapter_index, result.path)
+        await self._update_rolling_context(novel_data, volume_index, chapter_index, path=result.path)
+
+    async def _generate_chapter_to_draft(self, novel_data: Dict, volume_index: int, chapter_index: int,
+                                         previous_text: Optional[str] = None,
+                                         prompt: Optional[StructuredPrompt] = None) -> DraftResult:
+        """流式生成一章并直接写入草稿，完成后提升为章节文件（不在内存中保留正文）"""
+        chapter_generator = ChapterGenerator(self.current_model, self.prompt_manager, self.config_manager,
+                                             context_cache=self.novel_context_cache,
+                                             rolling_context=self.rolling_context)
+        writer = self.draft_sink.open(volume_index, chapter_index)
+        try:
+            async for chunk in chapter_generator.generate_chapter_stream(
+                novel_data=novel_data,
+                volume_index=volume_index,
+                chapter_index=chapter_index,
+                coalescer=self.stream_coalescer,
+                previous_text=previous_text,
+                prompt=prompt
+            ):
+                await writer.write(chunk)
+        except BaseException:
+            await writer.abort()
+            raise
+        if not writer.chars:
+            # 模型返回空内容：不提升草稿，避免覆盖已有的章节文件
+            await writer.abort()
+            raise ValueError("模型返回了空内容")
+        result = await writer.commit()
+        await self._update_rolling_context(novel_data, volume_index, chapter_index, path=result.path)
+        return result
+
+
+    async def generate_all_chapters(self, novel_data: Optional[Dict] = None,
+                                    volumes: Optional[Iterable[int]] = None,
+                                    start: Optional[Tuple[int, int]] = None, end: Optional[Tuple[int, int]] = None,
+                                    chapters: Optional[Iterable[Tuple[int, int]]] = None,
+                                    only_missing: bool = False, concurrency: int = 4,
+                                    provider_limits: Optional[Dict[str, int]] = None,
+                                    progress_callback: Optional[Callable[[Dict], Any]] = None,
+                                    continuity: str = "independent",
+                                    previous_text_chars: int = 2000,
+                                    journal_dir: Optional[str] = None,
+                                    job_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        批量生成章节，每章完成后立即写入 data_manager
+
+        Args:
+            novel_data: 小说数据（包含大纲），None 表示使用 data_manager 中的数据
+            volumes: 只生成这些卷（索引从0开始），None 表示全部卷
+            start: 起始章节 (卷索引, 章节索引)，包含在内
+            end: 结束章节 (卷索引, 章节索引)，包含在内
+            chapters: 明确指定的章节列表，提供时忽略 volumes / start / end
+            only_missing: 是否跳过 data_manager 中已有正文的章节
+            concurrency: 同时生成的最大章节数
+            provider_limits: 本次批量生成期间各服务商的并发上限，如 {'OLLAMA': 1}，
+                             按模型配置节名称区分，对备用模型和对冲模型同样生效
+            progress_callback: 进度回调（普通函数或协程函数），参数为事件字典
+            continuity: 连贯性策略：'independent'（只依赖大纲摘要，全部并行）、
+                        'within_volume'（卷内每章等前一章完成，把前一章结尾放入提示词，各卷并行）、
+                        'sequential'（全书按顺序）
+            previous_text_chars: 依赖前一章时放入提示词的前一章结尾字符数
+            journal_dir: 任务日志目录；提供时（或配置了 [General] journal_dir 时）把任务参数、
+                         每章的状态变化、提示词和正文记入可恢复的任务日志，见 resume_job
+            job_id: 任务ID，None 时自动生成
+
+        Returns:
+            包含 total、completed、errors、critical_path 和 elapsed 的字典；
+            记录任务日志时另有 job_id
+
+        启用 enable_draft_streaming 时各章流式写入章节文件，data_manager 中只记录文件路径，
+        任务日志引用章节文件而不再复制正文；崩溃时正在生成的章节只留下草稿，恢复时重新生成。
+        """
+        if not self.current_model:
+            raise RuntimeError("AI model not selected. Call select_model() first.")
+        if novel_data is None:
+            novel_data = self.data_manager.get_outline()
+
+        targets = select_chapters(
+            novel_data, volumes=volumes, start=start, end=end, chapters=chapters,
+            only_missing=only_missing,
+            has_content=lambda v, c: bool(self.data_manager.get_chapter_content(v, c)))
+
+        journal = None
+        journal_dir = journal_dir or self.config_manager.get_config('General', 'journal_dir', fallback=None)
+        if journal_dir:
+            spec = {
+                "targets": [list(key) for key in targets],
+                "concurrency": concurrency,
+                "continuity": continuity,
+                "previous_text_chars": previous_text_chars,
+                "provider_limits": provider_limits or {},
+                "model": getattr(self.base_model, "model_name", None),
+                "project_file": self.data_manager.current_file,
+            }
+            journal = await asyncio.to_thread(JobJournal.create, journal_dir, spec, job_id, novel_data)
+
+        return await self._run_chapter_batch(novel_data, targets, concurrency, provider_limits,
+                                             progress_callback, continuity, previous_text_chars, journal)
+
+    async def resume_job(self, job_id: str, journal_dir: Optional[str] = None,
+                         concurrency: Optional[int] = None,
+                         provider_limits: Optional[Dict[str, int]] = None,
+                         progress_callback: Optional[Callable[[Dict], Any]] = None) -> Dict[str, Any]:
+        """
+        恢复中断的批量生成任务，只生成尚未完成的章节
+
+        使用任务日志中保存的大纲和参数。日志中已完成的章节不会重新生成：data_manager 中
+        没有该章正文（或内容与日志记录的哈希不同）时，从任务日志保存的正文恢复。
+        data_manager 中没有大纲时，先加载任务记录的项目文件，文件不存在时使用日志中的大纲。
+
+        Args:
+            job_id: 任务ID（generate_all_chapters 返回的 job_id）
+            journal_dir: 任务日志目录，None 时使用 [General] journal_dir
+            concurrency: 同时生成的最大章节数，None 表示沿用任务参数
+            provider_limits: 各服务商的并发上限，None 表示沿用任务参数
+            progress_callback: 进度回调（普通函数或协程函数），参数为事件字典
+
+        Returns:
+            与 generate_all_chapters 相同的字典，另有 job_id 和 restored（从日志恢复正文的章节数）；
+            total 只计本次需要生成的章节
+        """
+        if not self.current_model:
+            raise RuntimeError("AI model not selected. Call select_model() first.")
+        journal_dir = journal_dir or self.config_manager.get_config('General', 'journal_dir', fallback=None)
+        if not journal_dir:
+            raise ValueError("未指定任务日志目录 (journal_dir)")
+        journal = await asyncio.to_thread(JobJournal.open, journal_dir, job_id)
+        spec = journal.spec
+
+        outline = await asyncio.to_thread(journal.load_outline)
+        if not self.data_manager.novel_data.get("volumes"):
+            project_file = spec.get("project_file")
+            if project_file and os.path.exists(project_file):
+                self.data_manager.load_project(project_file)
+            elif outline is not None:
+                self.data_manager.set_outline(outline)
+        novel_data = outline if outline is not None else self.data_manager.get_outline()
+
+        restored = 0
+        remaining = []
+        for key in journal.targets():
+            if journal.state(key) == "completed":
+                existing = self.data_manager.get_chapter_content(*key)
+                if existing and content_hash(existing) == journal.chapters[key].get("sha256"):
+                    continue
+                chapter_file = await asyncio.to_thread(journal.chapter_file, key)
+                if chapter_file is not None:
+                    self.data_manager.set_chapter_file(key[0], key[1], chapter_file)
+                    restored += 1
+                    continue
+                content = await asyncio.to_thread(journal.completed_content, key)
+                if content is not None:
+                    self.data_manager.set_chapter_content(key[0], key[1], content)
+                    restored += 1
+                    continue
+                print(f"任务日志中章节 (卷 {key[0]}, 章 {key[1]}) 的正文无法读取，将重新生成")
+            remaining.append(key)
+
+        await asyncio.to_thread(journal.append, {"type": "resumed", "remaining": len(remaining),
+                                                 "restored": restored})
+        result = await self._run_chapter_batch(
+            novel_data, remaining,
+            spec.get("concurrency", 4) if concurrency is None else concurrency,
+            spec.get("provider_limits") if provider_limits is None else provider_limits,
+            progress_callback, spec.get("continuity", "independent"),
+            spec.get("previous_text_chars", 2000), journal)
+        result["restored"] = restored
+        return result
+
+    async def _run_chapter_batch(self, novel_data: Dict, targets: List[Tuple[int, int]], concurrency: int,
+                                 provider_limits: Optional[Dict[str, int]],
+                                 progress_callback: Optional[Callable[[Dict], Any]],
+                                 continuity: str, previous_text_chars: int,
+                                 journal: Optional[JobJournal]) -> Dict[str, Any]:
+        """按给定参数运行一次批量生成（供 generate_all_chapters 和 resume_job 使用）"""
+        if self.rolling_context is not None and targets:
+            # 为已有正文、还没有摘要的前面章节补上摘要
+            await self.rolling_context.sync(novel_data, self.data_manager.get_chapter_content, before=max(targets))
+        prompt_builder = None
+        if journal is not None:
+            chapter_generator = ChapterGenerator(self.current_model, self.prompt_manager, self.config_manager,
+                                                 context_cache=self.novel_context_cache,
+                                                 rolling_context=self.rolling_context)
+            prompt_builder = chapter_generator._create_chapter_prompt
 
+        # provider_limits 只对本次批量生成（调度器创建的章节任务继承当前上下文）生效
+        with scoped_concurrency_limits(provider_limits):
+            generate = self.generate_chapter if self.draft_sink is None else self._generate_chapter_to_draft
+            batch = ChapterBatch(generate, self.data_manager,
+                                 concurrency=concurrency, progress_callback=progress_callback,
+                                 continuity=continuity, previous_text_chars=previous_text_chars,
+                                 journal=journal, prompt_builder=prompt_builder)
+            result = await batch.run(novel_data, targets)
+        if journal is not None:
+            result["job_id"] = journal.job_id
+        return result
 
     def load_novel_data(self, filepath: str) -> Optional[Dict]: # Return Optional[Dict] as load_project can return None
         loaded_data = self.data_manager.load_project(filepath)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+录制文件（cassette）模块
+
+以 JSON Lines 格式保存模型的请求和响应，每行一条记录：
+
+* 非流式：``{"type": "generate", "prompt": ..., "response": ..., "latency": 秒}``
+* 流式：``{"type": "stream", "prompt": ..., "chunks": [[距上一块的秒数, 文本], ...]}``
+
+记录中还包含服务商和模型名称，便于查看。追加写入，录制中途崩溃也只会丢失最后一条。
+"""
+
+import json
+import threading
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+from utils.response_cache import normalize_prompt
+
+
+class Cassette:
+    """一盘录制文件：录制时追加记录，回放时按提示词查找"""
+
+    def __init__(self, path: str):
+        """
+        初始化录制文件
+
+        Args:
+            path: 文件路径（JSON Lines）
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[str, deque] = defaultdict(deque)
+
+    def append(self, record: dict) -> None:
+        """
+        追加一条记录并立即写入文件
+
+        Args:
+            record: 记录字典，必须包含 type 和 prompt
+        """
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def load(self) -> int:
+        """
+        读取文件中的全部记录
+
+        Returns:
+            读取的记录数
+        """
+        count = 0
+        self._records.clear()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 录制中途崩溃时最后一行可能不完整
+                    continue
+                self._records[normalize_prompt(record.get("prompt", ""))].append(record)
+                count += 1
+        return count
+
+    def find(self, prompt: str, record_type: Optional[str] = None) -> Optional[dict]:
+        """
+        查找提示词对应的记录
+
+        同一提示词录制了多次时按录制顺序依次返回，用完后重复返回最后一条。
+
+        Args:
+            prompt: 提示词
+            record_type: 优先匹配的记录类型（"generate" 或 "stream"）
+
+        Returns:
+            记录字典，没有录制过该提示词时返回 None
+        """
+        records = self._records.get(normalize_prompt(prompt))
+        if not records:
+            return None
+        candidates: List[dict] = list(records)
+        preferred = [r for r in candidates if r.get("type") == record_type] if record_type else []
+        record = (preferred or candidates)[0]
+        if len(records) > 1:
+            records.remove(record)
+        return record
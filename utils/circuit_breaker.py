@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+熔断器模块
+
+按服务端点（API地址）统计请求结果：连续失败达到阈值，或时间窗口内失败率过高时熔断，
+熔断期间的请求立即失败（或交给备用模型），冷却结束后只放行一个探测请求，
+探测成功则恢复，失败则重新熔断。同一地址的所有模型实例共享同一个熔断器。
+"""
+
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from utils.retry import APIError, is_retryable_error
+
+
+class CircuitOpenError(APIError):
+    """端点处于熔断状态，请求未发出"""
+
+    def __init__(self, endpoint: str, retry_after: Optional[float] = None):
+        super().__init__(f"端点 {endpoint} 已熔断，请求被拒绝", retry_after=retry_after, retryable=False)
+        self.endpoint = endpoint
+
+
+def is_endpoint_failure(exc: BaseException) -> bool:
+    """判断异常是否说明端点本身不可用（连接错误、超时、5xx）
+
+    429 和其他 4xx 说明端点仍在正常响应，不计入熔断统计。
+    """
+    if isinstance(exc, CircuitOpenError):
+        return False
+    if isinstance(exc, APIError):
+        if exc.status is None:
+            return exc.retryable
+        return exc.status >= 500
+    return is_retryable_error(exc)
+
+
+class CircuitBreaker:
+    """单个端点的熔断器（closed -> open -> half_open -> closed）"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, endpoint: str, failure_threshold: int = 5, failure_rate: float = 0.5,
+                 window: float = 60.0, min_requests: int = 10, cooldown: float = 30.0):
+        """
+        初始化熔断器
+
+        Args:
+            endpoint: 端点地址，用于错误信息
+            failure_threshold: 连续失败多少次后熔断
+            failure_rate: 时间窗口内失败率达到该值后熔断
+            window: 统计失败率的时间窗口（秒）
+            min_requests: 窗口内至少有多少次请求才按失败率判断
+            cooldown: 熔断后多久放行探测请求（秒）
+        """
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        # (时间, 是否失败)
+        self._outcomes = deque()
+
+    def _prune(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _open(self, now: float) -> None:
+        self.state = self.OPEN
+        self.opened_at = now
+        self.times_opened += 1
+        self._probe_in_flight = False
+        print(f"端点 {self.endpoint} 熔断，{self.cooldown:g} 秒后尝试恢复")
+
+    def allows_request(self) -> bool:
+        """当前是否会放行请求（不改变状态）"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() < self.opened_at + self.cooldown:
+            return False
+        return not self._probe_in_flight
+
+    def before_request(self) -> None:
+        """
+        请求发出前调用，熔断期间抛出 CircuitOpenError
+
+        冷却结束后第一个调用者成为探测请求，其余调用者在探测完成前继续被拒绝。
+        """
+        if self.state == self.CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.cooldown - now
+            if remaining > 0:
+                raise CircuitOpenError(self.endpoint, retry_after=remaining)
+            self.state = self.HALF_OPEN
+        if self._probe_in_flight:
+            raise CircuitOpenError(self.endpoint)
+        self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        """记录一次成功的请求"""
+        now = time.monotonic()
+        if self.state != self.CLOSED:
+            print(f"端点 {self.endpoint} 已恢复")
+        self.state = self.CLOSED
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        self._outcomes.append((now, False))
+        self._prune(now)
+
+    def record_failure(self) -> None:
+        """记录一次端点故障"""
+        now = time.monotonic()
+        if self.state == self.HALF_OPEN:
+            self._open(now)
+            return
+        self.consecutive_failures += 1
+        self._outcomes.append((now, True))
+        self._prune(now)
+        if self.state != self.CLOSED:
+            return
+        failures = sum(1 for _, failed in self._outcomes if failed)
+        total = len(self._outcomes)
+        if (self.consecutive_failures >= self.failure_threshold or
+                (total >= self.min_requests and failures / total >= self.failure_rate)):
+            self._open(now)
+
+    def record_ignored(self) -> None:
+        """请求结束但结果不说明端点健康与否（如被取消），释放探测名额"""
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            # 探测没有给出结论，回到熔断状态等待下一个探测
+            self.state = self.OPEN
+
+    def record(self, exc: Optional[BaseException]) -> None:
+        """
+        根据请求结果更新状态
+
+        Args:
+            exc: 请求抛出的异常，成功时为 None
+        """
+        if exc is None:
+            self.record_success()
+        elif is_endpoint_failure(exc):
+            self.record_failure()
+        elif isinstance(exc, APIError) and not isinstance(exc, CircuitOpenError):
+            # 端点给出了正常的错误响应，说明它是可达的
+            self.record_success()
+        else:
+            self.record_ignored()
+
+    def get_stats(self) -> dict:
+        """获取熔断器状态"""
+        return {
+            "endpoint": self.endpoint,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+        }
+
+
+# (配置节, 端点地址) -> 共享的熔断器
+_circuit_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+
+def get_circuit_breaker(config_manager, section: Optional[str], endpoint: Optional[str]) -> Optional[CircuitBreaker]:
+    """
+    获取（或创建）指定端点共享的熔断器
+
+    从配置节读取 ``circuit_breaker``（默认启用）、``circuit_failure_threshold``、
+    ``circuit_failure_rate``、``circuit_window``、``circuit_min_requests`` 和 ``circuit_cooldown``。
+
+    Args:
+        config_manager: 配置管理器实例，可为 None
+        section: 模型对应的配置节名称，如 'OLLAMA'
+        endpoint: 端点地址（API地址或 base_url），为 None 时不启用熔断
+
+    Returns:
+        CircuitBreaker 实例，或 None（已禁用）
+    """
+    if not endpoint:
+        return None
+    settings = {}
+    if config_manager and section:
+        if not config_manager.get_config_bool(section, 'circuit_breaker', fallback=True):
+            return None
+        settings = {
+            "failure_threshold": config_manager.get_config_int(section, 'circuit_failure_threshold', fallback=5),
+            "failure_rate": config_manager.get_config_float(section, 'circuit_failure_rate', fallback=0.5),
+            "window": config_manager.get_config_float(section, 'circuit_window', fallback=60.0),
+            "min_requests": config_manager.get_config_int(section, 'circuit_min_requests', fallback=10),
+            "cooldown": config_manager.get_config_float(section, 'circuit_cooldown', fallback=30.0),
+        }
+
+    registry_key = (section or "", endpoint)
+    breaker = _circuit_breakers.get(registry_key)
+    if breaker is None:
+        breaker = CircuitBreaker(endpoint, **settings)
+        _circuit_breakers[registry_key] = breaker
+    return breaker
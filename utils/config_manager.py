@@ -78,6 +78,27 @@ class ConfigManager:
         # getboolean, getint, getfloat can be used for typed retrieval
         return self.config.get(section, key, fallback=fallback)
 
+    def get_config_int(self, section, key, fallback=None):
+        """获取整数类型的配置项，缺失或格式错误时返回 fallback"""
+        try:
+            return self.config.getint(section, key, fallback=fallback)
+        except ValueError:
+            return fallback
+
+    def get_config_float(self, section, key, fallback=None):
+        """获取浮点数类型的配置项，缺失或格式错误时返回 fallback"""
+        try:
+            return self.config.getfloat(section, key, fallback=fallback)
+        except ValueError:
+            return fallback
+
+    def get_config_bool(self, section, key, fallback=None):
+        """获取布尔类型的配置项，缺失或格式错误时返回 fallback"""
+        try:
+            return self.config.getboolean(section, key, fallback=fallback)
+        except ValueError:
+            return fallback
+
     def set_config(self, section, key, value):
         """设置指定配置项 (in-memory only for library use)"""
         if not self.config.has_section(section):
@@ -212,6 +233,18 @@ class ConfigManager:
 
         return None
 
+    def get_custom_openai_models_by_model_name(self, model_name):
+        """获取服务指定 model_name 的所有自定义OpenAI模型配置
+
+        Args:
+            model_name: 服务端的模型标识符（配置中的 model_name 字段）
+
+        Returns:
+            模型配置字典列表
+        """
+        return [model for model in self.get_custom_openai_models()
+                if model.get('model_name') == model_name]
+
     # def save_config(self): # Removed, library should not write files unless explicitly told to.
     #     """保存配置到文件"""
     #     if self.config_path: # Only save if a path was originally provided
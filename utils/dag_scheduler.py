@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+依赖图调度模块
+
+按节点之间的依赖关系并发执行任务：依赖都已完成的节点进入就绪队列，同时运行的节点数
+不超过 concurrency。就绪节点中剩余依赖链最长的优先启动（关键路径优先），
+使总耗时接近关键路径长度，而不是所有节点耗时之和。
+某个节点失败时，直接或间接依赖它的节点不再运行。
+"""
+
+import heapq
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+
+class DependencyError(Exception):
+    """前置节点失败，节点无法运行"""
+
+    def __init__(self, node, failed_dependency):
+        self.node = node
+        self.failed_dependency = failed_dependency
+        super().__init__(f"前置任务 {failed_dependency} 失败")
+
+
+class DagScheduler:
+    """有向无环图任务调度器"""
+
+    def __init__(self, dependencies: Dict[Hashable, Iterable[Hashable]]):
+        """
+        构建依赖图
+
+        Args:
+            dependencies: 节点 -> 它依赖的节点；依赖中不在图内的节点视为已完成
+
+        Raises:
+            ValueError: 依赖图中有环
+        """
+        self.nodes: List[Hashable] = list(dependencies)
+        node_set = set(self.nodes)
+        self.dependencies: Dict[Hashable, Set[Hashable]] = {
+            node: {dep for dep in deps if dep in node_set and dep != node}
+            for node, deps in dependencies.items()
+        }
+        self.dependents: Dict[Hashable, List[Hashable]] = {node: [] for node in self.nodes}
+        for node, deps in self.dependencies.items():
+            for dep in deps:
+                self.dependents[dep].append(node)
+        self.order = self._topological_order()
+        # 节点 -> 以该节点开始的最长依赖链的节点数
+        self.heights: Dict[Hashable, int] = {}
+        for node in reversed(self.order):
+            self.heights[node] = 1 + max((self.heights[d] for d in self.dependents[node]), default=0)
+
+    def _topological_order(self) -> List[Hashable]:
+        indegree = {node: len(deps) for node, deps in self.dependencies.items()}
+        ready = [node for node in self.nodes if indegree[node] == 0]
+        order = []
+        while ready:
+            node = ready.pop()
+            order.append(node)
+            for dependent in self.dependents[node]:
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) != len(self.nodes):
+            cycle = [node for node in self.nodes if indegree[node] > 0]
+            raise ValueError(f"依赖图中存在环，涉及 {len(cycle)} 个节点: {cycle[:5]}")
+        return order
+
+    @property
+    def critical_path_length(self) -> int:
+        """最长依赖链的节点数（并发足够时的最少轮数）"""
+        return max(self.heights.values(), default=0)
+
+    async def run(self, run_node: Callable[[Hashable], Awaitable[Any]], concurrency: int = 4,
+                  on_blocked: Optional[Callable[[Hashable, Hashable], Any]] = None) -> Dict[Hashable, BaseException]:
+        """
+        执行全部节点
+
+        Args:
+            run_node: 执行单个节点的协程函数；抛出异常表示该节点失败
+            concurrency: 同时运行的最大节点数
+            on_blocked: 节点因前置节点失败而不运行时调用（普通函数或协程函数），参数为 (节点, 失败的前置节点)
+
+        Returns:
+            失败节点 -> 异常（因前置失败而未运行的节点对应 DependencyError）
+        """
+        concurrency = max(1, int(concurrency))
+        remaining = {node: len(deps) for node, deps in self.dependencies.items()}
+        # (-高度, 在原列表中的位置, 节点)：关键路径上的节点先启动，同高度按原顺序
+        position = {node: i for i, node in enumerate(self.nodes)}
+        ready = [(-self.heights[node], position[node], node) for node in self.nodes if remaining[node] == 0]
+        heapq.heapify(ready)
+        running: Dict[asyncio.Task, Hashable] = {}
+        failures: Dict[Hashable, BaseException] = {}
+
+        async def block(node, failed):
+            # 前置节点失败：依赖它的节点（及其后继）都不再运行
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                if current in failures:
+                    continue
+                failures[current] = DependencyError(current, failed)
+                if on_blocked:
+                    if asyncio.iscoroutinefunction(on_blocked):
+                        await on_blocked(current, failed)
+                    else:
+                        on_blocked(current, failed)
+                stack.extend(self.dependents[current])
+
+        try:
+            while ready or running:
+                while ready and len(running) < concurrency:
+                    node = heapq.heappop(ready)[2]
+                    running[asyncio.create_task(run_node(node))] = node
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node = running.pop(task)
+                    error = task.exception()
+                    if error is not None:
+                        failures[node] = error
+                        for dependent in self.dependents[node]:
+                            await block(dependent, node)
+                        continue
+                    for dependent in self.dependents[node]:
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0 and dependent not in failures:
+                            heapq.heappush(ready, (-self.heights[dependent], position[dependent], dependent))
+        except BaseException:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            raise
+        return failures
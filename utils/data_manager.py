@@ -9,135 +9,15 @@
 
 import os
 import json
-import time
 import hashlib
 from typing import Dict, List, Any, Optional, Tuple, Callable
 
+from utils.lru_cache import LRUCache
+from utils.snapshot import FrozenDict, freeze
 
-class CacheItem:
-    """缓存项"""
-    
-    def __init__(self, key: str, value: Any, expire_time: float = None):
-        """
-        初始化缓存项
-        
-        Args:
-            key: 缓存键
-            value: 缓存值
-            expire_time: 过期时间戳，None表示永不过期
-        """
-        self.key = key
-        self.value = value
-        self.expire_time = expire_time
-        self.created_at = time.time()
-        self.last_accessed = self.created_at
-    
-    def is_expired(self) -> bool:
-        """
-        检查是否已过期
-        
-        Returns:
-            是否已过期
-        """
-        if self.expire_time is None:
-            return False
-        return time.time() > self.expire_time
-    
-    def access(self):
-        """访问缓存项，更新最后访问时间"""
-        self.last_accessed = time.time()
 
-
-class Cache:
-    """缓存管理器"""
-    
-    def __init__(self, max_size: int = 100, default_ttl: int = 3600):
-        """
-        初始化缓存管理器
-        
-        Args:
-            max_size: 最大缓存项数
-            default_ttl: 默认生存时间（秒）
-        """
-        self.cache: Dict[str, CacheItem] = {}
-        self.max_size = max_size
-        self.default_ttl = default_ttl
-    
-    def get(self, key: str) -> Optional[Any]:
-        """
-        获取缓存项
-        
-        Args:
-            key: 缓存键
-            
-        Returns:
-            缓存值，如果不存在或已过期则返回None
-        """
-        if key not in self.cache:
-            return None
-        
-        item = self.cache[key]
-        
-        # 检查是否过期
-        if item.is_expired():
-            del self.cache[key]
-            return None
-        
-        # 更新访问时间
-        item.access()
-        
-        return item.value
-    
-    def set(self, key: str, value: Any, ttl: int = None) -> None:
-        """
-        设置缓存项
-        
-        Args:
-            key: 缓存键
-            value: 缓存值
-            ttl: 生存时间（秒），None表示使用默认值
-        """
-        # 检查缓存大小
-        if len(self.cache) >= self.max_size and key not in self.cache:
-            self._evict()
-        
-        # 计算过期时间
-        expire_time = None
-        if ttl is not None:
-            expire_time = time.time() + ttl
-        elif self.default_ttl is not None:
-            expire_time = time.time() + self.default_ttl
-        
-        # 创建缓存项
-        self.cache[key] = CacheItem(key, value, expire_time)
-    
-    def delete(self, key: str) -> bool:
-        """
-        删除缓存项
-        
-        Args:
-            key: 缓存键
-            
-        Returns:
-            是否删除成功
-        """
-        if key in self.cache:
-            del self.cache[key]
-            return True
-        return False
-    
-    def clear(self) -> None:
-        """清空缓存"""
-        self.cache.clear()
-    
-    def _evict(self) -> None:
-        """驱逐策略：删除最久未访问的项"""
-        if not self.cache:
-            return
-        
-        # 找出最久未访问的项
-        oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k].last_accessed)
-        del self.cache[oldest_key]
+# 旧的缓存类名，保留为 LRUCache 的别名
+Cache = LRUCache
 
 
 class NovelDataManager: # This class name might be too specific if it's just a generic data manager.
@@ -145,12 +25,13 @@ class NovelDataManager: # This class name might be too specific if it's just a g
                         # The API design refers to it as NovelDataManager.
     """小说数据管理器"""
     
-    def __init__(self, cache_enabled: bool = True):
+    def __init__(self, cache_enabled: bool = True, cache_max_bytes: int = 64 * 1024 * 1024):
         """
         初始化小说数据管理器
         
         Args:
             cache_enabled: 是否启用缓存
+            cache_max_bytes: 缓存的总字节数上限（章节正文按实际大小计入）
         """
         self.novel_data = {
             "title": "", # Added from API design expectation
@@ -168,13 +49,35 @@ class NovelDataManager: # This class name might be too specific if it's just a g
             "outline": None, # This might be redundant if all info is top-level
             "volumes": [], # Added from API design (structure for outline)
             "chapters": {}, # This might be for actual chapter content, distinct from outline structure
+            # 保存在独立文件中的章节正文：content_{卷}_{章} -> 文件路径（项目目录下的文件保存为相对路径）
+            "chapter_files": {},
             "metadata": {},
             "relationships": {} 
         }
         self.cache_enabled = cache_enabled
-        self.cache = Cache() if cache_enabled else None
+        self.cache = LRUCache(max_size=100, default_ttl=3600, max_bytes=cache_max_bytes) if cache_enabled else None
         self.modified = False
         self.current_file = None # Stores the path of the currently loaded .ainovel file
+        # 数据版本号，每次修改加一；get_outline 的快照按版本缓存
+        self.version = 0
+        self._snapshot: Optional[FrozenDict] = None
+        # 各顶层字段冻结后的结果，只有被修改的字段才需要重新冻结
+        self._frozen_fields: Dict[str, Any] = {}
+
+    def _invalidate(self, *keys: str) -> None:
+        """
+        数据被修改后使快照失效并增加版本号
+
+        Args:
+            keys: 被修改的顶层字段；不提供时所有字段都需要重新冻结
+        """
+        self.version += 1
+        self._snapshot = None
+        if keys:
+            for key in keys:
+                self._frozen_fields.pop(key, None)
+        else:
+            self._frozen_fields.clear()
     
     def set_outline(self, outline: Dict[str, Any]) -> None:
         """
@@ -198,26 +101,34 @@ class NovelDataManager: # This class name might be too specific if it's just a g
 
 
         self.mark_modified()
-
-        if self.cache_enabled and self.cache:
-            self.cache.delete("novel_data_full") # Cache the whole novel_data
+        self._invalidate(*[key for key in self.novel_data if key in outline], "outline")
     
-    def get_outline(self) -> Optional[Dict[str, Any]]:
+    def get_outline(self) -> FrozenDict:
         """
-        获取小说大纲 (the entire novel_data structure)
+        获取小说数据的只读快照 (the entire novel_data structure)
+
+        同一版本的数据只冻结一次，之后的调用直接返回同一个快照；修改后只重新冻结
+        变化过的顶层字段，其余字段与上一个快照共享。快照是 dict / list 的只读子类，
+        可以直接传给生成器或 json.dump；需要修改时使用 utils.snapshot.thaw 得到副本。
         
         Returns:
-            The full novel data structure
+            The full novel data structure (read-only)
         """
-        if not self.cache_enabled or not self.cache:
-            return self.novel_data.copy() # Return a copy
-        
-        cached_data = self.cache.get("novel_data_full")
-        if cached_data is None and self.novel_data is not None: # novel_data should always exist
-            cached_data = self.novel_data.copy()
-            self.cache.set("novel_data_full", cached_data)
-        
-        return cached_data
+        if self._snapshot is None:
+            for key, value in self.novel_data.items():
+                if key not in self._frozen_fields:
+                    self._frozen_fields[key] = freeze(value)
+            self._snapshot = FrozenDict((key, self._frozen_fields[key]) for key in self.novel_data)
+        return self._snapshot
+
+    def get_snapshot(self) -> Tuple[int, FrozenDict]:
+        """
+        获取快照及其版本号
+
+        Returns:
+            (version, snapshot)；版本号相同的两个快照内容相同
+        """
+        return self.version, self.get_outline()
 
     def set_chapter_content(self, volume_index: int, chapter_index: int, content: str) -> None:
         """
@@ -230,24 +141,104 @@ class NovelDataManager: # This class name might be too specific if it's just a g
         """
         key = f"content_{volume_index}_{chapter_index}"
         self.novel_data["chapters"][key] = content # Storing actual content separately
+        changed = ["chapters"]
+        if self.novel_data.setdefault("chapter_files", {}).pop(key, None) is not None:
+            changed.append("chapter_files")
         self.mark_modified()
+        self._invalidate(*changed)
 
         if self.cache_enabled and self.cache:
             self.cache.delete(f"chapter_content_{key}")
+
+    def set_chapter_file(self, volume_index: int, chapter_index: int, path: str) -> None:
+        """
+        设置保存在独立文件中的章节正文（正文不读入内存，get_chapter_content 时按需读取）
+
+        Args:
+            volume_index: 卷索引
+            chapter_index: 章节索引
+            path: 章节文件路径；位于项目文件所在目录下时保存为相对路径
+        """
+        key = f"content_{volume_index}_{chapter_index}"
+        path = os.path.abspath(path)
+        if self.current_file:
+            base_dir = os.path.dirname(self.current_file)
+            if os.path.commonpath([base_dir, path]) == base_dir:
+                path = os.path.relpath(path, base_dir)
+        self.novel_data.setdefault("chapter_files", {})[key] = path
+        changed = ["chapter_files"]
+        if self.novel_data["chapters"].pop(key, None) is not None:
+            changed.append("chapters")
+        self.mark_modified()
+        self._invalidate(*changed)
+
+        if self.cache_enabled and self.cache:
+            self.cache.delete(f"chapter_content_{key}")
+
+    def get_chapter_file(self, volume_index: int, chapter_index: int) -> Optional[str]:
+        """
+        获取章节文件的绝对路径
+
+        Returns:
+            文件路径；该章正文不在独立文件中时返回 None
+        """
+        path = self.novel_data.get("chapter_files", {}).get(f"content_{volume_index}_{chapter_index}")
+        if not path:
+            return None
+        if not os.path.isabs(path):
+            base_dir = os.path.dirname(self.current_file) if self.current_file else os.getcwd()
+            path = os.path.join(base_dir, path)
+        return path
+
+    @staticmethod
+    def _rebase_chapter_files(chapter_files: Dict[str, str], old_dir: str, new_dir: str) -> Dict[str, str]:
+        """
+        项目文件换目录保存时重新计算章节文件路径
+
+        Args:
+            chapter_files: 原 chapter_files（相对路径相对于 old_dir）
+            old_dir: 原项目文件所在目录
+            new_dir: 新项目文件所在目录
+
+        Returns:
+            新的 chapter_files：位于 new_dir 下的文件保存为相对路径，其余保存为绝对路径
+        """
+        rebased = {}
+        for key, path in chapter_files.items():
+            path = os.path.abspath(os.path.join(old_dir, path))
+            if os.path.commonpath([new_dir, path]) == new_dir:
+                path = os.path.relpath(path, new_dir)
+            rebased[key] = path
+        return rebased
+
+    def _read_chapter(self, volume_index: int, chapter_index: int) -> Optional[str]:
+        """从内存或章节文件读取正文"""
+        content = self.novel_data["chapters"].get(f"content_{volume_index}_{chapter_index}")
+        if content is not None:
+            return content
+        path = self.get_chapter_file(volume_index, chapter_index)
+        if path is None:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"读取章节文件 '{path}' 出错: {e}")
+            return None
     
     def get_chapter_content(self, volume_index: int, chapter_index: int) -> Optional[str]:
         """
-        获取独立存储的章节内容
+        获取独立存储的章节内容（保存在章节文件中的正文按需读取并进入缓存）
         """
         key = f"content_{volume_index}_{chapter_index}"
         
         if not self.cache_enabled or not self.cache:
-            return self.novel_data["chapters"].get(key)
+            return self._read_chapter(volume_index, chapter_index)
         
         cache_key = f"chapter_content_{key}"
         content = self.cache.get(cache_key)
         if content is None:
-            content = self.novel_data["chapters"].get(key)
+            content = self._read_chapter(volume_index, chapter_index)
             if content is not None and self.cache: # Check self.cache again
                 self.cache.set(cache_key, content)
         
@@ -256,6 +247,7 @@ class NovelDataManager: # This class name might be too specific if it's just a g
     def set_metadata(self, key: str, value: Any) -> None:
         self.novel_data["metadata"][key] = value
         self.mark_modified()
+        self._invalidate("metadata")
     
     def get_metadata(self, key: str, default: Any = None) -> Any:
         return self.novel_data["metadata"].get(key, default)
@@ -263,6 +255,7 @@ class NovelDataManager: # This class name might be too specific if it's just a g
     def set_relationships(self, relationships_data: Dict[Any, Any]) -> None:
         self.novel_data["relationships"] = relationships_data
         self.mark_modified()
+        self._invalidate("relationships")
 
     def get_relationships(self) -> Dict[Any, Any]:
         return self.novel_data.get("relationships", {}).copy()
@@ -283,12 +276,26 @@ class NovelDataManager: # This class name might be too specific if it's just a g
             # Ensure directory exists
             abs_filepath = os.path.abspath(filepath)
             os.makedirs(os.path.dirname(abs_filepath), exist_ok=True)
+
+            # 章节文件的相对路径相对于项目文件所在目录，换目录保存时需要重新计算
+            old_dir = os.path.dirname(self.current_file) if self.current_file else os.getcwd()
+            new_dir = os.path.dirname(abs_filepath)
+            chapter_files = novel_data_to_save.get("chapter_files")
+            if chapter_files and old_dir != new_dir:
+                chapter_files = self._rebase_chapter_files(chapter_files, old_dir, new_dir)
+                data_to_dump = dict(novel_data_to_save)
+                data_to_dump["chapter_files"] = chapter_files
+            else:
+                data_to_dump = novel_data_to_save
             
             with open(abs_filepath, "w", encoding="utf-8") as f:
-                json.dump(novel_data_to_save, f, ensure_ascii=False, indent=2)
+                json.dump(data_to_dump, f, ensure_ascii=False, indent=2)
             
             # If this instance's data matches what was saved, reset modified flag
             if novel_data_to_save is self.novel_data: # Check if it's the instance's own data
+                 if data_to_dump is not novel_data_to_save:
+                     self.novel_data["chapter_files"] = chapter_files
+                     self._invalidate("chapter_files")
                  self.modified = False
                  self.current_file = abs_filepath
             return True
@@ -339,10 +346,10 @@ class NovelDataManager: # This class name might be too specific if it's just a g
 
             self.modified = False
             self.current_file = abs_filepath
+            self._invalidate()
             
             if self.cache_enabled and self.cache:
                 self.cache.clear()
-                self.cache.set("novel_data_full", self.novel_data.copy()) # Cache the newly loaded data
             
             return self.novel_data.copy() # Return a copy of the loaded data
         except FileNotFoundError:
@@ -368,10 +375,11 @@ class NovelDataManager: # This class name might be too specific if it's just a g
             "volume_count": 0, "chapters_per_volume": 0, "words_per_chapter": 0,
             "new_character_count": 0, "selected_characters": [], "characters": [],
             "worldbuilding": "", "outline": None, "volumes": [],
-            "chapters": {}, "metadata": {}, "relationships": {}
+            "chapters": {}, "chapter_files": {}, "metadata": {}, "relationships": {}
         }
         self.modified = False
         self.current_file = None
+        self._invalidate()
         
         if self.cache_enabled and self.cache:
             self.cache.clear()
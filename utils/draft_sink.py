@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+章节草稿写入模块
+
+流式生成的文本块边生成边追加到每章一个的草稿文件（drafts/ 下），每积累 fsync_bytes
+字节或每隔 fsync_interval 秒 fsync 一次，而不是在内存中拼出整章；进程崩溃时已生成的
+部分保留在草稿中。整章生成完成后草稿 fsync 并原子重命名为正式的章节文件，
+因此章节文件要么不存在，要么是完整的一章。正文的 SHA-256 和字数在写入时增量计算。
+"""
+
+import os
+import re
+import time
+import asyncio
+import hashlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from utils.job_journal import fsync_directory
+
+ChapterKey = Tuple[int, int]
+
+_DRAFT_NAME = re.compile(r"^volume(\d+)_chapter(\d+)\.draft\.txt$")
+
+
+class DraftResult(NamedTuple):
+    """已提升为正式章节文件的草稿"""
+    path: str
+    sha256: str
+    chars: int
+
+
+class DraftWriter:
+    """一章的草稿文件"""
+
+    def __init__(self, sink: "ChapterDraftSink", key: ChapterKey, draft_path: str, final_path: str):
+        """
+        打开（并清空）草稿文件
+
+        Args:
+            sink: 所属的 ChapterDraftSink
+            key: (卷索引, 章节索引)
+            draft_path: 草稿文件路径
+            final_path: 完成后提升到的章节文件路径
+        """
+        self.sink = sink
+        self.key = key
+        self.draft_path = draft_path
+        self.final_path = final_path
+        # newline="" 保证写入的字节与文本完全一致，哈希与 content_hash(正文) 相同
+        self._file = open(draft_path, "w", encoding="utf-8", newline="")
+        self._hasher = hashlib.sha256()
+        self.chars = 0
+        self._unsynced_bytes = 0
+        self._synced_at = time.monotonic()
+        self.result: Optional[DraftResult] = None
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def _sync_now(self) -> None:
+        await asyncio.to_thread(self._sync)
+        self._unsynced_bytes = 0
+        self._synced_at = time.monotonic()
+        self.sink.stats["fsyncs"] += 1
+
+    async def write(self, chunk: str) -> None:
+        """
+        追加一个文本块；达到字节数或时间间隔时 fsync
+
+        Args:
+            chunk: 文本块
+        """
+        if not chunk:
+            return
+        data = chunk.encode("utf-8")
+        self._file.write(chunk)
+        self._hasher.update(data)
+        self.chars += len(chunk)
+        self._unsynced_bytes += len(data)
+        self.sink.stats["bytes_written"] += len(data)
+        if (self._unsynced_bytes >= self.sink.fsync_bytes or
+                time.monotonic() - self._synced_at >= self.sink.fsync_interval):
+            await self._sync_now()
+
+    async def commit(self) -> DraftResult:
+        """
+        草稿写完：fsync 后原子重命名为章节文件
+
+        Returns:
+            DraftResult(path, sha256, chars)
+        """
+        try:
+            await self._sync_now()
+            self._file.close()
+            await asyncio.to_thread(self._promote)
+        except BaseException:
+            self._file.close()
+            self.sink._closed(self, "aborted")
+            raise
+        self.result = DraftResult(self.final_path, self._hasher.hexdigest(), self.chars)
+        self.sink._closed(self, "committed")
+        return self.result
+
+    def _promote(self) -> None:
+        os.replace(self.draft_path, self.final_path)
+        fsync_directory(os.path.dirname(self.final_path))
+
+    async def abort(self) -> None:
+        """生成中断：fsync 并保留已写入的草稿，不生成章节文件"""
+        if self._file.closed:
+            return
+        try:
+            await self._sync_now()
+        finally:
+            self._file.close()
+            self.sink._closed(self, "aborted")
+
+
+class ChapterDraftSink:
+    """管理一个目录下各章的草稿和章节文件"""
+
+    def __init__(self, directory: str, fsync_bytes: int = 64 * 1024, fsync_interval: float = 1.0):
+        """
+        初始化草稿目录
+
+        Args:
+            directory: 章节文件目录，草稿放在其下的 drafts/ 中
+            fsync_bytes: 草稿每积累多少字节 fsync 一次
+            fsync_interval: 距上次 fsync 超过该秒数时在下一次写入后 fsync
+        """
+        self.directory = os.path.abspath(directory)
+        self.draft_dir = os.path.join(self.directory, "drafts")
+        self.fsync_bytes = fsync_bytes
+        self.fsync_interval = fsync_interval
+        os.makedirs(self.draft_dir, exist_ok=True)
+        self._open: Dict[ChapterKey, DraftWriter] = {}
+        self.stats = {"opened": 0, "committed": 0, "aborted": 0, "bytes_written": 0, "fsyncs": 0,
+                      "peak_open": 0}
+
+    def chapter_path(self, volume_index: int, chapter_index: int) -> str:
+        """章节文件路径（文件名中的卷号、章号从1开始）"""
+        return os.path.join(self.directory, f"volume{volume_index + 1:02d}_chapter{chapter_index + 1:03d}.txt")
+
+    def draft_path(self, volume_index: int, chapter_index: int) -> str:
+        """草稿文件路径"""
+        return os.path.join(self.draft_dir, f"volume{volume_index + 1:02d}_chapter{chapter_index + 1:03d}.draft.txt")
+
+    def open(self, volume_index: int, chapter_index: int) -> DraftWriter:
+        """
+        开始写一章的草稿（已有的同名草稿会被清空）
+
+        Args:
+            volume_index: 卷索引
+            chapter_index: 章节索引
+
+        Returns:
+            DraftWriter 实例
+
+        Raises:
+            RuntimeError: 该章的草稿正在被写入
+        """
+        key = (volume_index, chapter_index)
+        if key in self._open:
+            raise RuntimeError(f"章节 (卷 {volume_index}, 章 {chapter_index}) 的草稿正在写入")
+        writer = DraftWriter(self, key, self.draft_path(*key), self.chapter_path(*key))
+        self._open[key] = writer
+        self.stats["opened"] += 1
+        self.stats["peak_open"] = max(self.stats["peak_open"], len(self._open))
+        return writer
+
+    def _closed(self, writer: DraftWriter, outcome: str) -> None:
+        if self._open.get(writer.key) is writer:
+            del self._open[writer.key]
+        self.stats[outcome] += 1
+
+    def list_drafts(self) -> List[ChapterKey]:
+        """
+        列出留在目录中的未完成草稿（如崩溃或中断时正在生成的章节），不含正在写入的
+
+        Returns:
+            (卷索引, 章节索引) 列表
+        """
+        drafts = []
+        for name in sorted(os.listdir(self.draft_dir)):
+            match = _DRAFT_NAME.match(name)
+            if match:
+                key = (int(match.group(1)) - 1, int(match.group(2)) - 1)
+                if key not in self._open:
+                    drafts.append(key)
+        return drafts
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取草稿写入统计
+
+        Returns:
+            包含 opened、committed、aborted、bytes_written、fsyncs、peak_open 和 open（正在写入的草稿数）的字典
+        """
+        return {**self.stats, "open": len(self._open)}
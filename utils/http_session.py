@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HTTP会话管理模块
+
+为所有基于aiohttp的模型适配器提供共享的、长连接的会话和连接池。
+"""
+
+from typing import Optional
+
+import aiohttp
+
+
+class HTTPSessionManager:
+    """共享aiohttp会话管理器
+
+    持有一个带连接池的 ``aiohttp.ClientSession``，在首次使用时创建，
+    由所有模型实例共享，从而复用TCP/TLS连接和DNS缓存。
+    可作为异步上下文管理器使用，也可显式调用 ``aclose()`` 释放连接。
+    """
+
+    def __init__(self, config_manager=None, limit: int = 100, limit_per_host: int = 16,
+                 keepalive_timeout: float = 60.0, dns_cache_ttl: int = 300):
+        """
+        初始化会话管理器
+
+        Args:
+            config_manager: 配置管理器实例，若提供则优先读取 [HTTP] 配置节
+            limit: 连接池总连接数上限
+            limit_per_host: 每个主机的连接数上限
+            keepalive_timeout: 空闲连接保持时间（秒）
+            dns_cache_ttl: DNS缓存时间（秒）
+        """
+        if config_manager:
+            limit = config_manager.get_config_int('HTTP', 'limit', fallback=limit)
+            limit_per_host = config_manager.get_config_int('HTTP', 'limit_per_host', fallback=limit_per_host)
+            keepalive_timeout = config_manager.get_config_float('HTTP', 'keepalive_timeout', fallback=keepalive_timeout)
+            dns_cache_ttl = config_manager.get_config_int('HTTP', 'dns_cache_ttl', fallback=dns_cache_ttl)
+
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def closed(self) -> bool:
+        """会话是否已关闭（或尚未创建）"""
+        return self._session is None or self._session.closed
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        获取共享会话，必要时创建
+
+        Returns:
+            共享的 aiohttp.ClientSession
+        """
+        if self.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def aclose(self) -> None:
+        """关闭共享会话及其连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> 'HTTPSessionManager':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务日志模块
+
+长时间运行的批量生成任务把任务参数和每章的状态变化追加写入一个 JSON Lines 日志，
+每条记录写入后立即 fsync，进程在任何时刻崩溃都只可能丢失正在写的最后一行（读取时忽略）。
+记录类型：
+
+* ``job``：任务参数（待生成章节、连贯性策略、并发数、大纲内容的哈希等），第一行
+* ``resumed``：任务被恢复
+* ``chapter``：章节状态变化，``state`` 为 started / completed / failed / blocked；
+  started 记录提示词两部分的哈希，completed 记录正文的 SHA-256 和字数
+  （正文流式写入章节文件时还记录文件路径 file）
+* ``finished``：一次运行结束时的汇总
+
+章节正文、提示词和大纲按内容哈希保存在任务目录的 blobs 下（先写临时文件并 fsync，
+再原子重命名），相同内容只存一份（如所有章节共用的提示词前缀）。completed 记录只在正文
+落盘之后才写入，因此日志中标记为完成的章节一定能恢复出正文。
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+ChapterKey = Tuple[int, int]
+
+
+def content_hash(text: str) -> str:
+    """
+    计算文本的 SHA-256
+
+    Args:
+        text: 文本
+
+    Returns:
+        十六进制哈希
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def fsync_directory(path: str) -> None:
+    """把目录项的变化（新建、重命名）刷到磁盘；不支持的平台上忽略"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_text(path: str, text: str) -> None:
+    """
+    原子地写入文本文件：写临时文件并 fsync，再重命名覆盖目标
+
+    崩溃时目标文件要么是旧内容，要么是完整的新内容。
+
+    Args:
+        path: 目标文件路径
+        text: 文件内容
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_directory(directory)
+
+
+class JobJournal:
+    """一个批量生成任务的日志"""
+
+    def __init__(self, directory: str, job_id: str):
+        """
+        初始化任务日志（不读写文件，见 create / open）
+
+        Args:
+            directory: 存放任务日志的目录
+            job_id: 任务ID
+        """
+        self.directory = directory
+        self.job_id = job_id
+        self.path = os.path.join(directory, f"{job_id}.jsonl")
+        self.blob_dir = os.path.join(directory, job_id, "blobs")
+        self.spec: Dict[str, Any] = {}
+        # 章节 -> 最后一条状态记录
+        self.chapters: Dict[ChapterKey, Dict[str, Any]] = {}
+        self.runs = 0
+        self._lock = threading.Lock()
+        # 文件末尾是崩溃时写了一半的行：下一条记录需要另起一行
+        self._torn_tail = False
+
+    @classmethod
+    def create(cls, directory: str, spec: Dict[str, Any], job_id: Optional[str] = None,
+               novel_data: Optional[Dict] = None) -> "JobJournal":
+        """
+        新建任务日志并写入任务参数
+
+        Args:
+            directory: 存放任务日志的目录
+            spec: 任务参数（可 JSON 序列化）
+            job_id: 任务ID，None 时自动生成
+            novel_data: 本次任务使用的小说数据（大纲）；提供时保存一份，恢复时使用同一份大纲
+
+        Returns:
+            JobJournal 实例
+
+        Raises:
+            FileExistsError: 同名任务日志已存在
+        """
+        job_id = job_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        journal = cls(directory, job_id)
+        if os.path.exists(journal.path):
+            raise FileExistsError(f"任务日志已存在: {journal.path}")
+        os.makedirs(directory, exist_ok=True)
+        journal.spec = dict(spec)
+        if novel_data is not None:
+            journal.spec["outline_sha256"] = journal.store_blob(json.dumps(novel_data, ensure_ascii=False))
+        journal.append({"type": "job", "job_id": job_id, "spec": journal.spec})
+        fsync_directory(directory)
+        return journal
+
+    @classmethod
+    def open(cls, directory: str, job_id: str) -> "JobJournal":
+        """
+        读取已有的任务日志
+
+        Args:
+            directory: 存放任务日志的目录
+            job_id: 任务ID
+
+        Returns:
+            JobJournal 实例，spec 和 chapters 为日志中的最新状态
+
+        Raises:
+            FileNotFoundError: 任务日志不存在
+            ValueError: 日志中没有任务参数
+        """
+        journal = cls(directory, job_id)
+        with open(journal.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时最后一行可能只写了一半
+                    print(f"任务日志 {journal.path} 第 {line_number} 行不完整，已忽略")
+                    continue
+                journal._apply(record)
+        with open(journal.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                journal._torn_tail = f.read(1) != b"\n"
+        if not journal.spec:
+            raise ValueError(f"任务日志 {journal.path} 中没有任务参数")
+        return journal
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        record_type = record.get("type")
+        if record_type == "job":
+            self.spec = record.get("spec", {})
+        elif record_type == "resumed":
+            self.runs += 1
+        elif record_type == "chapter":
+            key = (record["volume_index"], record["chapter_index"])
+            self.chapters[key] = record
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """
+        追加一条记录，写入后立即 fsync
+
+        Args:
+            record: 记录字典，必须包含 type
+        """
+        record = {**record, "time": time.time()}
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                if self._torn_tail:
+                    line = "\n" + line
+                    self._torn_tail = False
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(record)
+
+    def store_blob(self, text: str) -> str:
+        """
+        按内容哈希保存文本（已存在则不重复写入）
+
+        Args:
+            text: 文本
+
+        Returns:
+            内容哈希
+        """
+        digest = content_hash(text)
+        path = os.path.join(self.blob_dir, digest)
+        if not os.path.exists(path):
+            atomic_write_text(path, text)
+        return digest
+
+    def read_blob(self, digest: str) -> Optional[str]:
+        """
+        读取按内容哈希保存的文本，并校验内容
+
+        Args:
+            digest: 内容哈希
+
+        Returns:
+            文本；不存在或内容与哈希不符时返回 None
+        """
+        path = os.path.join(self.blob_dir, digest)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+        if content_hash(text) != digest:
+            print(f"任务数据 {path} 内容与哈希不符，已忽略")
+            return None
+        return text
+
+    def _chapter_record(self, key: ChapterKey, state: str, **fields) -> None:
+        self.append({"type": "chapter", "volume_index": key[0], "chapter_index": key[1],
+                     "state": state, **fields})
+
+    def chapter_started(self, key: ChapterKey, prompt: Any = None) -> None:
+        """
+        记录章节开始生成
+
+        Args:
+            key: (卷索引, 章节索引)
+            prompt: 本章使用的提示词（StructuredPrompt 或字符串），保存后在记录中引用其哈希
+        """
+        fields = {}
+        if prompt is not None:
+            system = getattr(prompt, "system", None)
+            if system is not None:
+                fields["prompt_system"] = self.store_blob(system)
+                fields["prompt_user"] = self.store_blob(prompt.user)
+            else:
+                fields["prompt"] = self.store_blob(str(prompt))
+        self._chapter_record(key, "started", **fields)
+
+    def chapter_completed(self, key: ChapterKey, content: str) -> str:
+        """
+        保存章节正文并记录完成（正文落盘后才写入记录）
+
+        Args:
+            key: (卷索引, 章节索引)
+            content: 章节正文
+
+        Returns:
+            正文的内容哈希
+        """
+        digest = self.store_blob(content)
+        self._chapter_record(key, "completed", sha256=digest, chars=len(content))
+        return digest
+
+    def chapter_completed_file(self, key: ChapterKey, path: str, sha256: str, chars: int) -> None:
+        """
+        记录章节完成，正文已保存在章节文件中（不再复制到 blobs）
+
+        Args:
+            key: (卷索引, 章节索引)
+            path: 章节文件路径
+            sha256: 正文的内容哈希
+            chars: 正文字数
+        """
+        self._chapter_record(key, "completed", sha256=sha256, chars=chars, file=os.path.abspath(path))
+
+    def chapter_file(self, key: ChapterKey) -> Optional[str]:
+        """
+        已完成章节的章节文件路径
+
+        Args:
+            key: (卷索引, 章节索引)
+
+        Returns:
+            文件路径；章节未完成、正文保存在 blobs 中或文件与哈希不符时返回 None
+        """
+        record = self.chapters.get(key)
+        if not record or record.get("state") != "completed" or not record.get("file"):
+            return None
+        path = record["file"]
+        try:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+        if digest != record.get("sha256"):
+            print(f"章节文件 {path} 内容与哈希不符，已忽略")
+            return None
+        return path
+
+    def chapter_failed(self, key: ChapterKey, error: str, state: str = "failed") -> None:
+        """
+        记录章节生成失败
+
+        Args:
+            key: (卷索引, 章节索引)
+            error: 错误信息
+            state: failed（本章出错）或 blocked（前置章节失败，本章未生成）
+        """
+        self._chapter_record(key, state, error=error)
+
+    def load_outline(self) -> Optional[Dict]:
+        """
+        读取创建任务时保存的小说数据
+
+        Returns:
+            小说数据字典；没有保存或无法读取时返回 None
+        """
+        digest = self.spec.get("outline_sha256")
+        text = self.read_blob(digest) if digest else None
+        return json.loads(text) if text else None
+
+    def targets(self) -> List[ChapterKey]:
+        """任务参数中的待生成章节"""
+        return [tuple(key) for key in self.spec.get("targets", [])]
+
+    def state(self, key: ChapterKey) -> Optional[str]:
+        """章节的最新状态，没有记录时为 None"""
+        record = self.chapters.get(key)
+        return record.get("state") if record else None
+
+    def completed_content(self, key: ChapterKey) -> Optional[str]:
+        """
+        读取已完成章节保存的正文
+
+        Args:
+            key: (卷索引, 章节索引)
+
+        Returns:
+            正文；章节未完成或正文无法读取时返回 None
+        """
+        record = self.chapters.get(key)
+        if not record or record.get("state") != "completed":
+            return None
+        if record.get("file"):
+            path = self.chapter_file(key)
+            if path is None:
+                return None
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                return f.read()
+        return self.read_blob(record.get("sha256", ""))
+
+    def unfinished(self, keys: Optional[Iterable[ChapterKey]] = None) -> List[ChapterKey]:
+        """
+        列出尚未完成的章节（未开始、进行中时崩溃、失败或被阻塞）
+
+        Args:
+            keys: 要检查的章节，None 表示任务参数中的全部章节
+
+        Returns:
+            章节列表，顺序与输入相同
+        """
+        keys = self.targets() if keys is None else keys
+        return [key for key in keys if self.state(key) != "completed"]
+
+    def summary(self) -> Dict[str, int]:
+        """
+        各状态的章节数
+
+        Returns:
+            状态 -> 章节数；pending 为没有任何记录的章节
+        """
+        counts: Dict[str, int] = {}
+        for key in self.targets():
+            state = self.state(key) or "pending"
+            counts[state] = counts.get(state, 0) + 1
+        return counts
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+内存LRU缓存模块
+
+按访问顺序排列的有序字典实现 O(1) 的读取、写入和淘汰；带过期时间的条目另外放在
+按过期时间排序的堆中，只在写入时惰性清理，读取时只检查当前条目本身是否过期。
+容量可以按条目数、按字节数或同时限制，并统计命中、未命中和淘汰次数。
+"""
+
+import sys
+import time
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def estimate_size(value: Any) -> int:
+    """
+    估算缓存值占用的字节数（O(1)，不递归统计容器内的元素）
+
+    Args:
+        value: 缓存值
+
+    Returns:
+        字节数
+    """
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """带过期时间和字节容量的 LRU 缓存"""
+
+    # 堆中失效的记录（条目已被覆盖或删除）超过有效条目数的该倍数时重建堆
+    HEAP_COMPACT_RATIO = 2
+
+    def __init__(self, max_size: Optional[int] = 100, default_ttl: Optional[float] = 3600,
+                 max_bytes: Optional[int] = None, sizeof: Callable[[Any], int] = estimate_size,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        初始化缓存
+
+        Args:
+            max_size: 最大条目数，None 表示不限制
+            default_ttl: 默认生存时间（秒），None 表示永不过期
+            max_bytes: 所有条目的总字节数上限，None 表示不限制
+            sizeof: 计算条目字节数的函数
+            clock: 时间函数（单调时钟），便于测试替换
+        """
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.clock = clock
+        # key -> (value, size, expire_at, seq)；顺序即访问顺序，最久未访问的在最前
+        self._data: "OrderedDict[Any, Tuple[Any, int, Optional[float], int]]" = OrderedDict()
+        # (expire_at, seq, key)；seq 区分同一键的多次写入，用于识别失效记录
+        self._expiry_heap: List[Tuple[float, int, Any]] = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        """不更新访问顺序的存在性检查"""
+        entry = self._data.get(key)
+        return entry is not None and not self._is_expired(entry)
+
+    def _is_expired(self, entry, now: Optional[float] = None) -> bool:
+        expire_at = entry[2]
+        if expire_at is None:
+            return False
+        return (self.clock() if now is None else now) >= expire_at
+
+    def _remove(self, key) -> None:
+        size = self._data.pop(key)[1]
+        self.total_bytes -= size
+
+    def get(self, key, default: Any = None) -> Any:
+        """
+        获取缓存值，并把条目标记为最近使用
+
+        Args:
+            key: 缓存键
+            default: 不存在或已过期时的返回值
+
+        Returns:
+            缓存值
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return default
+            if self._is_expired(entry):
+                self._remove(key)
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def set(self, key, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        写入缓存值，必要时淘汰最久未使用的条目
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 生存时间（秒），None 表示使用 default_ttl
+
+        Returns:
+            是否写入；单个值超过 max_bytes 时不写入并返回 False
+        """
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return False
+
+            now = self.clock()
+            ttl = self.default_ttl if ttl is None else ttl
+            expire_at = None if ttl is None else now + ttl
+            self._seq += 1
+            self._data[key] = (value, size, expire_at, self._seq)
+            self.total_bytes += size
+            self.stats["stores"] += 1
+            if expire_at is not None:
+                heapq.heappush(self._expiry_heap, (expire_at, self._seq, key))
+
+            self._prune_expired(now)
+            self._evict(keep=key)
+            return True
+
+    def delete(self, key) -> bool:
+        """
+        删除缓存项
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            是否删除成功
+        """
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+                return True
+            return False
+
+    def clear(self) -> None:
+        """清空缓存（统计计数保留）"""
+        with self._lock:
+            self._data.clear()
+            self._expiry_heap.clear()
+            self.total_bytes = 0
+
+    def _prune_expired(self, now: float) -> None:
+        """从堆顶清理已过期的条目；堆中积累的失效记录过多时重建堆"""
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, seq, key = heapq.heappop(heap)
+            entry = self._data.get(key)
+            # 键可能已被删除，或已被重新写入
+            if entry is not None and entry[3] == seq:
+                self._remove(key)
+                self.stats["expirations"] += 1
+        if len(heap) > self.HEAP_COMPACT_RATIO * len(self._data) + 64:
+            self._expiry_heap = [item for item in heap
+                                 if item[2] in self._data and self._data[item[2]][3] == item[1]]
+            heapq.heapify(self._expiry_heap)
+
+    def _evict(self, keep=None) -> None:
+        """按最久未使用的顺序淘汰条目，直到满足条目数和字节数上限"""
+        while self._data and (
+                (self.max_size is not None and len(self._data) > self.max_size) or
+                (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            oldest_key = next(iter(self._data))
+            if oldest_key == keep and len(self._data) == 1:
+                break
+            self._remove(oldest_key)
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取缓存统计
+
+        Returns:
+            包含 hits、misses、stores、evictions、expirations、entries、total_bytes 的字典
+        """
+        return {**self.stats, "entries": len(self._data), "total_bytes": self.total_bytes}
@@ -10,7 +10,10 @@
 import os
 import json
 import time
-from typing import List, Dict, Any, Optional
+import string
+from typing import Iterable, List, Dict, Any, Mapping, Optional
+
+from utils.token_estimator import estimate_tokens
 
 
 class PromptTemplate:
@@ -69,6 +72,192 @@ class PromptTemplate:
         )
 
 
+def compact_template(text: str) -> str:
+    """
+    去掉模板中用于代码排版的缩进和多余空行
+
+    代码块（``` 围起的部分，如JSON示例）只去掉围栏本身的缩进，保留内部的相对缩进；
+    其余各行去掉行首空白，连续的空行合并为一行，首尾空行去掉。
+
+    Args:
+        text: 模板文本
+
+    Returns:
+        压缩后的模板文本
+    """
+    lines = []
+    fence_indent = None
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            if fence_indent is None:
+                fence_indent = len(line) - len(line.lstrip())
+            else:
+                fence_indent = None
+            lines.append(stripped)
+            continue
+        if fence_indent is not None:
+            indent = len(line) - len(line.lstrip())
+            lines.append(line[min(indent, fence_indent):].rstrip())
+            continue
+        if not stripped and lines and not lines[-1]:
+            continue
+        lines.append(stripped)
+    return "\n".join(lines).strip("\n")
+
+
+class CompiledTemplate:
+    """
+    预先解析好的提示词模板
+
+    模板语法与 str.format 相同。创建时解析一次占位符并可选地压缩空白，
+    渲染时只做拼接；传入 params 时检查模板中的占位符都在参数表中，
+    模板写错（引用了调用方不会提供的参数）在加载时就会报错。
+    """
+
+    _formatter = string.Formatter()
+
+    def __init__(self, content: str, name: str = "", params: Optional[Iterable[str]] = None,
+                 compact: bool = False):
+        """
+        编译模板
+
+        Args:
+            content: 模板内容（str.format 语法，字面量花括号写作 {{ }}）
+            name: 模板名称，用于错误信息和统计
+            params: 调用方会提供的参数名；为 None 时不检查
+            compact: 是否去掉缩进和多余空行
+
+        Raises:
+            ValueError: 模板语法错误，或引用了 params 之外的参数
+        """
+        self.name = name
+        self.source = content
+        self.compact = compact
+        self.content = compact_template(content) if compact else content
+
+        parts = []
+        placeholders = set()
+        literal_text = []
+        try:
+            for literal, field, spec, conversion in self._formatter.parse(self.content):
+                literal_text.append(literal)
+                if field is None:
+                    parts.append((literal, None, None))
+                    continue
+                if field == "" or field.isdigit():
+                    raise ValueError("不支持位置参数")
+                root = field.split(".", 1)[0].split("[", 1)[0]
+                placeholders.add(root)
+                # 普通占位符直接取值；带属性/下标/格式说明的交给 str.format 处理
+                if field == root and not spec and not conversion:
+                    parts.append((literal, root, None))
+                else:
+                    pattern = "{" + field + ("!" + conversion if conversion else "") + (":" + spec if spec else "") + "}"
+                    parts.append((literal, root, pattern))
+        except ValueError as e:
+            raise ValueError(f"模板 '{name}' 格式错误: {e}") from e
+
+        self._parts = tuple(parts)
+        self.placeholders = frozenset(placeholders)
+        if params is not None:
+            unknown = self.placeholders - set(params)
+            if unknown:
+                raise ValueError(f"模板 '{name}' 引用了未定义的参数: {', '.join(sorted(unknown))}")
+
+        # 模板自身文字的token数（不含参数值），用于统计压缩节省的token
+        self.tokens = estimate_tokens("".join(literal_text))
+        if compact:
+            self.original_tokens = estimate_tokens("".join(
+                literal for literal, *_ in self._formatter.parse(content)))
+        else:
+            self.original_tokens = self.tokens
+
+    @property
+    def saved_tokens(self) -> int:
+        """压缩空白每次渲染节省的token数"""
+        return self.original_tokens - self.tokens
+
+    def missing(self, params: Mapping[str, Any]) -> List[str]:
+        """返回渲染所需但 params 中没有的参数名"""
+        return sorted(name for name in self.placeholders if name not in params)
+
+    def render(self, params: Mapping[str, Any]) -> str:
+        """
+        渲染模板
+
+        Args:
+            params: 参数字典
+
+        Returns:
+            渲染后的文本
+
+        Raises:
+            KeyError: 缺少参数（列出全部缺少的参数名）
+        """
+        out = []
+        try:
+            for literal, name, pattern in self._parts:
+                out.append(literal)
+                if name is None:
+                    continue
+                value = params[name]
+                if pattern is not None:
+                    out.append(pattern.format_map({name: value}))
+                elif type(value) is str:
+                    out.append(value)
+                else:
+                    out.append(format(value))
+        except KeyError:
+            raise KeyError(f"模板 '{self.name}' 缺少参数: {', '.join(self.missing(params))}") from None
+        return "".join(out)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        模板统计
+
+        Returns:
+            包含 placeholders、original_tokens、tokens、saved_tokens 的字典
+        """
+        return {
+            "placeholders": sorted(self.placeholders),
+            "original_tokens": self.original_tokens,
+            "tokens": self.tokens,
+            "saved_tokens": self.saved_tokens,
+        }
+
+
+class StructuredPrompt:
+    """分成稳定前缀和逐次变化部分的提示词
+
+    ``system`` 是同一部小说的所有请求都相同的前缀（小说设定、人物、写作要求），
+    ``user`` 是每次请求不同的部分（当前卷/章信息）。支持提示词缓存的模型
+    （如 ClaudeModel）据此把前缀标记为可缓存；不支持的模型使用 ``str(prompt)``，
+    得到与前缀 + 正文拼接后的完整文本。
+    """
+
+    def __init__(self, system: str, user: str, cacheable: bool = True):
+        """
+        初始化结构化提示词
+
+        Args:
+            system: 稳定前缀
+            user: 本次请求特有的内容
+            cacheable: 是否允许把前缀标记为可缓存
+        """
+        self.system = system
+        self.user = user
+        self.cacheable = cacheable
+
+    def __str__(self) -> str:
+        if not self.system:
+            return self.user
+        return f"{self.system}\n\n{self.user}"
+
+    def __repr__(self) -> str:
+        return f"StructuredPrompt(system={len(self.system)} chars, user={len(self.user)} chars)"
+
+
 class PromptHistory: # This class might be out of scope for the library if it's for UI/app history
     """提示词历史记录类"""
     
@@ -128,17 +317,21 @@ class PromptHistory: # This class might be out of scope for the library if it's
 class PromptManager:
     """提示词管理器类"""
     
-    def __init__(self, prompts_path: str = "prompt_templates.json"): # Modified constructor
+    def __init__(self, prompts_path: str = "prompt_templates.json", compact: bool = False): # Modified constructor
         """
         初始化提示词管理器
         
         Args:
             prompts_path: 提示词模板文件路径 (e.g., prompt_templates.json)
+            compact: 编译模板时是否去掉缩进和多余空行
         """
         self.templates_file = prompts_path # Use the provided path
         # History file management is likely out of scope for the library's core PromptManager
         # self.history_file = history_file 
         self.templates: Dict[str, PromptTemplate] = {}
+        # 模板名称 -> 编译结果；加载、添加、更新模板时编译，格式错误的模板不在其中
+        self.compact = compact
+        self.compiled: Dict[str, CompiledTemplate] = {}
         # self.history: List[PromptHistory] = [] # History management removed for library
         # self.max_history = 100  # Max history items also removed
 
@@ -181,6 +374,19 @@ class PromptManager:
                 print(f"加载模板文件 '{self.templates_file}' 出错: {e}")
         # else:
             # print(f"模板文件 '{self.templates_file}' 未找到。") # Optional: log this
+        for template in self.templates.values():
+            self._compile(template)
+
+    def _compile(self, template: PromptTemplate) -> Optional[CompiledTemplate]:
+        """编译模板；格式错误时打印错误，format_prompt 对该模板返回 None"""
+        self.compiled.pop(template.name, None)
+        try:
+            compiled = CompiledTemplate(template.content, name=template.name, compact=self.compact)
+        except ValueError as e:
+            print(f"编译模板出错: {e}")
+            return None
+        self.compiled[template.name] = compiled
+        return compiled
 
     # _load_history, _save_history, add_history, get_history, clear_history removed.
     # These are application-level concerns, not core library prompt management.
@@ -230,6 +436,7 @@ class PromptManager:
         
         template = PromptTemplate(name, content, category, description)
         self.templates[name] = template
+        self._compile(template)
         if save_after_add: # Conditional save
             self._save_templates()
         return True
@@ -249,6 +456,7 @@ class PromptManager:
         updated = False
         if content is not None:
             template.content = content
+            self._compile(template)
             updated = True
         if category is not None:
             template.category = category
@@ -270,6 +478,7 @@ class PromptManager:
             return False
         
         del self.templates[name]
+        self.compiled.pop(name, None)
         if save_after_delete: # Conditional save
             self._save_templates()
         return True
@@ -295,20 +504,46 @@ class PromptManager:
             **kwargs: 用于格式化模板的键值对参数。
 
         Returns:
-            格式化后的提示词字符串，如果模板不存在则返回None。
+            格式化后的提示词字符串；模板不存在、格式错误或缺少参数时返回None
+            （不会把未填充的模板发给模型）。
         """
-        template = self.get_template(template_name)
-        if not template:
+        compiled = self.compiled.get(template_name)
+        if not compiled:
             return None
         
         try:
-            return template.content.format(**kwargs)
+            return compiled.render(kwargs)
         except KeyError as e:
-            print(f"格式化模板 '{template_name}' 出错：缺少参数 {e}")
-            return template.content # Return unformatted content on error
+            print(f"格式化模板出错：{e.args[0]}")
+            return None
         except Exception as e:
             print(f"格式化模板 '{template_name}' 时发生未知错误: {e}")
-            return template.content # Return unformatted content on error
+            return None
+
+    def validate_template(self, template_name: str, params: Iterable[str]) -> Optional[List[str]]:
+        """
+        检查模板引用的参数是否都在调用方的参数表中
+
+        Args:
+            template_name: 模板名称
+            params: 调用方会提供的参数名
+
+        Returns:
+            模板引用了但参数表中没有的参数名列表（为空表示通过）；模板不存在或格式错误时返回None
+        """
+        compiled = self.compiled.get(template_name)
+        if not compiled:
+            return None
+        return sorted(compiled.placeholders - set(params))
+
+    def get_template_report(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取各模板的占位符和token统计
+
+        Returns:
+            模板名称 -> CompiledTemplate.report() 的字典
+        """
+        return {name: compiled.report() for name, compiled in self.compiled.items()}
 
 # Example of how default templates could be provided by the library if needed:
 # class DefaultTemplates:
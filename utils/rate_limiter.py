@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+客户端限流模块
+
+基于令牌桶实现每分钟请求数（RPM）和每分钟token数（TPM）限制。
+指向同一服务商、同一密钥的所有模型实例共享同一个限流器，
+以稳定的速率发送请求，而不是突发后再被 429 退避。
+"""
+
+import time
+import asyncio
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+
+
+class TokenBucket:
+    """令牌桶
+
+    以 ``rate_per_minute`` 的速率匀速补充令牌，最多积累 ``burst_seconds`` 秒的额度，
+    从而把请求摊平到整分钟内，而不是在窗口开始时一次性突发。
+    等待者按先来后到的顺序获取令牌。
+    """
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 10.0):
+        """
+        初始化令牌桶
+
+        Args:
+            rate_per_minute: 每分钟补充的令牌数
+            burst_seconds: 桶容量对应的秒数，即最多允许多少秒额度的突发
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """
+        获取指定数量的令牌，不足时等待
+
+        Args:
+            amount: 需要的令牌数；超过桶容量时等到桶满后整体扣除（余额可为负），
+                    后续请求会相应等待更久
+        """
+        need = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < need:
+                await asyncio.sleep((need - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, delta: float) -> None:
+        """
+        根据实际消耗修正桶内令牌（如实际token数与估算值不同）
+
+        Args:
+            delta: 需要额外扣除的令牌数，负数表示退还
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class RateLimiter:
+    """同时限制RPM和TPM的限流器"""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 burst_seconds: float = 10.0):
+        """
+        初始化限流器
+
+        Args:
+            rpm: 每分钟请求数上限，None 或 0 表示不限制
+            tpm: 每分钟token数上限，None 或 0 表示不限制
+            burst_seconds: 允许突发的额度（以秒计）
+        """
+        self.request_bucket = TokenBucket(rpm, burst_seconds) if rpm else None
+        self.token_bucket = TokenBucket(tpm, burst_seconds) if tpm else None
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """
+        为一次请求获取额度
+
+        Args:
+            tokens: 本次请求预计消耗的token数
+        """
+        if self.request_bucket:
+            await self.request_bucket.acquire(1)
+        if self.token_bucket and tokens > 0:
+            await self.token_bucket.acquire(tokens)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        用服务端返回的实际token数修正TPM额度
+
+        Args:
+            estimated_tokens: 请求前预扣的token数
+            actual_tokens: 实际消耗的token数
+        """
+        if self.token_bucket:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+
+# (配置节, 密钥摘要) -> 共享的限流器
+_rate_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+
+
+def get_rate_limiter(config_manager, section: Optional[str], api_key: Optional[str] = None) -> Optional[RateLimiter]:
+    """
+    获取（或创建）指定服务商和密钥共享的限流器
+
+    从配置节读取 ``rpm``、``tpm`` 和 ``rate_limit_burst_seconds``，
+    rpm 和 tpm 都未配置时返回 None。
+
+    Args:
+        config_manager: 配置管理器实例，可为 None
+        section: 模型对应的配置节名称，如 'GPT'
+        api_key: API密钥，同一密钥的实例共享额度
+
+    Returns:
+        RateLimiter 实例，或 None（未启用限流）
+    """
+    if not config_manager or not section:
+        return None
+    rpm = config_manager.get_config_float(section, 'rpm', fallback=None)
+    tpm = config_manager.get_config_float(section, 'tpm', fallback=None)
+    if not rpm and not tpm:
+        return None
+    burst_seconds = config_manager.get_config_float(section, 'rate_limit_burst_seconds', fallback=10.0)
+
+    key_digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+    registry_key = (section, key_digest)
+    limiter = _rate_limiters.get(registry_key)
+    if limiter is None:
+        limiter = RateLimiter(rpm=rpm, tpm=tpm, burst_seconds=burst_seconds)
+        _rate_limiters[registry_key] = limiter
+    return limiter
+
+
+class ConcurrencyLimiter:
+    """限制同时进行的请求数
+
+    与令牌桶限制速率不同，它限制同一时刻未完成的请求数（流式请求在整个流结束前都占用名额），
+    适合本地推理服务（如 Ollama）或有并发上限的服务商。
+    """
+
+    def __init__(self, limit: int):
+        """
+        初始化并发限制
+
+        Args:
+            limit: 最大并发请求数（至少为1）
+        """
+        self.limit = max(1, int(limit))
+        self._semaphore = asyncio.Semaphore(self.limit)
+        self.in_flight = 0
+        self.peak = 0
+
+    async def acquire(self) -> None:
+        """等待一个并发名额"""
+        await self._semaphore.acquire()
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+
+    def release(self) -> None:
+        """归还名额"""
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+# 配置节 -> 共享的并发限制；值为 None 表示已确认不限制
+_concurrency_limiters: Dict[str, Optional[ConcurrencyLimiter]] = {}
+# scoped_concurrency_limits 设置的覆盖：配置节名称 -> 限制，只在所属上下文中可见
+_scoped_concurrency_limiters: ContextVar[Optional[Dict[str, Optional[ConcurrencyLimiter]]]] = \
+    ContextVar("scoped_concurrency_limiters", default=None)
+
+
+def get_concurrency_limiter(config_manager, section: Optional[str]) -> Optional[ConcurrencyLimiter]:
+    """
+    获取（或创建）指定服务商共享的并发限制
+
+    首次使用时从配置节读取 ``max_concurrency``，未配置或为0时返回 None；
+    当前上下文中 scoped_concurrency_limits 设置的值优先。
+
+    Args:
+        config_manager: 配置管理器实例，可为 None
+        section: 模型对应的配置节名称，如 'OLLAMA'
+
+    Returns:
+        ConcurrencyLimiter 实例，或 None（不限制）
+    """
+    if not section:
+        return None
+    scoped = _scoped_concurrency_limiters.get()
+    if scoped and section in scoped:
+        return scoped[section]
+    if section not in _concurrency_limiters:
+        limit = config_manager.get_config_int(section, 'max_concurrency', fallback=0) if config_manager else 0
+        _concurrency_limiters[section] = ConcurrencyLimiter(limit) if limit and limit > 0 else None
+    return _concurrency_limiters[section]
+
+
+@contextmanager
+def scoped_concurrency_limits(limits: Optional[Dict[str, Optional[int]]]) -> Iterator[None]:
+    """
+    在当前上下文（及其中创建的任务）内覆盖各服务商的并发上限
+
+    覆盖只对在 with 块内发出、且继承了该上下文的请求生效，不修改进程内共享的限制，
+    因此多个同时进行的批量任务各自使用自己的上限，互不影响，退出时也无需按顺序恢复。
+    嵌套使用时内层的设置优先。
+
+    Args:
+        limits: 配置节名称 -> 最大并发请求数（None 或 0 表示不限制），如 {'OLLAMA': 1}
+    """
+    if not limits:
+        yield
+        return
+    scoped = dict(_scoped_concurrency_limiters.get() or {})
+    for section, limit in limits.items():
+        scoped[section] = ConcurrencyLimiter(limit) if limit and limit > 0 else None
+    token = _scoped_concurrency_limiters.set(scoped)
+    try:
+        yield
+    finally:
+        _scoped_concurrency_limiters.reset(token)
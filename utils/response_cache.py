@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+模型响应缓存模块
+
+把模型的完整响应按内容寻址保存在本地 SQLite 文件中：键由服务商、模型名称、
+规范化后的提示词和生成参数的哈希组成。总大小超过上限时按最近访问时间淘汰。
+崩溃后重跑大纲/章节任务，或只调整了后处理逻辑时，已经生成过的请求无需再次付费。
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Optional
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    规范化提示词：统一换行符，去掉每行行尾空白和首尾空行
+
+    只做不改变语义的处理，因此缩进和行内空白保持不变。
+    """
+    lines = str(prompt).replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def make_cache_key(provider: str, model_name: Optional[str], prompt: str,
+                   params: Optional[Dict] = None) -> str:
+    """
+    计算缓存键
+
+    Args:
+        provider: 服务商标识（如模型的配置节名称）
+        model_name: 模型名称
+        prompt: 提示词
+        params: 影响输出的生成参数
+
+    Returns:
+        十六进制的 SHA-256 摘要
+    """
+    material = json.dumps({
+        "provider": provider,
+        "model_name": model_name,
+        "prompt": normalize_prompt(prompt),
+        "params": params or {},
+    }, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """基于 SQLite 的响应缓存，总字节数超过上限时按 LRU 淘汰"""
+
+    def __init__(self, path: str = "llm_cache.sqlite", max_bytes: int = 512 * 1024 * 1024):
+        """
+        初始化响应缓存
+
+        Args:
+            path: SQLite 文件路径，":memory:" 表示仅保存在内存中
+            max_bytes: 缓存内容的总字节数上限
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # 连接可能在线程池中使用（见 CachedModel），由锁保证同一时间只有一个线程访问
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " provider TEXT,"
+                " model_name TEXT,"
+                " response TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存的响应，并更新其访问时间
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            响应文本，未命中时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, response: str, provider: Optional[str] = None,
+            model_name: Optional[str] = None) -> None:
+        """
+        保存响应，必要时淘汰最久未访问的条目
+
+        Args:
+            key: 缓存键
+            response: 完整的响应文本
+            provider: 服务商标识（仅用于查看）
+            model_name: 模型名称（仅用于查看）
+        """
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._total_bytes -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model_name, response, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model_name, response, size, now, now))
+            self._total_bytes += size
+            self.stats["stores"] += 1
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """按最近访问时间从旧到新删除，直到总大小不超过上限（调用方持有锁）"""
+        cursor = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC")
+        to_delete = []
+        for key, size in cursor:
+            if self._total_bytes <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+        self.stats["evictions"] += len(to_delete)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+            self._total_bytes = 0
+
+    def get_stats(self) -> dict:
+        """
+        获取缓存统计
+
+        Returns:
+            包含 hits、misses、stores、evictions、entries、total_bytes、max_bytes 的字典
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {**self.stats, "entries": entries, "total_bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+重试模块
+
+为所有模型适配器提供统一的重试/退避策略：对 429、5xx 和连接中断进行
+带抖动的指数退避重试，并遵循服务端返回的 Retry-After。
+"""
+
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+import aiohttp
+
+
+# 视为可重试的HTTP状态码（5xx 另行统一处理）
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 头
+
+    Args:
+        value: 头部值，可以是秒数或HTTP日期
+
+    Returns:
+        需要等待的秒数，无法解析时返回 None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class APIError(Exception):
+    """模型服务返回的错误
+
+    Attributes:
+        status: HTTP状态码，连接类错误为 None
+        retry_after: 服务端要求的等待秒数（来自 Retry-After 头）
+        retryable: 是否允许重试
+    """
+
+    def __init__(self, message: str, status: Optional[int] = None,
+                 retry_after: Optional[float] = None, retryable: Optional[bool] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        if retryable is None:
+            retryable = status is not None and (status in RETRYABLE_STATUS or status >= 500)
+        self.retryable = retryable
+
+    @classmethod
+    async def from_response(cls, response, provider: str) -> 'APIError':
+        """
+        根据非200的 aiohttp 响应构造异常
+
+        Args:
+            response: aiohttp.ClientResponse
+            provider: 服务名称，用于错误信息
+
+        Returns:
+            APIError 实例
+        """
+        error_text = await response.text()
+        return cls(
+            f"{provider} API错误: {response.status} - {error_text}",
+            status=response.status,
+            retry_after=parse_retry_after(response.headers.get("Retry-After")),
+        )
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """判断异常是否值得重试（429、5xx、连接重置、超时）"""
+    if isinstance(exc, APIError):
+        return exc.retryable
+    return isinstance(exc, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                            ConnectionResetError, asyncio.TimeoutError))
+
+
+class RetryPolicy:
+    """带抖动的指数退避重试策略"""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0,
+                 max_delay: float = 30.0, retry_budget: float = 120.0):
+        """
+        初始化重试策略
+
+        Args:
+            max_retries: 单次调用的最大重试次数（不含首次请求）
+            base_delay: 首次退避的基准时间（秒）
+            max_delay: 单次退避的上限（秒）
+            retry_budget: 单次调用所有退避等待时间之和的上限（秒）
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget
+
+    @classmethod
+    def from_config(cls, config_manager, section: Optional[str]) -> 'RetryPolicy':
+        """
+        从配置节读取重试参数（max_retries, retry_base_delay, retry_max_delay, retry_budget）
+
+        Args:
+            config_manager: 配置管理器实例，可为 None
+            section: 模型对应的配置节名称，如 'GPT'
+
+        Returns:
+            RetryPolicy 实例
+        """
+        policy = cls()
+        if not config_manager or not section:
+            return policy
+        policy.max_retries = config_manager.get_config_int(section, 'max_retries', fallback=policy.max_retries)
+        policy.base_delay = config_manager.get_config_float(section, 'retry_base_delay', fallback=policy.base_delay)
+        policy.max_delay = config_manager.get_config_float(section, 'retry_max_delay', fallback=policy.max_delay)
+        policy.retry_budget = config_manager.get_config_float(section, 'retry_budget', fallback=policy.retry_budget)
+        return policy
+
+    def compute_delay(self, attempt: int, exc: BaseException) -> float:
+        """
+        计算第 attempt 次重试前的等待时间
+
+        服务端给出 Retry-After 时以其为准，否则使用等抖动（equal jitter）的指数退避。
+        """
+        retry_after = getattr(exc, "retry_after", None)
+        if retry_after is not None:
+            return retry_after
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def _next_delay(self, attempt: int, exc: BaseException, waited: float) -> Optional[float]:
+        """返回下一次重试前的等待时间；不应再重试时返回 None"""
+        if attempt >= self.max_retries or not is_retryable_error(exc):
+            return None
+        delay = self.compute_delay(attempt, exc)
+        if waited + delay > self.retry_budget:
+            return None
+        return delay
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        调用协程函数，失败时按策略重试
+
+        Args:
+            func: 每次尝试时调用的协程函数
+            *args, **kwargs: 传给 func 的参数
+
+        Returns:
+            func 的返回值
+        """
+        attempt = 0
+        waited = 0.0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(attempt, e, waited)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            waited += delay
+            attempt += 1
+
+    async def stream(self, func: Callable[..., AsyncIterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        """
+        迭代异步生成器，失败时按策略重试
+
+        只有在尚未产出任何数据时才会重试，避免调用方收到重复内容。
+
+        Args:
+            func: 每次尝试时调用、返回异步迭代器的函数
+            *args, **kwargs: 传给 func 的参数
+
+        Yields:
+            func 产出的数据
+        """
+        attempt = 0
+        waited = 0.0
+        while True:
+            yielded = False
+            try:
+                async for item in func(*args, **kwargs):
+                    yielded = True
+                    yield item
+                return
+            except Exception as e:
+                delay = None if yielded else self._next_delay(attempt, e, waited)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            waited += delay
+            attempt += 1
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+只读快照模块
+
+FrozenDict / FrozenList 分别是 dict / list 的只读子类：现有代码中的
+``isinstance(x, dict)``、``json.dump`` 等照常可用，任何修改操作都会抛出 TypeError。
+freeze 对已经冻结的子结构直接复用（结构共享），因此只有变化过的部分需要重新冻结；
+需要可修改的副本时使用 thaw 或 ``copy.deepcopy``。
+"""
+
+from typing import Any
+
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError(f"{type(self).__name__} 是只读快照，不能修改；需要修改时请先调用 thaw() 得到副本")
+
+
+class FrozenDict(dict):
+    """只读字典"""
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """只读列表"""
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+    __iadd__ = __imul__ = _readonly
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def freeze(value: Any) -> Any:
+    """
+    把由 dict / list 组成的数据转换为只读结构
+
+    已经冻结的子结构直接复用，不会再次复制；字符串、数字等不可变值原样保留。
+
+    Args:
+        value: 任意 JSON 风格的数据
+
+    Returns:
+        只读的数据
+    """
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """
+    把只读结构转换回可修改的 dict / list（深复制容器，不复制字符串等不可变值）
+
+    Args:
+        value: freeze 返回的数据
+
+    Returns:
+        可修改的数据
+    """
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [thaw(item) for item in value]
+    return value
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流式文本合并模块
+
+模型常常每次只输出一两个字，逐块转发会让每个下游消费者（界面刷新、写盘、
+websocket 推送）都承担一次调用开销。合并器把连续的小块攒起来，
+缓冲达到指定字数或距第一块到达已过指定毫秒数时（以先到者为准）一次性输出，
+流结束时输出剩余内容。
+"""
+
+import time
+import asyncio
+from typing import AsyncIterator
+
+
+class StreamCoalescer:
+    """按字数/时间合并流式文本块
+
+    同一个实例可以依次（或并发）处理多个流，统计数据累计。
+    """
+
+    def __init__(self, max_chars: int = 200, max_delay_ms: float = 100.0):
+        """
+        初始化合并器
+
+        Args:
+            max_chars: 缓冲达到该字数时立即输出
+            max_delay_ms: 缓冲中最早的内容等待超过该毫秒数时输出
+        """
+        self.max_chars = max_chars
+        self.max_delay = max_delay_ms / 1000.0
+        self.stats = {"input_chunks": 0, "output_chunks": 0}
+
+    def get_stats(self) -> dict:
+        """
+        获取合并统计
+
+        Returns:
+            包含 input_chunks、output_chunks 和 merged（被合并掉的块数）的字典
+        """
+        return {**self.stats, "merged": self.stats["input_chunks"] - self.stats["output_chunks"]}
+
+    async def coalesce(self, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        合并一个文本流
+
+        上游长时间没有新块时，已缓冲的内容同样会在 max_delay_ms 后输出，
+        不会一直等到下一块到达。
+
+        Args:
+            stream: 上游的文本块异步迭代器
+
+        Yields:
+            合并后的文本块
+        """
+        upstream = stream.__aiter__()
+        buffer = []
+        buffered_chars = 0
+        deadline = 0.0
+        pending = None
+        try:
+            while True:
+                if pending is None and not buffer:
+                    # 缓冲为空时没有截止时间，直接等待下一块，不需要额外的任务
+                    try:
+                        chunk = await upstream.__anext__()
+                    except StopAsyncIteration:
+                        break
+                else:
+                    if pending is None:
+                        pending = asyncio.ensure_future(upstream.__anext__())
+                    if buffer:
+                        timeout = deadline - time.monotonic()
+                        if timeout > 0:
+                            await asyncio.wait((pending,), timeout=timeout)
+                        if not pending.done():
+                            # 超时：先输出缓冲内容，再继续等待同一个读取
+                            self.stats["output_chunks"] += 1
+                            yield "".join(buffer)
+                            buffer = []
+                            buffered_chars = 0
+                            continue
+                    else:
+                        await asyncio.wait((pending,))
+                    task, pending = pending, None
+                    try:
+                        chunk = task.result()
+                    except StopAsyncIteration:
+                        break
+
+                self.stats["input_chunks"] += 1
+                if not chunk:
+                    continue
+                if not buffer:
+                    deadline = time.monotonic() + self.max_delay
+                buffer.append(chunk)
+                buffered_chars += len(chunk)
+                if buffered_chars >= self.max_chars or time.monotonic() >= deadline:
+                    self.stats["output_chunks"] += 1
+                    yield "".join(buffer)
+                    buffer = []
+                    buffered_chars = 0
+
+            if buffer:
+                self.stats["output_chunks"] += 1
+                yield "".join(buffer)
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+                try:
+                    await pending
+                except BaseException:
+                    pass
+            if hasattr(upstream, "aclose"):
+                await upstream.aclose()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流式响应分帧模块
+
+所有模型适配器共用的 SSE / NDJSON 解析层。直接处理网络读到的原始字节块：
+按字节查找换行切分，完整的行以 memoryview 切片的形式交给 JSON 解码器，
+不逐行 decode/strip 成新的字符串。换行符是单字节 ASCII，不会出现在多字节
+UTF-8 序列内部，因此按字节切分永远不会把一个字符拆到两行；需要文本的地方
+（SSE 的 event/id 字段、纯文本流）使用增量 UTF-8 解码器。
+
+JSON 解码器可以替换：安装了 orjson 时默认使用 orjson，也可以通过
+``set_json_loads`` 指定其他实现。
+"""
+
+import codecs
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Callable, List, NamedTuple, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖
+    orjson = None
+
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def _stdlib_loads(data: Buffer) -> Any:
+    # 标准库的 json.loads 不接受 memoryview
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+_json_loads: Callable[[Buffer], Any] = orjson.loads if orjson is not None else _stdlib_loads
+_JSON_ERRORS = (ValueError,)  # json.JSONDecodeError 和 orjson.JSONDecodeError 都是 ValueError 的子类
+
+
+def set_json_loads(loads: Optional[Callable[[Buffer], Any]]) -> None:
+    """
+    替换流式解析使用的JSON解码函数
+
+    Args:
+        loads: 接受 bytes/memoryview 并返回解析结果的函数，解析失败时应抛出 ValueError；
+               为 None 时恢复默认实现（有 orjson 时用 orjson，否则用标准库）
+    """
+    global _json_loads
+    if loads is None:
+        loads = orjson.loads if orjson is not None else _stdlib_loads
+    _json_loads = loads
+
+
+def json_loads(data: Buffer) -> Any:
+    """使用当前配置的JSON解码函数解析数据"""
+    return _json_loads(data)
+
+
+class LineSplitter:
+    """把任意切分的字节块重新组装成完整的行
+
+    行位于单个网络块内部时直接返回该块的 memoryview 切片（不复制）；
+    跨块的行先拼接到内部缓冲区，再以独立的 bytes 返回。
+    返回的行不含行尾的 ``\\n`` / ``\\r\\n``。
+    """
+
+    def __init__(self):
+        self._pending = bytearray()
+
+    def feed(self, data: bytes) -> List[memoryview]:
+        """
+        输入一个字节块
+
+        Args:
+            data: 网络读到的原始字节（不可变的 bytes，返回的切片直接引用它）
+
+        Returns:
+            本次凑齐的完整行列表
+        """
+        lines = []
+        view = memoryview(data)
+        start = 0
+        newline = data.find(b"\n")
+        if newline != -1 and self._pending:
+            # 补齐上一块遗留的半行；复制一次，避免返回的视图随缓冲区变化
+            self._pending += view[:newline]
+            lines.append(memoryview(self._strip_cr(bytes(self._pending))))
+            self._pending.clear()
+            start = newline + 1
+            newline = data.find(b"\n", start)
+        while newline != -1:
+            end = newline
+            if end > start and data[end - 1] == 0x0D:
+                end -= 1
+            lines.append(view[start:end])
+            start = newline + 1
+            newline = data.find(b"\n", start)
+        if start < len(data):
+            self._pending += view[start:]
+        return lines
+
+    def flush(self) -> List[memoryview]:
+        """流结束时返回最后一行（如果没有以换行结尾）"""
+        if not self._pending:
+            return []
+        line = memoryview(self._strip_cr(bytes(self._pending)))
+        self._pending.clear()
+        return [line]
+
+    @staticmethod
+    def _strip_cr(line: bytes) -> bytes:
+        return line[:-1] if line.endswith(b"\r") else line
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[memoryview]:
+    """
+    从字节块流中逐行读取
+
+    Args:
+        chunks: 原始字节块的异步迭代器（如 aiohttp 的 ``response.content.iter_any()``）
+
+    Yields:
+        不含换行符的行（memoryview）
+    """
+    splitter = LineSplitter()
+    async for chunk in chunks:
+        for line in splitter.feed(chunk):
+            yield line
+    for line in splitter.flush():
+        yield line
+
+
+async def iter_text(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """
+    把字节块流解码为文本块，跨块的多字节UTF-8字符会被正确拼接
+
+    Args:
+        chunks: 原始字节块的异步迭代器
+
+    Yields:
+        解码后的文本块（不产出空字符串）
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+class SSEEvent(NamedTuple):
+    """一个 Server-Sent Events 事件"""
+    event: str
+    data: memoryview
+    id: Optional[str]
+
+
+class SSEDecoder:
+    """增量 SSE 解析器
+
+    支持 ``event:``、``data:``、``id:`` 字段和注释行；同一事件的多行 ``data:``
+    以换行连接；空行结束一个事件。字段判断直接在原始字节上按偏移进行，
+    单行 data 以原始块的 memoryview 切片返回。
+    """
+
+    def __init__(self):
+        self._splitter = LineSplitter()
+        self._event = ""
+        self._id = None
+        self._data: List[memoryview] = []
+
+    def feed(self, data: bytes) -> List[SSEEvent]:
+        """
+        输入一个字节块
+
+        Args:
+            data: 网络读到的原始字节
+
+        Returns:
+            本次完整收到的事件列表
+        """
+        events = []
+        for line in self._splitter.feed(data):
+            self._process_line(line, events)
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """流结束时返回尚未以空行结束的最后一个事件"""
+        events = []
+        for line in self._splitter.flush():
+            self._process_line(line, events)
+        self._dispatch(events)
+        return events
+
+    def _dispatch(self, events: List[SSEEvent]) -> None:
+        if self._data:
+            data = self._data[0] if len(self._data) == 1 else memoryview(b"\n".join(self._data))
+            events.append(SSEEvent(self._event or "message", data, self._id))
+        self._event = ""
+        self._data = []
+
+    def _process_line(self, line: memoryview, events: List[SSEEvent]) -> None:
+        if not line:
+            self._dispatch(events)
+            return
+        # 字段名都很短，只取行首几个字节判断，避免复制整行
+        head = line[:6].tobytes()
+        if head.startswith(b"data:"):
+            value = line[5:]
+        elif head[:1] == b":":  # 注释（常用作心跳）
+            return
+        elif head == b"event:":
+            self._event = line[6:].tobytes().decode("utf-8", errors="replace").lstrip(" ")
+            return
+        elif head.startswith(b"id:"):
+            self._id = line[3:].tobytes().decode("utf-8", errors="replace").lstrip(" ")
+            return
+        else:
+            return
+        if value and value[0] == 0x20:
+            value = value[1:]
+        self._data.append(value)
+
+
+async def iter_sse(chunks: AsyncIterable[bytes]) -> AsyncIterator[SSEEvent]:
+    """
+    按 SSE 规范解析事件流，流结束时未以空行结束的事件同样会被产出
+
+    Args:
+        chunks: 原始字节块的异步迭代器
+
+    Yields:
+        SSEEvent，未指定 event 字段时 event 为 "message"
+    """
+    decoder = SSEDecoder()
+    async for chunk in chunks:
+        for sse_event in decoder.feed(chunk):
+            yield sse_event
+    for sse_event in decoder.flush():
+        yield sse_event
+
+
+async def iter_sse_json(chunks: AsyncIterable[bytes], done_marker: bytes = b"[DONE]") -> AsyncIterator[tuple]:
+    """
+    解析 data 字段为JSON的SSE流（OpenAI兼容接口、Anthropic等）
+
+    Args:
+        chunks: 原始字节块的异步迭代器
+        done_marker: 表示流结束的 data 内容，遇到后停止迭代
+
+    Yields:
+        (事件名, 解析后的JSON对象)；无法解析的事件被跳过
+    """
+    decoder = SSEDecoder()
+    loads = _json_loads
+    async for chunk in chunks:
+        for sse_event in decoder.feed(chunk):
+            data = sse_event.data
+            if data == done_marker:
+                return
+            try:
+                payload = loads(data)
+            except _JSON_ERRORS:
+                continue
+            yield sse_event.event, payload
+    for sse_event in decoder.flush():
+        if sse_event.data == done_marker:
+            return
+        try:
+            payload = loads(sse_event.data)
+        except _JSON_ERRORS:
+            continue
+        yield sse_event.event, payload
+
+
+async def iter_ndjson(chunks: AsyncIterable[bytes]) -> AsyncIterator[Any]:
+    """
+    解析换行分隔的JSON流（Ollama等）
+
+    Args:
+        chunks: 原始字节块的异步迭代器
+
+    Yields:
+        每行解析后的JSON对象；空行和无法解析的行被跳过
+    """
+    splitter = LineSplitter()
+    loads = _json_loads
+    async for chunk in chunks:
+        for line in splitter.feed(chunk):
+            if not line:
+                continue
+            try:
+                payload = loads(line)
+            except _JSON_ERRORS:
+                continue
+            yield payload
+    for line in splitter.flush():
+        try:
+            payload = loads(line)
+        except _JSON_ERRORS:
+            continue
+        yield payload
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Token数估算模块
+
+在不依赖具体分词器的情况下粗略估算文本的token数，用于限流、预算等场景。
+"""
+
+
+def estimate_tokens(text) -> int:
+    """
+    估算文本的token数
+
+    中日韩字符大致按每字1个token计，其余字符按每4个字符1个token计。
+
+    Args:
+        text: 文本（非字符串会先转换为字符串）
+
+    Returns:
+        估算的token数
+    """
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = str(text)
+    cjk = 0
+    for ch in text:
+        if ch >= '\u2e80':
+            cjk += 1
+    return cjk + (len(text) - cjk + 3) // 4